@@ -0,0 +1,41 @@
+import acutils as au
+import os
+import shutil
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_FILES = 100
+FILE_SIZE = 16 << 20 # bytes
+
+
+
+def make_files():
+    srcdir = os.path.join(DIR, 'src')
+    os.makedirs(DIR, exist_ok=True)
+    au.file.reset_directory(srcdir, subs=['a', 'b'])
+    for i in range(N_FILES):
+        label = 'a' if i % 2 else 'b'
+        with open(os.path.join(srcdir, label, f'{i}.bin'), 'wb') as f:
+            f.write(os.urandom(FILE_SIZE))
+    return srcdir
+
+
+
+def bench(srcdir, copy_mode):
+    handler = au.handler.DataHandler(srcdir, allowed_cpus=os.cpu_count())
+    handler.load_labeled_data_fromdatapath()
+    tdata, vdata = handler.split(0.7)
+    start = time.perf_counter()
+    handler.make_datasets(os.path.join(DIR, 'train'), os.path.join(DIR, 'val'),
+                          tdata, vdata, copy_mode=copy_mode)
+    return N_FILES * FILE_SIZE / (time.perf_counter() - start) / (1 << 20)
+
+
+
+if __name__ == '__main__':
+    srcdir = make_files()
+    for copy_mode in au.file.COPY_MODES:
+        print(f'{copy_mode:<20}{bench(srcdir, copy_mode):>10.1f} MB/s')
+    shutil.rmtree(DIR)
@@ -0,0 +1,36 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+
+N_RUNS = 5
+STATEMENTS = [
+    'import acutils',
+    'import acutils; acutils.handler',
+    'import acutils; acutils.image',
+    'import acutils; acutils.pathology',
+    'import acutils; acutils.pathology.IHC_D_REF', # reference computation
+]
+
+
+
+def bench(statement):
+    durations = []
+    for _ in range(N_RUNS): # fresh interpreters, like joblib workers
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True, 
+                       env=dict(os.environ, CUDA_VISIBLE_DEVICES=''),
+                       stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+
+if __name__ == '__main__':
+    baseline = bench('pass')
+    print(f"{'python startup':<50}{baseline:>8.3f}s")
+    for statement in STATEMENTS:
+        print(f'{statement:<50}{bench(statement) - baseline:>8.3f}s')
@@ -0,0 +1,67 @@
+import acutils as au
+import os
+import shutil
+import threading
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_FILES = 50
+LATENCY = 0.03 # seconds of the first read of each file (cold storage)
+COMPUTE = 0.03 # seconds of computation per file
+
+_cached = set()
+_lock = threading.Lock()
+
+
+
+def throttled_read(src):
+    # Simulate network storage: the first read of each file is slow
+    with _lock:
+        cold = src not in _cached
+        _cached.add(src)
+    if cold:
+        time.sleep(LATENCY)
+    with open(src, 'rb') as f:
+        return f.read()
+
+
+
+def tmnt_throttled(src, dstdir):
+    data = throttled_read(src)
+    time.sleep(COMPUTE)
+    with open(os.path.join(dstdir, os.path.basename(src)), 'wb') as f:
+        f.write(data)
+
+
+
+def make_files():
+    srcdir = os.path.join(DIR, 'src')
+    os.makedirs(DIR, exist_ok=True)
+    au.file.reset_directory(srcdir)
+    au.file.reset_directory(os.path.join(DIR, 'dst'))
+    for i in range(N_FILES):
+        with open(os.path.join(srcdir, f'{i}.bin'), 'wb') as f:
+            f.write(os.urandom(1 << 16))
+    return [os.path.join(srcdir, f'{i}.bin') for i in range(N_FILES)]
+
+
+
+def bench(srcs):
+    start = time.perf_counter()
+    for src in srcs:
+        tmnt_throttled(src, os.path.join(DIR, 'dst'))
+    return N_FILES / (time.perf_counter() - start)
+
+
+
+if __name__ == '__main__':
+    srcs = make_files()
+    print(f"{'no prefetch':<20}{bench(srcs):>8.1f} files/s")
+    for depth in [1, 2, 4]:
+        _cached.clear()
+        prefetched = au.multiprocess.prefetch_files(srcs, depth, 
+                                                    warm=throttled_read)
+        print(f"{f'prefetch depth={depth}':<20}{bench(prefetched):>8.1f} files/s")
+    shutil.rmtree(DIR)
@@ -0,0 +1,44 @@
+import acutils as au
+import os
+import shutil
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_SUBDIRS = 100
+N_FILES = 1000 # per subdirectory
+
+
+
+def make_tiles():
+    dstdir = os.path.join(DIR, 'dst')
+    os.makedirs(DIR, exist_ok=True)
+    au.file.reset_directory(dstdir)
+    for i in range(N_SUBDIRS):
+        subdir = os.path.join(dstdir, str(i))
+        os.mkdir(subdir)
+        for j in range(N_FILES):
+            with open(os.path.join(subdir, f'{j}.png'), 'wb') as f:
+                f.write(b'\0' * 64)
+    return dstdir
+
+
+
+def bench(background):
+    dstdir = make_tiles()
+    start = time.perf_counter()
+    au.file.reset_directory(dstdir, background=background)
+    ready = time.perf_counter() - start
+    au.file.wait_directory_deletions()
+    return ready, time.perf_counter() - start
+
+
+
+if __name__ == '__main__':
+    print(f'{N_SUBDIRS * N_FILES} files')
+    for background in [False, True]:
+        ready, deleted = bench(background)
+        print(f'background={str(background):<10}ready after {ready:>8.3f}s, '
+              f'deleted after {deleted:>8.3f}s')
+    shutil.rmtree(DIR)
@@ -0,0 +1,48 @@
+import acutils as au
+import numpy as np
+import pandas as pd
+import time
+
+
+
+N_ROWS = [1_000_000, 10_000_000]
+CLUELESS_WORDS = ['?', 'unknown', 'N/A', '']
+
+
+
+def make_sheet(n_rows):
+    rng = np.random.default_rng(871)
+    words = np.array(['a', 'b', 'c', 'd', 'e', 'f', 'g'] + CLUELESS_WORDS, 
+                     dtype=object)
+    df = pd.DataFrame({
+        'id': np.arange(n_rows).astype(str).astype(object),
+        'label': words[rng.integers(0, words.size, n_rows)],
+        'group': words[rng.integers(0, words.size, n_rows)]})
+    df.loc[df.sample(frac=0.01, random_state=871).index, 'group'] = None
+    return df
+
+
+
+def delete_clueless_rows_cellwise(df, clueless_words, columns):
+    # Previous implementation, a Python call per cell, reduced per row
+    mask = df[columns].map(
+        lambda x: x not in clueless_words and x is not None).all(axis=1)
+    return df[mask]
+
+
+
+def bench(func, df):
+    start = time.perf_counter()
+    result = func(df, CLUELESS_WORDS, ['label', 'group'])
+    return time.perf_counter() - start, len(result)
+
+
+
+if __name__ == '__main__':
+    for n_rows in N_ROWS:
+        df = make_sheet(n_rows)
+        for name, func in [('cellwise', delete_clueless_rows_cellwise),
+                           ('vectorized', au.sheet.delete_clueless_rows)]:
+            duration, kept = bench(func, df)
+            print(f'{n_rows:>12} rows {name:<12}{duration:>8.2f}s '
+                  f'({kept} rows kept)')
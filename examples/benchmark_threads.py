@@ -0,0 +1,54 @@
+import acutils as au
+import cv2
+import numpy as np
+import os
+import shutil
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_IMAGES = 200
+ALLOWED_CPUS = os.cpu_count()
+
+
+
+def tmnt_blur_resize(src, dstdir):
+    img = cv2.imread(src)
+    img = cv2.GaussianBlur(img, (31, 31), 0)
+    cv2.imwrite(os.path.join(dstdir, os.path.basename(src)),
+                cv2.resize(img, (1024, 1024)))
+
+
+
+def make_images():
+    srcdir = os.path.join(DIR, 'src')
+    os.makedirs(DIR, exist_ok=True)
+    au.file.reset_directory(srcdir)
+    rng = np.random.default_rng(871)
+    for i in range(N_IMAGES):
+        cv2.imwrite(os.path.join(srcdir, f'{i}.png'),
+                    rng.integers(0, 256, (2048, 2048, 3), dtype=np.uint8))
+    return srcdir
+
+
+
+def bench(srcdir, **kwargs):
+    handler = au.handler.DataHandler(srcdir, allowed_cpus=ALLOWED_CPUS,
+                                     **kwargs)
+    handler.load_data_fromdatapath()
+    start = time.perf_counter()
+    handler.process(os.path.join(DIR, 'dst'), func=tmnt_blur_resize)
+    return N_IMAGES / (time.perf_counter() - start)
+
+
+
+if __name__ == '__main__':
+    srcdir = make_images()
+    for name, kwargs in [
+            ('default', {}),
+            ('threads_per_worker=1', {'threads_per_worker': 1}),
+            ('threads_per_worker=1, pin_cpus', {'threads_per_worker': 1,
+                                                'pin_cpus': True})]:
+        print(f'{name:<35}{bench(srcdir, **kwargs):>8.1f} images/s')
+    shutil.rmtree(DIR)
@@ -0,0 +1,93 @@
+import acutils as au
+import cv2
+import numpy as np
+import os
+import shutil
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_FRAMES = 1000
+SHAPE = (720, 1280)
+NEW_SIZE = 224
+# (bound, extra_down, extra_up): every frame but the skipped range is kept
+SETTING = (N_FRAMES // 2, 10, 10)
+
+
+
+def make_video():
+    os.makedirs(DIR, exist_ok=True)
+    src = os.path.join(DIR, 'video.mp4')
+    out = cv2.VideoWriter(src, cv2.VideoWriter_fourcc(*'mp4v'), 25,
+                          SHAPE[::-1])
+    rng = np.random.default_rng(871)
+    noise = cv2.GaussianBlur(
+        rng.integers(0, 256, (*SHAPE, 3), dtype=np.uint8), (9, 9), 0)
+    for i in range(N_FRAMES):
+        out.write(np.roll(noise, 4*i, axis=1))
+    out.release()
+    return src
+
+
+
+def reset_dstdir(name):
+    dstdir = os.path.join(DIR, name)
+    au.file.reset_directory(dstdir, subs=['before', 'after'])
+    return dstdir
+
+
+
+def get_size(dirpath):
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, _, filenames in os.walk(dirpath)
+               for filename in filenames)
+
+
+
+def extract_then_resize(src):
+    # previous workflow: full size PNG frames, then a resizing pass
+    framedir = reset_dstdir('frames')
+    au.video.tmnt_extract_frames_for_binary_classification(src, framedir,
+                                                           *SETTING)
+    dstdir = reset_dstdir('two_passes')
+    for sub in ['before', 'after']:
+        for filename in os.listdir(os.path.join(framedir, sub)):
+            au.image.tmnt_resize_file(os.path.join(framedir, sub, filename),
+                                      os.path.join(dstdir, sub),
+                                      NEW_SIZE, NEW_SIZE)
+    return dstdir
+
+
+
+def extract_resized(src, **kwargs):
+    dstdir = reset_dstdir('one_pass_' + '_'.join(map(str, kwargs.values())))
+    au.video.tmnt_extract_frames_for_binary_classification(src, dstdir,
+        *SETTING, new_width=NEW_SIZE, new_height=NEW_SIZE, **kwargs)
+    return dstdir
+
+
+
+def bench(func, *args, **kwargs):
+    start = time.perf_counter()
+    dstdir = func(*args, **kwargs)
+    return time.perf_counter() - start, get_size(dstdir)
+
+
+
+if __name__ == '__main__':
+    src = make_video()
+    print(f'{N_FRAMES} frames of {SHAPE[1]}x{SHAPE[0]} to {NEW_SIZE}x'
+          f'{NEW_SIZE}')
+    for name, func, kwargs in [
+            ('extract png, then resize', extract_then_resize, {}),
+            ('resized png', extract_resized, {}),
+            ('resized png, compression 1', extract_resized,
+             {'png_compression': 1}),
+            ('resized jpg, quality 90', extract_resized,
+             {'fext': 'jpg', 'quality': 90}),
+            ('resized webp, quality 90', extract_resized,
+             {'fext': 'webp', 'quality': 90})]:
+        duration, size = bench(func, src, **kwargs)
+        print(f'{name:<30}{duration:>8.2f}s{size/2**20:>10.1f} MB')
+    shutil.rmtree(DIR)
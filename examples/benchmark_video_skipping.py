@@ -0,0 +1,66 @@
+import acutils as au
+import cv2
+import numpy as np
+import os
+import shutil
+import time
+
+
+
+DIR = os.path.join(os.path.dirname(__file__), 'benchmark_data')
+N_FRAMES = 20000
+SHAPE = (480, 640)
+# (bound, extra_down, extra_up, start, end): most frames are skipped
+SETTINGS = [(10000, 9500, 9500, 0, None),
+            (15000, 100, 100, 14000, 16000),
+            (2000, 50, 50, 0, 3000)]
+
+
+
+def make_video():
+    os.makedirs(DIR, exist_ok=True)
+    src = os.path.join(DIR, 'long.mp4')
+    out = cv2.VideoWriter(src, cv2.VideoWriter_fourcc(*'mp4v'), 25,
+                          SHAPE[::-1])
+    rng = np.random.default_rng(871)
+    noise = rng.integers(0, 256, (*SHAPE, 3), dtype=np.uint8)
+    for i in range(N_FRAMES):
+        out.write(np.roll(noise, 4*i, axis=1))
+    out.release()
+    return src
+
+
+
+def browse_by_reading(src, bound, extra_down, extra_up, start, end):
+    # previous behaviour: every frame is read, kept ones are yielded
+    srst, srse = bound-extra_down, bound+extra_up
+    end = N_FRAMES if end is None else end
+    cap = cv2.VideoCapture(src)
+    count = 0
+    success, frame = cap.read()
+    while success:
+        if start < count <= srst or srse <= count < end:
+            yield count > srst, count, frame
+        count += 1
+        success, frame = cap.read()
+    cap.release()
+
+
+
+def bench(browse, src, setting):
+    start = time.perf_counter()
+    kept = sum(1 for _ in browse(src, *setting))
+    return kept, time.perf_counter() - start
+
+
+
+if __name__ == '__main__':
+    src = make_video()
+    print(f'{N_FRAMES} frames of {SHAPE[1]}x{SHAPE[0]}')
+    for setting in SETTINGS:
+        kept, reading = bench(browse_by_reading, src, setting)
+        _, skipping = bench(au.video.browse_frames_for_binary_classification,
+                            src, setting)
+        print(f'{str(setting):<35}{kept:>7} kept{reading:>9.2f}s read'
+              f'{skipping:>9.2f}s grab/seek ({reading/skipping:.1f}x)')
+    shutil.rmtree(DIR)
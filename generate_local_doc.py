@@ -9,6 +9,6 @@ if __name__ == '__main__':
     pydir = os.path.join(os.path.dirname(__file__), 'src', 'acutils')
     mddir = os.path.join(os.path.dirname(__file__), 'doc')
 
-    for name in ['handler', 'file', 'image', 'multiprocess',
-                 'sheet', 'pathology', 'gpu', 'video']:
+    for name in ['handler', 'file', 'archive', 'image', 'multiprocess',
+                 'profiling', 'sheet', 'pathology', 'gpu', 'taskqueue', 'video']:
         tmnt_generate_documentation(os.path.join(pydir, f'{name}.py'), mddir)
\ No newline at end of file
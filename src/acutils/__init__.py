@@ -1,8 +1,20 @@
-from . import file
-from . import gpu
-from . import handler
-from . import image
-from . import multiprocess
-from . import pathology
-from . import sheet
-from . import video
\ No newline at end of file
+import importlib
+
+
+
+# Submodules are imported on first access (for example "acutils.pathology"),
+# so "import acutils" stays fast and does not require optional dependencies.
+_SUBMODULES = ['archive', 'file', 'gpu', 'handler', 'image', 'multiprocess',
+               'pathology', 'profiling', 'sheet', 'taskqueue', 'video']
+
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+
+def __dir__():
+    return sorted(list(globals()) + _SUBMODULES)
\ No newline at end of file
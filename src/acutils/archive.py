@@ -0,0 +1,279 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+
+
+# Members of an archive are addressed as if the archive was a directory:
+#   "/data/slides.zip/label/slide.svs" is the member "label/slide.svs"
+# Each process opens its own handle of an archive on first use (and indexes
+# its members once), so parallel workers never share a file position.
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                      '.tar.xz', '.txz')
+_ARCHIVES = {} # archivepath: (pid, handle, members) opened by this process
+
+
+
+def is_archive(path):
+    '''
+    Check if a path leads to an archive supported by this module (from its
+    extension).
+
+    PARAMETERS
+    ----------
+	(str) path:
+		absolute path to check.
+
+    RETURNS
+    -------
+	(bool) archive:
+		True if path is an existing zip or tar file.
+    '''
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+
+def _normalize_member(name):
+    '''
+    Normalize the name of a member, as tars created from "." name them
+    "./label/file.png" (and some archivers keep absolute names).
+
+    PARAMETERS
+    ----------
+	(str) name:
+		name of the member inside the archive.
+
+    RETURNS
+    -------
+	(str) name:
+		name without leading "./" nor "/", like "label/file.png".
+    '''
+    while name.startswith(('./', '/')):
+        name = name[2:] if name.startswith('./') else name[1:]
+    return name
+
+
+
+def split_member_path(src):
+    '''
+    Split a source path into its archive path and its member name.
+    Existing paths on disk are never considered as members.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to a file, or to a member inside an archive.
+
+    RETURNS
+    -------
+	(str or None) archivepath:
+		absolute path to the archive, None if src is not inside one.
+
+	(str) member:
+		name of the member inside the archive, or src if not inside one.
+    '''
+    if os.path.exists(src):
+        return None, src
+    lowered = src.lower()
+    for ext in ARCHIVE_EXTENSIONS:
+        start = 0
+        while True:
+            i = lowered.find(ext + os.sep, start)
+            if i < 0:
+                break
+            end = i + len(ext)
+            if os.path.isfile(src[:end]):
+                return src[:end], _normalize_member(
+                    src[end+1:].replace(os.sep, '/'))
+            start = end
+    return None, src
+
+
+
+def _get_archive(archivepath):
+    '''
+    Get the handle of an archive opened by this process (opening and
+    indexing it on first use).
+
+    PARAMETERS
+    ----------
+	(str) archivepath:
+		absolute path to the archive.
+
+    RETURNS
+    -------
+	(zipfile.ZipFile or tarfile.TarFile) handle:
+		opened archive.
+
+	(dict<str;ZipInfo or TarInfo>) members:
+		file members of the archive by normalized name (directories 
+            excluded, see "_normalize_member").
+    '''
+    opened = _ARCHIVES.get(archivepath)
+    if opened is not None and opened[0] == os.getpid():
+        return opened[1], opened[2]
+
+    if zipfile.is_zipfile(archivepath):
+        handle = zipfile.ZipFile(archivepath)
+        members = {_normalize_member(info.filename): info 
+                   for info in handle.infolist() if not info.is_dir()}
+    else: # compressed tars are decompressed once here to index them
+        handle = tarfile.open(archivepath, 'r:*')
+        members = {_normalize_member(info.name): info 
+                   for info in handle.getmembers() if info.isfile()}
+    _ARCHIVES[archivepath] = (os.getpid(), handle, members)
+    return handle, members
+
+
+
+def close_archives():
+    '''
+    Close every archive opened by this process.
+
+    PARAMETERS
+    ----------
+	None
+
+    RETURNS
+    -------
+	None
+    '''
+    for pid, handle, _ in _ARCHIVES.values():
+        if pid == os.getpid():
+            handle.close()
+    _ARCHIVES.clear()
+
+
+
+def list_members(archivepath):
+    '''
+    List the files inside an archive, without extracting anything.
+
+    PARAMETERS
+    ----------
+	(str) archivepath:
+		absolute path to the archive.
+
+    RETURNS
+    -------
+	(list<str>) members:
+		names of the file members (relative paths with "/" separators).
+    '''
+    return list(_get_archive(archivepath)[1].keys())
+
+
+
+def open_source(src):
+    '''
+    Open a source file for binary reading, either on disk or inside an
+    archive (see "split_member_path").
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to a file, or to a member inside an archive.
+
+    RETURNS
+    -------
+	(binary file-like object) f:
+		opened file, to use in a "with" statement.
+
+    RAISES
+    ------
+    (FileNotFoundError) err:
+        If the member is not inside the archive.
+    '''
+    archivepath, member = split_member_path(src)
+    if archivepath is None:
+        return open(src, 'rb')
+    handle, members = _get_archive(archivepath)
+    if member not in members:
+        raise FileNotFoundError(f'{member} not found in {archivepath}')
+    if isinstance(handle, zipfile.ZipFile):
+        return handle.open(members[member])
+    return handle.extractfile(members[member])
+
+
+
+def get_source_size(src):
+    '''
+    Get the size of a source file, either on disk or inside an archive
+    (uncompressed size).
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to a file, or to a member inside an archive.
+
+    RETURNS
+    -------
+	(int) size:
+		size in bytes.
+    '''
+    archivepath, member = split_member_path(src)
+    if archivepath is None:
+        return os.path.getsize(src)
+    info = _get_archive(archivepath)[1][member]
+    return info.file_size if isinstance(info, zipfile.ZipInfo) else info.size
+
+
+
+def is_source_file(src):
+    '''
+    Check if a source file exists, either on disk or inside an archive.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to a file, or to a member inside an archive.
+
+    RETURNS
+    -------
+	(bool) exists:
+		True if the file exists.
+    '''
+    archivepath, member = split_member_path(src)
+    if archivepath is None:
+        return os.path.isfile(src)
+    return member in _get_archive(archivepath)[1]
+
+
+
+@contextmanager
+def source_path(src, tmpdir=None):
+    '''
+    Get a path to a source file, for libraries that only read paths
+    (OpenCV, Openslide...). A member of an archive is extracted into a
+    temporary file (with the same extension), deleted when leaving the
+    "with" statement, other paths are given as is.
+    Example: "with archive.source_path(src) as path: img = cv2.imread(path)".
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to a file, or to a member inside an archive.
+
+	(str) tmpdir=None:
+		directory of temporary files, if None the default one (prefer a
+            local fast disk).
+
+    RETURNS
+    -------
+	(str) path:
+		absolute path to a readable file.
+    '''
+    archivepath, member = split_member_path(src)
+    if archivepath is None:
+        yield src
+        return
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(member)[1],
+                                dir=tmpdir)
+    try:
+        with os.fdopen(fd, 'wb') as fdst, open_source(src) as fsrc:
+            shutil.copyfileobj(fsrc, fdst, 1<<20)
+        yield path
+    finally:
+        os.remove(path)
@@ -2,17 +2,77 @@
 #  - src: absolute path to the file that will be processed (str)
 #  - dstdir: absolute path to the directory that should contain new files (str)
 # Also, nothing should be returned.
+# Functions prefixed with "map" return a partial result from "src", to be 
+# merged with "multiprocess.run_reduce_on_multiple_files".
 
+import hashlib
 import json
 import os
+import queue
+import random
 import re
 import shutil
+import threading
+import uuid
 
+from . import archive
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # not on Windows, so no reflink
 
-def copyfile(src, dst):
+
+
+COPY_MODES = ['copy', 'copy_file_range', 'reflink', 'hardlink', 'symlink', 
+              'auto']
+FICLONE = 0x40049409 # Linux ioctl cloning a file (btrfs, XFS...)
+SHARD_INDEX_NAME = 'shard_index.json'
+TRASH_DIR_INFIX = '.trash_'
+_DELETION_THREADS = [] # background deletions started by reset_directory
+_TRASHES = set() # directories being deleted by those
+
+
+
+def _reflink(src, dst):
     '''
-    Copy a file from src to dst without checking anything.
+    Clone src into dst sharing their data blocks (copy-on-write), only 
+    supported by some filesystems (btrfs, XFS with reflink, ...).
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		absolute path to the file that will be cloned.
+    
+	(str) dst:
+		absolute path to the future clone.
+
+    RETURNS
+    -------
+	None
+
+    RAISES
+    ------
+    (OSError) err:
+        If the filesystem or the OS does not support it.
+    '''
+    if fcntl is None:
+        raise OSError("reflink not supported on this OS")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+
+def _copy_file_range(src, dst, chunk_size=1<<30):
+    '''
+    Copy src into dst inside the kernel with large chunks, using 
+    "os.copy_file_range" (Linux, it might even be done by the filesystem, 
+    such as server-side copies on NFS).
 
     PARAMETERS
     ----------    
@@ -21,16 +81,139 @@ def copyfile(src, dst):
     
 	(str) dst:
 		absolute path to the future copied file.
+    
+	(int) chunk_size=1<<30:
+		maximum amount of bytes copied per call.
+
+    RETURNS
+    -------
+	None
+
+    RAISES
+    ------
+    (OSError) err:
+        If the filesystem or the OS does not support it.
+    '''
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError("copy_file_range not supported on this OS")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), chunk_size):
+                pass
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+
+def _link(src, dst, symbolic=False):
+    '''
+    Link dst to src, replacing dst atomically if it exists (like a copy 
+    would overwrite it): the link is created with a temporary name in the 
+    directory of dst, then renamed.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		absolute path to the linked file.
+    
+	(str) dst:
+		absolute path to the future link.
+    
+	(bool) symbolic=False:
+		if True, create a symbolic link, else a hard link.
+
+    RETURNS
+    -------
+	None
+
+    RAISES
+    ------
+    (OSError) err:
+        If the link can't be created (across filesystems for example).
+    '''
+    tmp = os.path.join(os.path.dirname(dst), 
+                       f'.{os.path.basename(dst)}.{uuid.uuid4().hex}.tmp')
+    if symbolic:
+        os.symlink(os.path.abspath(src), tmp)
+    else:
+        os.link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    finally:
+        if os.path.lexists(tmp): # failed, or dst was already the same link
+            os.remove(tmp)
+
+
+
+def copyfile(src, dst, copy_mode='copy'):
+    '''
+    Copy a file from src to dst without checking anything.
+    Except "copy", modes fall back to "copy" if not supported (for example 
+    links across filesystems or reflink on ext4). An existing dst is 
+    overwritten (atomically replaced by links). If src is a member of an 
+    archive (see "archive" module), it is extracted to dst.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		absolute path to the file that will be copied (or to a member of an 
+            archive).
+    
+	(str) dst:
+		absolute path to the future copied file.
+    
+	(str) copy_mode="copy":
+		"copy" copies data (shutil, using sendfile on Linux), 
+            "copy_file_range" copies data inside the kernel with large 
+            chunks, "reflink" shares data blocks (copy-on-write), "hardlink" 
+            and "symlink" only create links (modifying dst modifies src), 
+            "auto" tries "reflink", then "copy_file_range", then "copy".
 
     RETURNS
     -------
 	None
+
+    RAISES
+    ------
+    (ValueError) err:
+        If the copy mode is not supported.
     '''
+    if archive.split_member_path(src)[0] is not None:
+        with archive.open_source(src) as fsrc, open(dst, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, 1<<20)
+        return
+    if (copy_mode not in ('hardlink', 'symlink') and os.path.lexists(dst) 
+        and (os.path.islink(dst) or os.path.samefile(src, dst))):
+        os.remove(dst) # a previous link, writing through it would modify src
+    if copy_mode == 'copy':
+        shutil.copyfile(src, dst)
+        return
+    elif copy_mode == 'hardlink':
+        attempts = [lambda: _link(src, dst)]
+    elif copy_mode == 'symlink':
+        attempts = [lambda: _link(src, dst, symbolic=True)]
+    elif copy_mode == 'reflink':
+        attempts = [lambda: _reflink(src, dst)]
+    elif copy_mode == 'copy_file_range':
+        attempts = [lambda: _copy_file_range(src, dst)]
+    elif copy_mode == 'auto':
+        attempts = [lambda: _reflink(src, dst), 
+                    lambda: _copy_file_range(src, dst)]
+    else:
+        raise ValueError(f'Unsupported copy mode: {copy_mode}')
+
+    for attempt in attempts:
+        try:
+            return attempt()
+        except OSError:
+            continue # try a more common way
     shutil.copyfile(src, dst)
 
 
 
-def copyfile_with_safety(src, dst):
+def copyfile_with_safety(src, dst, copy_mode='copy'):
     '''
     Copy a file from src to dst and check if src file and dst directory are existing.
 
@@ -41,14 +224,17 @@ def copyfile_with_safety(src, dst):
     
 	(str) dst:
 		absolute path to the future copied file.
+    
+	(str) copy_mode="copy":
+		how to copy, see "copyfile".
 
     RETURNS
     -------
 	None
     '''
-    if os.path.isfile(src):
+    if archive.is_source_file(src):
         if os.path.isdir(os.path.dirname(dst)):
-            copyfile(src, dst)
+            copyfile(src, dst, copy_mode)
         else:
             print(f"|WRN| dir not found {os.path.dirname(dst)}")
     else:
@@ -56,7 +242,8 @@ def copyfile_with_safety(src, dst):
 
 
 
-def tmnt_copyfile_to_dir(src, dstdir, newfilename=None, safecopy=True):
+def tmnt_copyfile_to_dir(src, dstdir, newfilename=None, safecopy=True, 
+                         copy_mode='copy'):
     '''
     Copy a file from src to a dst directory.
 
@@ -73,6 +260,10 @@ def tmnt_copyfile_to_dir(src, dstdir, newfilename=None, safecopy=True):
     
 	(bool) safecopy=True:
 		if True copyfile_with_safety is called, else copyfile is called.
+    
+	(str) copy_mode="copy":
+		how to copy, see "copyfile" ("hardlink", "symlink" or "reflink" avoid 
+            duplicating data).
 
     RETURNS
     -------
@@ -86,13 +277,14 @@ def tmnt_copyfile_to_dir(src, dstdir, newfilename=None, safecopy=True):
             print(f"|WRN| newfilename should be str, not {type(newfilename)}, src filename used")
     
     if safecopy:
-        copyfile_with_safety(src, dst)
+        copyfile_with_safety(src, dst, copy_mode)
     else:
-        copyfile(src, dst)
+        copyfile(src, dst, copy_mode)
 
 
 
-def copyfiles_to_dir(srcs, dstdir, newfilename=None, safecopy=True):
+def copyfiles_to_dir(srcs, dstdir, newfilename=None, safecopy=True, 
+                     copy_mode='copy'):
     '''
     Copy multiple files from srcs to a dst directory using "copyfile_to_dir" function.
 
@@ -109,17 +301,128 @@ def copyfiles_to_dir(srcs, dstdir, newfilename=None, safecopy=True):
     
 	(bool) safecopy=True:
 		if True copyfile_with_safety is called, else copyfile is called.
+    
+	(str) copy_mode="copy":
+		how to copy, see "copyfile".
 
     RETURNS
     -------
 	None
     '''
     for src in srcs:
-        tmnt_copyfile_to_dir(src, dstdir, newfilename, safecopy)
+        tmnt_copyfile_to_dir(src, dstdir, newfilename, safecopy, copy_mode)
+
+
+
+def _unlink_directory_files(tasks, dirs, errors):
+    '''
+    Thread worker deleting every file (and symbolic link) directly inside 
+    the directories taken from "tasks", and putting their subdirectories 
+    back into it, until it gets None.
+
+    PARAMETERS
+    ----------    
+	(queue.Queue) tasks:
+		absolute paths to the directories to empty.
+    
+	(list<str>) dirs:
+		absolute paths to the emptied directories, filled by the workers.
+    
+	(list<Exception>) errors:
+		errors raised while emptying, filled by the workers.
+
+    RETURNS
+    -------
+	None
+    '''
+    while True:
+        dirpath = tasks.get()
+        if dirpath is None:
+            return
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                        tasks.put(entry.path)
+                    else:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass # unlinked by a concurrent deletion
+        except FileNotFoundError:
+            pass # deleted by a concurrent deletion
+        except OSError as err:
+            errors.append(err)
+        finally:
+            tasks.task_done()
+
+
+
+def delete_directory(dirpath, max_workers=8):
+    '''
+    Delete a directory and everything inside, like "shutil.rmtree" but 
+    unlinking files of different subdirectories in parallel threads, which 
+    is much faster with millions of files (especially on network storage).
+    Files already deleted by a concurrent deletion (another process 
+    sweeping the same trash for example) are ignored.
+
+    PARAMETERS
+    ----------    
+	(str) dirpath:
+		absolute path to the directory to delete.
+    
+	(int) max_workers=8:
+		maximum amount of threads unlinking files.
+
+    RETURNS
+    -------
+	None
+    '''
+    # Plain threads, as executors refuse tasks while Python is exiting
+    tasks, dirs, errors = queue.Queue(), [dirpath], []
+    tasks.put(dirpath)
+    workers = [threading.Thread(target=_unlink_directory_files, 
+                                args=(tasks, dirs, errors)) 
+               for _ in range(max_workers)]
+    for worker in workers:
+        worker.start()
+    tasks.join()
+    for worker in workers:
+        tasks.put(None)
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+
+    # Parents are listed before their subdirectories
+    for subdir in reversed(dirs):
+        try:
+            os.rmdir(subdir)
+        except FileNotFoundError:
+            pass # removed by a concurrent deletion
+
+
+
+def wait_directory_deletions():
+    '''
+    Wait for every background deletion started by "reset_directory" to 
+    finish. Python also waits for them before exiting.
+
+    PARAMETERS
+    ----------    
+	None
+
+    RETURNS
+    -------
+	None
+    '''
+    while _DELETION_THREADS:
+        _DELETION_THREADS.pop().join()
 
 
 
-def reset_directory(dirpath, subs=[]):
+def reset_directory(dirpath, subs=[], background=False):
     '''
     Delete directory if it exists, then create it again and fill it with
     empty subdirecories named from subs argument.
@@ -131,18 +434,59 @@ def reset_directory(dirpath, subs=[]):
     
 	(list<str>) subs:
 		name of the subdirectories that should be in dirpath.
+    
+	(bool) background=False:
+		if True, the existing directory is atomically renamed aside (as a 
+            hidden sibling) and deleted by a background thread (see 
+            "delete_directory"), so the new directory is ready immediately. 
+            Python waits for the deletion before exiting, and leftovers of 
+            an interrupted deletion are deleted at the next reset.
 
     RETURNS
     -------
 	None
     '''
-    if os.path.isdir(dirpath): shutil.rmtree(dirpath) # remove existing files
+    if os.path.isdir(dirpath): # remove existing files
+        if not background:
+            shutil.rmtree(dirpath)
+        else:
+            parent, name = os.path.split(os.path.abspath(dirpath))
+            prefix = f'.{name}{TRASH_DIR_INFIX}'
+            trash = os.path.join(parent, f'{prefix}{uuid.uuid4().hex}')
+            os.rename(dirpath, trash) # same filesystem, so atomic
+            trashes = [os.path.join(parent, other) # with leftovers
+                       for other in os.listdir(parent) 
+                       if other.startswith(prefix)]
+            trashes = [trash for trash in trashes if trash not in _TRASHES]
+            _TRASHES.update(trashes)
+            thread = threading.Thread(target=_delete_trashes, args=(trashes,))
+            thread.start() # not a daemon, so Python waits for it at exit
+            _DELETION_THREADS.append(thread)
     os.mkdir(dirpath) # create the new empty directory
     for subdir in subs: # fill it with new empty subdirectories
         os.mkdir(os.path.join(dirpath, subdir))
 
 
 
+def _delete_trashes(trashes):
+    '''
+    Delete directories renamed aside by "reset_directory".
+
+    PARAMETERS
+    ----------    
+	(list<str>) trashes:
+		absolute paths to the directories to delete.
+
+    RETURNS
+    -------
+	None
+    '''
+    for trash in trashes:
+        delete_directory(trash)
+        _TRASHES.discard(trash)
+
+
+
 def tmnt_generate_documentation(src, dstdir):
     '''
     Extract documentation inside python file and fill it into markdown file.
@@ -237,4 +581,175 @@ def load_dict_from_json(src):
 		loaded data dictionary.
     '''
     with open(src, "r") as json_file:
-        return json.load(json_file)
\ No newline at end of file
+        return json.load(json_file)
+
+
+
+def map_file_hash(src, algorithm="blake2b", chunk_size=1<<20):
+    '''
+    Hash the content of a file (or of a member of an archive), reading it 
+    chunk by chunk.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		absolute path to the file.
+    
+	(str) algorithm="blake2b":
+		hashlib algorithm.
+    
+	(int) chunk_size=1<<20:
+		amount of bytes read at once.
+
+    RETURNS
+    -------    
+	(dict<str;str>) hashes:
+		hexadecimal digest of the content, by src: {src: digest}.
+    '''
+    digest = hashlib.new(algorithm)
+    with archive.open_source(src) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return {src: digest.hexdigest()}
+
+
+
+def get_shard_subdir(name, depth=2):
+    '''
+    Get the sharded relative subdirectory of a name, made of "depth" levels 
+    of 2 hexadecimal characters from its hash (256 subdirectories per 
+    level), for example "3f/a0". It is stable between runs and hosts.
+
+    PARAMETERS
+    ----------    
+	(str) name:
+		name to shard (for example a source filename).
+    
+	(int) depth=2:
+		amount of levels.
+
+    RETURNS
+    -------    
+	(str) subdir:
+		relative path to the shard subdirectory.
+    '''
+    digest = hashlib.blake2b(str(name).encode(), digest_size=depth).hexdigest()
+    return os.path.join(*[digest[2*i:2*i+2] for i in range(depth)])
+
+
+
+def save_shard_index(dirpath, depth=2, subs=[]):
+    '''
+    Save an index of the files inside sharded subdirectories (see 
+    "get_shard_subdir") as a json file named SHARD_INDEX_NAME into dirpath.
+    It maps logical relative paths (as if not sharded, "label/name") to 
+    real relative paths ("label/3f/a0/name").
+
+    PARAMETERS
+    ----------    
+	(str) dirpath:
+		absolute path to the sharded directory.
+    
+	(int) depth=2:
+		amount of shard levels.
+    
+	(list<str>) subs:
+		name of the subdirectories of dirpath containing shards (such as 
+            labels), if empty, shards are directly inside dirpath.
+
+    RETURNS
+    -------    
+	(dict<str;str>) index:
+		real relative path of each logical relative path.
+    '''
+    index = {}
+    collisions = 0
+    for sub in (subs if len(subs) > 0 else ['']):
+        shards = [os.path.join(dirpath, sub)]
+        if not os.path.isdir(shards[0]):
+            continue
+        for _ in range(depth):
+            shards = [entry.path for shard in shards 
+                      for entry in os.scandir(shard) 
+                      if entry.is_dir(follow_symlinks=False)]
+        for shard in shards:
+            for entry in os.scandir(shard):
+                name = os.path.join(sub, entry.name)
+                collisions += name in index
+                index[name] = os.path.relpath(entry.path, dirpath)
+    if collisions > 0:
+        print(f'|WRN| {collisions} sharded files have the same name as '
+              'another one, only one of them is indexed.')
+    save_dict_as_json(os.path.join(dirpath, SHARD_INDEX_NAME), index)
+    return index
+
+
+
+def iter_filenames(dirpath, extensions=None):
+    '''
+    Iterate over the filenames directly inside a directory (without listing 
+    all of them at once).
+
+    PARAMETERS
+    ----------    
+	(str) dirpath:
+		absolute path to the directory.
+    
+	(array/list like of str) extensions=None:
+		allowed extensions, if None or empty, any file is kept.
+
+    RETURNS
+    -------    
+	(generator of str) filenames:
+		filenames (with extension) of the files.
+    '''
+    anyfile = extensions is None or len(extensions) == 0
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if ((anyfile or entry.name.endswith(tuple(extensions))) 
+                and entry.is_file()):
+                yield entry.name
+
+
+
+def reservoir_sample(items, k, seed=871, strata=None):
+    '''
+    Randomly pick k items (per stratum) from a stream of unknown length, in 
+    a single pass and keeping only the picked items in memory (reservoir 
+    sampling). The same seed and stream give the same sample.
+
+    PARAMETERS
+    ----------    
+	(iterable) items:
+		stream of items.
+    
+	(int) k:
+		amount of items to pick (per stratum).
+    
+	(int) seed=871:
+		seed of the random generator.
+    
+	(iterable) strata=None:
+		stratum of each item (for example its label), consumed along with 
+            items. If None, every item is in the same stratum (None).
+
+    RETURNS
+    -------    
+	(dict<any;list>) samples:
+		picked items of each stratum (all of them if less than k).
+    '''
+    rng = random.Random(seed)
+    strata = iter(strata) if strata is not None else None
+    samples, counts = {}, {}
+    for item in items:
+        stratum = next(strata) if strata is not None else None
+        count = counts.get(stratum, 0)
+        counts[stratum] = count + 1
+        sample = samples.setdefault(stratum, [])
+        if count < k:
+            sample.append(item)
+        else: # replace an item with probability k / (count+1)
+            j = rng.randrange(count + 1)
+            if j < k:
+                sample[j] = item
+    return samples
\ No newline at end of file
@@ -2,6 +2,11 @@ import os
 
 
 
+auski = None # set by set_gpu_computation (cucim.skimage or skimage)
+aunp = None # set by set_gpu_computation (cupy or numpy)
+
+
+
 def cupy_to_numpy(arr):
     '''
     Return a numpy.array from a cupy.array or a numpy.array.
@@ -81,6 +86,8 @@ def select_device(device):
 	None
     '''
     if device is not None:
+        if aunp is None: # GPU computation not set up yet
+            set_gpu_computation()
         try:
             aunp.cuda.Device(device).use()
         except AttributeError:
@@ -1,9 +1,12 @@
+import functools
 import numpy as np
 import os
 
+from . import archive
 from . import file
 from . import multiprocess
 from . import sheet
+from . import taskqueue
 
 
 
@@ -14,7 +17,8 @@ class DataHandler:
     ATTRIBUTES
     ----------
     (str) datapath:
-        Absolute path to the directory that contain source files.
+        Absolute path to the directory (or zip/tar archive) that contain 
+            source files.
     
     (array/list like of str) file_extensions=None:
         Source file allowed extensions.
@@ -25,6 +29,34 @@ class DataHandler:
     (int) seed=871:
         Seed used to initialize numpy randomizer.
     
+    (int) threads_per_worker=None:
+        Maximum amount of threads each process lets OpenCV, BLAS and OpenMP 
+            spawn, if None libraries keep their defaults.
+    
+    (bool) pin_cpus=False:
+        If True, pin each process to one CPU.
+    
+    (float) straggler_factor=None:
+        If defined, files are scheduled one by one and those running longer 
+            than this factor times the median duration are launched again on 
+            idle workers (speculative execution).
+    
+    (int) prefetch=0:
+        Amount of upcoming source files warmed into the page cache while 
+            processing the current one.
+    
+    (str) queuedir=None:
+        If defined, files are published as tasks into this queue directory 
+            (on shared storage) and processed by any worker reaching it.
+    
+    (bool) background_reset=False:
+        If True, previous destination directories are renamed aside and 
+            deleted in background while processing.
+    
+    (int) shard_depth=0:
+        If positive, outputs are written into hash-sharded subdirectories 
+            of each label directory, with this amount of levels.
+    
     (str) str_ndarray_dtype="U256":
         Data type used for any string numpy arrays. It defines the maximum 
             length of strings, especially those in sheet files, for loading 
@@ -41,17 +73,36 @@ class DataHandler:
     
     (numpy.array<str_ndarray_dtype>) groups=None:
         The groups of the files, all with the same will be in the same dataset split.
+    
+    (dict<str;str>) duplicates=None:
+        For each file with the same content as another, the filename of the 
+            file processed in its place (see "find_duplicates").
+    
+    (dict<str;numpy.array>) metadata=None:
+        Values of extra sheet columns for each file (see 
+            "load_metadata_fromsheet").
     '''
 
     def __init__(self, datapath, file_extensions=None, allowed_cpus=1, seed=871,
-                 str_ndarray_dtype="U256"):
+                 str_ndarray_dtype="U256", threads_per_worker=None, 
+                 pin_cpus=False, straggler_factor=None, prefetch=0, 
+                 queuedir=None, background_reset=False, shard_depth=0):
         '''
         Initiate DataHandler instance to handle data on disk.
 
         PARAMETERS
         ----------        
 		(str) datapath:
-		    Absolute path to the directory that contain source files.
+		    Absolute path to the directory that contain source files. It can 
+                also be a zip/tar archive, then members are indexed without 
+                extracting anything and sources are given to treatments as 
+                "datapath/member" paths. Treatments read them with 
+                "archive.open_source" (file-like object) or 
+                "archive.source_path" (temporary path), and each worker opens 
+                its own handle. Copying ("func" is None) and the treatments 
+                of image, video and pathology modules already support them. 
+                Prefer uncompressed archives, compressed tars are 
+                decompressed to be indexed by each worker.
         
 		(array/list like of str) file_extensions=None:
 		    Source file allowed extensions.
@@ -66,6 +117,47 @@ class DataHandler:
 		    Data type used for any string numpy arrays. It defines the maximum 
                 length of strings, especially those in sheet files, for loading 
                 labels and groups.
+        
+		(int) threads_per_worker=None:
+		    Maximum amount of threads each process lets OpenCV, BLAS and 
+                OpenMP spawn, if None libraries keep their defaults. Using 1 
+                avoids oversubscription when "allowed_cpus" is the amount of 
+                cores.
+        
+		(bool) pin_cpus=False:
+		    If True, pin each process to one CPU (Linux only).
+        
+		(float) straggler_factor=None:
+		    If defined, files are scheduled one by one and those running 
+                longer than this factor times the median duration are 
+                launched again on idle workers, the first finished attempt 
+                wins (see "multiprocess.run_speculative_processes_on_multiple
+                _files"). CPU pinning is not available with it.
+        
+		(int) prefetch=0:
+		    Amount of upcoming source files warmed into the page cache while 
+                processing the current one, useful when sources are on slow
+                (network) storage.
+        
+		(str) queuedir=None:
+		    If defined, processing publishes a task per file into this queue 
+                directory (on storage shared by every host), runs 
+                "allowed_cpus" local workers and waits for the queue to be 
+                completed. Workers on other hosts can join calling 
+                "taskqueue.run_queue_workers(queuedir)".
+        
+		(bool) background_reset=False:
+		    If True, previous destination directories are renamed aside and 
+                deleted by a background thread, so processing starts 
+                immediately (see "file.reset_directory").
+        
+		(int) shard_depth=0:
+		    If positive, the "dstdir" given to treatments is a hash-sharded 
+                subdirectory (from the source filename) of the label 
+                directory, with this amount of levels of 256 subdirectories 
+                (see "file.get_shard_subdir"), and an index of outputs 
+                logical paths is saved after processing (see 
+                "file.save_shard_index"). It avoids huge flat directories.
     
         RETURNS
         -------
@@ -74,21 +166,31 @@ class DataHandler:
         RAISES
         ------
         (NotADirectoryError) err: 
-            if the absolute path doesn't lead to an existing directory.
+            if the absolute path doesn't lead to an existing directory (or 
+            archive).
         '''
-        if not os.path.isdir(datapath):
+        if not os.path.isdir(datapath) and not archive.is_archive(datapath):
             raise NotADirectoryError("datapath must be an absolute path to an "
-                                     "existing directory")
+                                     "existing directory or archive")
         
         self.datapath = datapath
         self.file_extensions = file_extensions
         self.allowed_cpus = allowed_cpus
         self.seed = seed
         self.str_ndarray_dtype = str_ndarray_dtype
+        self.threads_per_worker = threads_per_worker
+        self.pin_cpus = pin_cpus
+        self.straggler_factor = straggler_factor
+        self.prefetch = prefetch
+        self.queuedir = queuedir
+        self.background_reset = background_reset
+        self.shard_depth = shard_depth
         self.files = None
         self.labels = None
         self.unique_labels = None
         self.groups = None
+        self.duplicates = None
+        self.metadata = None
 
 
     def _format_sheet(self, df, filecol=None, labelcol=None, othercols=None, 
@@ -127,9 +229,12 @@ class DataHandler:
         return sheet.delete_clueless_rows(df, clueless_words)
 
 
-    def _load_sheet(self, sheetpath, filecol, labelcol, othercols=None):
+    def _load_sheet(self, sheetpath, filecol, labelcol, othercols=None, 
+                    full_match=False, chunksize=None):
         '''
-        Load a sheet file and keep indicated columns.
+        Load a sheet file, reading only indicated columns.
+        If chunksize is defined, chunks of the sheet are returned one by one 
+        instead (see "sheet.iter_df_chunks").
 
         PARAMETERS
         ----------        
@@ -144,11 +249,19 @@ class DataHandler:
         
 		(iterable of str) othercols=None:
 		    Name of the other columns to keep.
+        
+		(bool) full_match=False:
+		    If True, only rows whose filecol is exactly a loaded filename are 
+                kept.
+        
+		(int) chunksize=None:
+		    Maximum amount of rows per chunk, if None the sheet is loaded at 
+                once.
 
         RETURNS
         -------        
-		(pandas.DataFrame) df:
-		    Loaded dataframe.
+		(pandas.DataFrame or generator of pandas.DataFrame) df:
+		    Loaded dataframe, or its chunks.
 
         RAISES
         ------
@@ -159,18 +272,80 @@ class DataHandler:
             othercols = []
         cols = [col for col in othercols]
         cols.append(filecol) ; cols.append(labelcol)
-        return sheet.read_df_from_any_avalaible_extensions(sheetpath)[cols]
+        if chunksize is not None:
+            return sheet.iter_df_chunks(sheetpath, chunksize, columns=cols, 
+                        dtype={filecol: str, labelcol: str},
+                        filter_col=filecol if full_match else None, 
+                        filter_values=self.files if full_match else None)
+        return sheet.read_df_from_any_avalaible_extensions(sheetpath, 
+                    columns=cols, dtype={filecol: str, labelcol: str},
+                    filter_col=filecol if full_match else None, 
+                    filter_values=self.files if full_match else None)
+
+
+    def _match_files(self, fileparts, values, matches, lengths, 
+                     full_match=False):
+        '''
+        Match each file with the longest filepart included in its filename, 
+        updating matches of previous calls (so a sheet can be matched chunk 
+        by chunk). If multiple fileparts have the same length, the first 
+        one met is kept.
 
+        PARAMETERS
+        ----------        
+		(array/list like of str) fileparts:
+		    Parts of filenames (ids of the sheet).
+        
+		(array/list like) values:
+		    Value (label, group...) associated with each filepart, or row of 
+                values (2D array).
+        
+		(numpy.array) matches:
+		    Value (or row) matched for each file, updated inplace.
+        
+		(numpy.array<int>) lengths:
+		    Length of the filepart matched for each file (-1 if none), 
+                updated inplace.
+        
+		(bool) full_match=False:
+		    If True, the filepart must be exactly the filename.
 
-    def load_data_fromdatapath(self):
+        RETURNS
+        -------        
+		None
+        '''
+        # Browse fileparts by descending size, so if a smaller is included 
+        # inside a bigger, it exits before disturbing
+        sizes = np.array([len(filepart) for filepart in fileparts], dtype=int)
+        order = np.argsort(-sizes, kind='stable')
+        fileparts = np.asarray(fileparts, dtype=object)[order]
+        values = np.asarray(values, dtype=object)[order]
+        sizes = sizes[order]
+        for i, filename in enumerate(self.files):
+            for filepart, value, size in zip(fileparts, values, sizes):
+                if size <= lengths[i]:
+                    break # a previous chunk matched better (or as well)
+                if filepart in filename:
+                    if full_match and filepart != filename:
+                        continue
+                    matches[i] = value
+                    lengths[i] = size
+                    break
+
+
+    def load_data_fromdatapath(self, n_files=None):
         '''
         Load data files from data directory.
-        Assuming that those files are directly inside the data directory.
-        The filenames are stored as "files" attribute.
+        Assuming that those files are directly inside the data directory 
+        (if it is an archive, any file member is loaded, with its relative 
+        path). The filenames are stored as "files" attribute.
 
         PARAMETERS
         ----------
-		None
+		(int) n_files=None:
+		    If defined, only this amount of files is randomly kept (seeded), 
+                sampled while listing the directory, so the full list is 
+                never built (see "file.reservoir_sample").
     
         RETURNS
         -------
@@ -178,15 +353,22 @@ class DataHandler:
         '''
         anyfile = (self.file_extensions is None # if no extension, keep any
                    or len(self.file_extensions) == 0) 
-        self.files = np.array([filename for filename in os.listdir(self.datapath) 
-                              if anyfile 
-                              or filename.endswith(tuple(self.file_extensions))],
-                              dtype=self.str_ndarray_dtype)
+
+        if archive.is_archive(self.datapath):
+            filenames = archive.list_members(self.datapath)
+        else:
+            filenames = file.iter_filenames(self.datapath)
+        filenames = (filename for filename in filenames 
+                     if anyfile or filename.endswith(tuple(self.file_extensions)))
+        if n_files is not None:
+            filenames = file.reservoir_sample(filenames, n_files, 
+                                              self.seed).get(None, [])
+        self.files = np.array(list(filenames), dtype=self.str_ndarray_dtype)
 
 
     def load_labels_fromsheet(self, sheetpath, idcol, labelcol, 
             othercols=None, clueless_words=None, delete_unlabeled_files=True,
-            require_full_filename_match=False):
+            require_full_filename_match=False, chunksize=None):
         '''
         Load data labels from a sheet file. 
         You must load files before calling this, you might call 
@@ -219,31 +401,32 @@ class DataHandler:
             it is considered as a match. Note that if the idcol value is 
             included in multiple filenames, it will be associated with the 
             first one found, in descending length order.
+        
+		(int) chunksize=None:
+		    If defined, the sheet is streamed by chunks of this amount of 
+                rows, each one cleaned and matched before reading the next, 
+                so memory stays bounded for huge csv sheets.
     
         RETURNS
         -------
 		None
         '''
-        # Load and format sheet
-        df = self._load_sheet(sheetpath, idcol, labelcol, othercols)
-        df[idcol] = df[idcol].astype(str)
-        df[labelcol] = df[labelcol].astype(str)
-        df = self._format_sheet(df, idcol, labelcol, othercols, clueless_words)
+        # Load sheet (chunk by chunk if asked)
+        dfs = self._load_sheet(sheetpath, idcol, labelcol, othercols, 
+                               require_full_filename_match, chunksize)
+        if chunksize is None:
+            dfs = [dfs]
 
-        # Browse files through the size of those names (descending order)
-        # So if a smaller is included inside a bigger, its exit before disturbing
-        indices = np.argsort(np.array([len(idstr) for idstr in df[idcol].values]))
-        df = df.reindex(index=indices[::-1])
-
-        # Get the label of each corresponding file
+        # Format then get the label of each corresponding file
         labels = np.empty(self.files.shape, dtype=self.str_ndarray_dtype)
-        for i, filename in enumerate(self.files):
-            for filepart, label in zip(df[idcol].values, df[labelcol].values):
-                if filepart in filename:
-                    if require_full_filename_match and filepart != filename:
-                        continue
-                    labels[i] = label
-                    break
+        lengths = np.full(self.files.shape, -1)
+        for df in dfs:
+            df[idcol] = df[idcol].astype(str)
+            df[labelcol] = df[labelcol].astype(str)
+            df = self._format_sheet(df, idcol, labelcol, othercols, 
+                                    clueless_words)
+            self._match_files(df[idcol].values, df[labelcol].values, labels, 
+                              lengths, require_full_filename_match)
         
         # Update labels
         if np.all(labels == ''):
@@ -259,41 +442,69 @@ class DataHandler:
                                            ).astype(self.str_ndarray_dtype)
 
 
-    def load_labeled_data_fromdatapath(self):
+    def load_labeled_data_fromdatapath(self, n_per_label=None):
         '''
         Load data files and labels from data directory.
         Assuming that those files are inside subdirectories (named with unique 
-        labels). The filenames are stored as "files" attribute. The labels are 
-        stored as "labels" attribute and their unique values are stored as 
-        "unique_labels" attribute.
+        labels), also inside an archive. The filenames are stored as "files" 
+        attribute. The labels are stored as "labels" attribute and their 
+        unique values are stored as "unique_labels" attribute.
 
         PARAMETERS
         ----------
-		None
+		(int) n_per_label=None:
+		    If defined, only this amount of files per label is randomly kept 
+                (seeded), sampled while listing directories (see 
+                "file.reservoir_sample").
     
         RETURNS
         -------
 		None
         '''
+        # List filenames per label (sampling them if asked)
+        if archive.is_archive(self.datapath):
+            tree = {}
+            for member in archive.list_members(self.datapath):
+                parts = member.split('/')
+                if len(parts) == 2:
+                    tree.setdefault(parts[0], []).append(parts[1])
+            if n_per_label is not None:
+                tree = {label: file.reservoir_sample(
+                            (filename for filename in filenames 
+                             if self.file_extensions is None 
+                             or len(self.file_extensions) == 0 
+                             or filename.endswith(tuple(self.file_extensions))), 
+                            n_per_label, self.seed).get(None, []) 
+                        for label, filenames in tree.items()}
+        else:
+            tree = {}
+            for label in sorted(os.listdir(self.datapath)):
+                if os.path.isdir(os.path.join(self.datapath, label)):
+                    filenames = file.iter_filenames(
+                        os.path.join(self.datapath, label), 
+                        self.file_extensions)
+                    tree[label] = (list(filenames) if n_per_label is None 
+                                   else file.reservoir_sample(filenames, 
+                                        n_per_label, self.seed).get(None, []))
+
         # Init arrays
-        unique_labels = np.array([label for label in os.listdir(self.datapath) 
-                            if os.path.isdir(os.path.join(self.datapath, label))],
-                            dtype=self.str_ndarray_dtype)
+        unique_labels = np.array(list(tree.keys()), 
+                                 dtype=self.str_ndarray_dtype)
         labels = np.array([], dtype=self.str_ndarray_dtype)
         files = np.array([], dtype=self.str_ndarray_dtype)
 
         # Fill them label per label with founded files (if the ext is allowed)
         anyfile = (self.file_extensions is None # if no extension, keep any
                    or len(self.file_extensions) == 0) 
-        for i, label in enumerate(unique_labels):
+        for label in unique_labels:
             incoming_files = np.array(
-                [os.path.join(label, filename) for filename in os.listdir(
-                    os.path.join(self.datapath, label)) 
+                [os.path.join(label, filename) for filename in tree[label] 
                     if anyfile or filename.endswith(tuple(self.file_extensions)
                 )]
             )
             if incoming_files.size == 0:
-                del unique_labels[i] # a label without data is useless
+                # a label without data is useless
+                unique_labels = unique_labels[unique_labels != label]
                 continue
             files = np.concatenate([files, incoming_files])
             labels = np.concatenate([labels, 
@@ -310,7 +521,8 @@ class DataHandler:
     
 
     def load_groups_fromsheet(self, sheetpath, idcol, groupcol, 
-            clueless_words=None, require_full_filename_match=False):
+            clueless_words=None, require_full_filename_match=False, 
+            chunksize=None):
         '''
         Load data groups from a sheet file. 
         You must load files before calling this, you might call 
@@ -336,15 +548,21 @@ class DataHandler:
             it is considered as a match. Note that if the idcol value is 
             included in multiple filenames, it will be associated with the 
             first one found, in descending length order.
+        
+		(int) chunksize=None:
+		    If defined, the sheet is streamed by chunks of this amount of 
+                rows, each one matched before reading the next.
     
         RETURNS
         -------
 		None
         '''
-        # Load and format sheet
-        df = sheet.read_df_from_any_avalaible_extensions(sheetpath)
-        df[idcol] = df[idcol].astype(str)
-        df[groupcol] = df[groupcol].astype(str)
+        # Load sheet (chunk by chunk if asked)
+        dfs = self._load_sheet(sheetpath, idcol, groupcol, 
+                               full_match=require_full_filename_match, 
+                               chunksize=chunksize)
+        if chunksize is None:
+            dfs = [dfs]
 
         # Be sure that '' is considered as empty
         if clueless_words is None:
@@ -352,26 +570,447 @@ class DataHandler:
         else:
             clueless_words = [word for word in clueless_words]
 
-        # Browse files through the size of those names (descending order)
-        # So if a smaller is included inside a bigger, its exit before disturbing
-        indices = np.argsort(np.array([len(idstr) for idstr in df[idcol].values]))
-        df = df.reindex(index=indices[::-1])
-
         # Get the group of each corresponding file (if avalaible)
         groups = np.empty(self.files.shape, dtype=self.str_ndarray_dtype)
+        lengths = np.full(self.files.shape, -1)
+        for df in dfs:
+            df[idcol] = df[idcol].astype(str)
+            df[groupcol] = df[groupcol].astype(str)
+            self._match_files(df[idcol].values, df[groupcol].values, groups, 
+                              lengths, require_full_filename_match)
+
+        # In case no group, filename becomes the group
         for i, filename in enumerate(self.files):
-            groups[i] = filename # in case no group, filename becomes the group
-            for filepart, group in zip(df[idcol].values, df[groupcol].values):
-                if filepart in filename:
-                    if require_full_filename_match and filepart != filename:
-                        continue
-                    groups[i] = (group 
-                                 if group not in clueless_words 
-                                 else filename)
-                    break
+            if lengths[i] < 0 or groups[i] in clueless_words:
+                groups[i] = filename
         self.groups = groups
 
 
+    def load_metadata_fromsheet(self, sheetpath, idcol, labelcol=None, 
+            groupcol=None, othercols=None, clueless_words=None, 
+            delete_unlabeled_files=True, require_full_filename_match=False, 
+            chunksize=None):
+        '''
+        Load labels, groups and extra columns from a single sheet file, 
+        reading it once and matching each file once (instead of calling 
+        "load_labels_fromsheet" and "load_groups_fromsheet").
+        You must load files before calling this, you might call 
+        "load_data_fromdatapath". Labels are stored as "labels" attribute 
+        (and their unique values as "unique_labels"), groups as "groups" 
+        attribute and extra columns as "metadata" attribute.
+        Rows with an empty or clueless id or label are ignored, files 
+        matched with an empty or clueless group become their own group.
+
+        PARAMETERS
+        ----------        
+		(str) sheetpath:
+		    Absolute path to the sheet which contain information about data.
+        
+		(str) idcol:
+		    Name of the column that contains at least a part of the filename.
+        
+		(str) labelcol=None:
+		    Name of the column that contains labels, if None labels are not 
+                loaded.
+        
+		(str) groupcol=None:
+		    Name of the column that contains groups, if None groups are not 
+                loaded.
+        
+		(array/list like of str) othercols=None:
+		    Name of the other columns to load into "metadata" (None for 
+                unmatched files).
+        
+		(array/list like of str) clueless_words=None:
+		    Strings considered as None.
+        
+		(bool) delete_unlabeled_files=True:
+		    If True (and labelcol defined), delete each file without label.
+        
+		(bool) require_full_filename_match=False:
+		    If True, requires the value in the idcol to be exactly the filename,
+            otherwise, if the value in the idcol is included in the filename, 
+            it is considered as a match, the longest one is kept.
+        
+		(int) chunksize=None:
+		    If defined, the sheet is streamed by chunks of this amount of 
+                rows, each one cleaned and matched before reading the next.
+    
+        RETURNS
+        -------
+		None
+        '''
+        othercols = [] if othercols is None else list(othercols)
+        keys = [idcol] + [col for col in [labelcol, groupcol] 
+                          if col is not None]
+        cols = list(dict.fromkeys(keys[1:] + othercols))
+        clueless_words = ([''] if clueless_words is None 
+                          else [''] + list(clueless_words))
+
+        # Load sheet once (chunk by chunk if asked)
+        reader = (sheet.read_df_from_any_avalaible_extensions 
+                  if chunksize is None else 
+                  functools.partial(sheet.iter_df_chunks, chunksize=chunksize))
+        dfs = reader(sheetpath, columns=[idcol] + cols, 
+                     dtype={col: str for col in keys},
+                     filter_col=idcol if require_full_filename_match else None, 
+                     filter_values=(self.files if require_full_filename_match 
+                                    else None))
+        if chunksize is None:
+            dfs = [dfs]
+
+        # Match each file once, keeping every requested column
+        matches = np.full((self.files.size, len(cols)), None, dtype=object)
+        lengths = np.full(self.files.shape, -1)
+        for df in dfs:
+            df = sheet.delete_clueless_rows(df, clueless_words, 
+                        columns=[col for col in [idcol, labelcol] 
+                                 if col is not None])
+            rows = df[cols].astype(object)
+            self._match_files(df[idcol].astype(str).values, 
+                              rows.where(rows.notna(), None).to_numpy(), 
+                              matches, lengths, require_full_filename_match)
+        values = {col: matches[:, j] for j, col in enumerate(cols)}
+
+        # Update attributes
+        if groupcol is not None:
+            self.groups = np.array(
+                [filename if group is None or str(group) in clueless_words 
+                 else str(group) 
+                 for filename, group in zip(self.files, values[groupcol])], 
+                dtype=self.str_ndarray_dtype)
+        if othercols:
+            self.metadata = {col: values[col] for col in othercols}
+        if labelcol is not None:
+            labels = np.array(['' if label is None else str(label) 
+                               for label in values[labelcol]], 
+                              dtype=self.str_ndarray_dtype)
+            if np.all(labels == ''):
+                print('|WRN| no label keeped, labels not changed.')
+                return
+            self.labels = labels
+            if delete_unlabeled_files:
+                self._keep_files(np.where(labels != '')[0])
+            self.unique_labels = np.unique(self.labels
+                                           ).astype(self.str_ndarray_dtype)
+
+
+    def subsample(self, n_per_stratum=None, fraction=None, by="labels", 
+                  seed=None):
+        '''
+        Randomly keep a subset of loaded files, stratified by labels or 
+        groups, for example to cut a small pilot dataset. With n_per_stratum, 
+        files are streamed once, keeping only sampled indices per stratum 
+        (reservoir sampling, see "file.reservoir_sample"). Labels, groups 
+        and metadata follow.
+
+        PARAMETERS
+        ----------        
+		(int) n_per_stratum=None:
+		    Amount of files to keep per stratum (all of them if less).
+        
+		(float) fraction=None:
+		    If n_per_stratum is None, this fraction of each stratum is kept 
+                (rounded, at least one file per stratum).
+        
+		(str) by="labels":
+		    Strata, "labels", "groups" or None (no stratification).
+        
+		(int) seed=None:
+		    Seed of the sampling, if None "seed" attribute is used.
+    
+        RETURNS
+        -------
+		(int) count:
+		    Amount of kept files.
+        
+        RAISES
+        ------
+        (ValueError) err: 
+            If neither n_per_stratum nor fraction is defined, or if the 
+            strata are not loaded.
+        '''
+        seed = self.seed if seed is None else seed
+        strata = {"labels": self.labels, "groups": self.groups, 
+                  None: None}[by]
+        if by is not None and strata is None:
+            raise ValueError(f'{by} must be loaded to subsample by {by}')
+
+        if n_per_stratum is not None:
+            samples = file.reservoir_sample(range(self.files.size), 
+                                            n_per_stratum, seed, strata)
+            ids = np.sort(np.concatenate(
+                [np.array(sample, dtype=int) for sample in samples.values()]
+                + [np.array([], dtype=int)]))
+        elif fraction is not None:
+            rng = np.random.default_rng(seed)
+            if strata is None:
+                chunks = [np.arange(self.files.size)]
+            else: # indices of each stratum
+                _, inverse, counts = np.unique(strata, return_inverse=True, 
+                                               return_counts=True)
+                chunks = np.split(np.argsort(inverse, kind='stable'), 
+                                  np.cumsum(counts)[:-1])
+            ids = np.sort(np.concatenate(
+                [rng.choice(chunk, min(chunk.size, 
+                                       max(1, round(fraction*chunk.size))), 
+                            replace=False) for chunk in chunks]
+                + [np.array([], dtype=int)]))
+        else:
+            raise ValueError('n_per_stratum or fraction must be defined')
+        self._keep_files(ids)
+        return ids.size
+
+
+    def find_duplicates(self, merge_groups=True, algorithm="blake2b"):
+        '''
+        Find files with exactly the same content. Only files sharing their 
+        size with another are hashed (in parallel). Then each duplicate is 
+        stored into "duplicates" attribute, and processes ("process" and 
+        "make_datasets") only process one file per content, linking results 
+        for the others. Call it after loading groups, since loading them 
+        again overwrites the merge.
+
+        PARAMETERS
+        ----------        
+		(bool) merge_groups=True:
+		    If True, duplicates are forced into the same group (creating 
+                "groups" attribute if not defined), so they are in the same 
+                dataset split.
+        
+		(str) algorithm="blake2b":
+		    hashlib algorithm used to hash contents.
+    
+        RETURNS
+        -------
+		(int) count:
+		    Amount of duplicates (files not processed because of another).
+        '''
+        # Only files with the same size might have the same content
+        srcs = np.array(
+            [os.path.join(self.datapath, filename) for filename in self.files])
+        sizes = np.array([archive.get_source_size(src) for src in srcs])
+        _, inverse, counts = np.unique(sizes, return_inverse=True, 
+                                       return_counts=True)
+        candidates = np.where(counts[inverse] > 1)[0]
+
+        # Hash candidates in parallel then find the first file of each content
+        hashes = {}
+        if candidates.size > 0:
+            packed_srcs, _ = multiprocess.distribute(srcs[candidates], None, 
+                                                self.allowed_cpus, self.seed)
+            hashes = multiprocess.run_reduce_on_multiple_files(packed_srcs, 
+                      file.map_file_hash, multiprocess.reduce_update, 
+                      allowed_cpus=self.allowed_cpus, 
+                      threads_per_worker=self.threads_per_worker, 
+                      algorithm=algorithm)
+        duplicates = {}
+        firsts = {}
+        for i in candidates:
+            content = (sizes[i], hashes[srcs[i]])
+            if content in firsts:
+                duplicates[str(self.files[i])] = str(self.files[firsts[content]])
+            else:
+                firsts[content] = i
+        self.duplicates = duplicates
+
+        # Force duplicates into the same group (and warn about label issues)
+        if merge_groups:
+            self._merge_groups(list(duplicates.items()))
+        return len(duplicates)
+
+
+    def _merge_groups(self, pairs):
+        '''
+        Merge the groups of paired files, so they are in the same dataset 
+        split. If "groups" attribute is not defined, each file starts 
+        with its own group. Also warn if paired files have different labels.
+
+        PARAMETERS
+        ----------        
+		(list<tuple<str;str>>) pairs:
+		    Filenames of the files to put in the same group.
+    
+        RETURNS
+        -------
+		None
+        '''
+        if not pairs:
+            return
+        ids = {filename: i for i, filename in enumerate(self.files)}
+        if self.groups is None:
+            self.groups = self.files.copy()
+        # union-find over file indices, starting from the current groups
+        firsts = {}
+        parents = [firsts.setdefault(group, i) 
+                   for i, group in enumerate(self.groups)]
+        for filename, other in pairs:
+            roots = []
+            for i in (ids[filename], ids[other]):
+                while parents[i] != i:
+                    parents[i] = parents[parents[i]]
+                    i = parents[i]
+                roots.append(i)
+            if roots[0] != roots[1]:
+                parents[roots[0]] = roots[1]
+        for i in range(len(parents)):
+            root = i
+            while parents[root] != root:
+                root = parents[root]
+            parents[i] = root
+        self.groups = self.groups[parents]
+        if self.labels is not None:
+            conflicts = sum(self.labels[ids[filename]] != self.labels[ids[other]]
+                            for filename, other in pairs)
+            if conflicts > 0:
+                print(f'|WRN| {conflicts} paired duplicates have different '
+                      'labels.')
+
+
+    def find_near_duplicates(self, threshold=4, hash_size=8, 
+                             merge_groups=True, drop=False):
+        '''
+        Find near-identical images (re-scans, resized copies, consecutive 
+        video frames) comparing their perceptual hashes, computed in 
+        parallel (see "image.map_perceptual_hash"). Hashes are indexed into 
+        a BKTree, so it does not compare every pair of images.
+        Requires 'opencv-python' (cv2).
+
+        PARAMETERS
+        ----------        
+		(int) threshold=4:
+		    Maximum Hamming distance (included) between near-duplicates 
+                hashes.
+        
+		(int) hash_size=8:
+		    Side of the hashes, they have hash_size*hash_size bits.
+        
+		(bool) merge_groups=True:
+		    If True, near-duplicates are forced into the same group 
+                (creating "groups" attribute if not defined), so they are in 
+                the same dataset split. Call it after loading groups.
+        
+		(bool) drop=False:
+		    If True, only the first file of each cluster of near-duplicates 
+                is kept in "files" (and "labels", "groups").
+    
+        RETURNS
+        -------
+		(list<list<str>>) clusters:
+		    Filenames of each cluster of near-duplicates.
+        '''
+        from . import image # cv2 is only required here
+
+        srcs = np.array(
+            [os.path.join(self.datapath, filename) for filename in self.files])
+        hashes = self.map_reduce(image.map_perceptual_hash, 
+                                 multiprocess.reduce_update, 
+                                 hash_size=hash_size) or {}
+        filenames = {src: str(filename) 
+                     for src, filename in zip(srcs, self.files)}
+        unreadable = sum(src not in hashes for src in srcs)
+        if unreadable > 0:
+            print(f'|WRN| {unreadable} unreadable images skipped.')
+        clusters = [[filenames[src] for src in cluster] 
+                    for cluster in image.cluster_near_duplicates(
+                        {src: hashes[src] for src in srcs if src in hashes}, 
+                        threshold)]
+
+        if merge_groups:
+            self._merge_groups([(filename, cluster[0]) for cluster in clusters
+                                for filename in cluster[1:]])
+        if drop and clusters:
+            dropped = set(filename for cluster in clusters 
+                          for filename in cluster[1:])
+            self._keep_files(np.array([i for i, filename in enumerate(
+                self.files) if filename not in dropped], dtype=int))
+        return clusters
+
+
+    def _keep_files(self, ids):
+        '''
+        Keep only some files, with their labels, groups and metadata (if 
+        defined).
+
+        PARAMETERS
+        ----------        
+		(numpy.array<int>) ids:
+		    Indices of the files to keep.
+    
+        RETURNS
+        -------
+		None
+        '''
+        self.files = self.files[ids]
+        if self.labels is not None:
+            self.labels = self.labels[ids]
+            self.unique_labels = np.unique(self.labels
+                                           ).astype(self.str_ndarray_dtype)
+        if self.groups is not None:
+            self.groups = self.groups[ids]
+        if self.metadata is not None:
+            self.metadata = {col: values[ids] 
+                             for col, values in self.metadata.items()}
+
+
+    def _deduplicate_processes(self, packed_srcs, packed_dstdirs, func):
+        '''
+        Remove duplicates (see "find_duplicates") from distributed files, 
+        so each content is processed once, and wrap "func" to link the 
+        results of each duplicate.
+
+        PARAMETERS
+        ----------        
+		(list<list<str>>) packed_srcs:
+		    Source files absolute paths per process.
+        
+		(list<list<str>>) packed_dstdirs:
+		    Destination directories absolute paths per process.
+        
+		(function) func:
+		    Treatment that will be applied on each source file.
+
+        RETURNS
+        -------        
+		(list<list<str>>) packed_srcs:
+		    Source files absolute paths per process, without duplicates.
+        
+		(list<list<str>>) packed_dstdirs:
+		    Destination directories absolute paths per process.
+        
+		(function) func:
+		    Wrapped treatment.
+        '''
+        originals = {os.path.join(self.datapath, filename): 
+                     os.path.join(self.datapath, first) 
+                     for filename, first in self.duplicates.items()}
+        srcs = np.concatenate(packed_srcs)
+        dstdirs = np.concatenate(packed_dstdirs)
+
+        # Keep the first file met of each content, others are linked to it
+        processed = {} # content: processed source file
+        links = {}
+        keep = []
+        for i, (src, dstdir) in enumerate(zip(srcs, dstdirs)):
+            content = originals.get(src, src)
+            if content in processed:
+                links.setdefault(processed[content], []).append((src, dstdir))
+            else:
+                processed[content] = src
+                keep.append(i)
+        if not links:
+            return packed_srcs, packed_dstdirs, func
+
+        keep = np.array(keep)
+        subdirs = {dstdir: multiprocess._list_subdirs(dstdir) 
+                   for dstdir in set(dstdirs[keep])}
+        packed_srcs, packed_dstdirs = multiprocess.distribute(srcs[keep], 
+                               dstdirs[keep], self.allowed_cpus, self.seed)
+        return packed_srcs, packed_dstdirs, functools.partial(
+                    multiprocess._process_and_link_duplicates, func=func, 
+                    links=links, subdirs=subdirs)
+
+
     def _balance_dataset(self, data):
         '''
         Balance dataset so the amount of data is equal for each label.
@@ -613,6 +1252,7 @@ class DataHandler:
                 [os.path.join(dirpath, label) for label in self.labels])
         else:
             dstdirs = np.array([dirpath for _ in range(self.files.size)])
+        dstdirs = self._shard_dstdirs(dstdirs, self.files)
           
         # Take file absolute paths
         srcs = np.array(
@@ -624,6 +1264,55 @@ class DataHandler:
         return packed_srcs, packed_dstdirs
 
 
+    def _shard_dstdirs(self, dstdirs, filenames):
+        '''
+        Append the shard subdirectory of each source file to its destination 
+        directory (if "shard_depth" is positive) and create them.
+
+        PARAMETERS
+        ----------        
+		(numpy.array<str>) dstdirs:
+		    Destination directories absolute paths.
+        
+		(array/list like of str) filenames:
+		    Filenames of the source files.
+
+        RETURNS
+        -------        
+		(numpy.array<str>) dstdirs:
+		    Sharded destination directories absolute paths.
+        '''
+        if self.shard_depth <= 0:
+            return dstdirs
+        dstdirs = np.array([
+            os.path.join(dstdir, file.get_shard_subdir(filename, 
+                                                       self.shard_depth))
+            for dstdir, filename in zip(dstdirs, filenames)])
+        for dstdir in np.unique(dstdirs):
+            os.makedirs(dstdir, exist_ok=True)
+        return dstdirs
+
+
+    def _save_shard_index(self, dirpath):
+        '''
+        Save the index of sharded outputs (if "shard_depth" is positive), 
+        see "file.save_shard_index".
+
+        PARAMETERS
+        ----------        
+		(str) dirpath:
+		    Absolute path to the directory of treated files.
+    
+        RETURNS
+        -------
+		None
+        '''
+        if self.shard_depth > 0:
+            file.save_shard_index(dirpath, self.shard_depth, 
+                                  subs=(self.unique_labels 
+                                  if self.unique_labels is not None else []))
+
+
     def _distribute_datasets(self, tdstdir, vdstdir, tdata, vdata):
         '''
         Distribute files to process and split them between allowed cpus.
@@ -658,7 +1347,8 @@ class DataHandler:
                 srcs.append(os.path.join(self.datapath, filename))
                 dstdirs.append(os.path.join(dirpath, label))
         srcs = np.array(srcs)
-        dstdirs = np.array(dstdirs)
+        dstdirs = self._shard_dstdirs(np.array(dstdirs), 
+                                      list(tdata.keys()) + list(vdata.keys()))
 
         # Pack src files and directories for multiprocessing
         packed_srcs, packed_dstdirs = multiprocess.distribute(srcs, 
@@ -666,7 +1356,57 @@ class DataHandler:
         return packed_srcs, packed_dstdirs
 
 
-    def _run_processes(self, packed_srcs, packed_dstdirs, func, **kwargs):
+    def _split_processes(self, packed_srcs, packed_dstdirs, func, splitter, 
+                         **kwargs):
+        '''
+        Split distributed files into range tasks (see 
+        "multiprocess.split_into_range_tasks"), distribute tasks again 
+        balancing their costs, and wrap "func" to process range tasks.
+
+        PARAMETERS
+        ----------        
+		(list<list<str>>) packed_srcs:
+		    Source files absolute paths per process.
+        
+		(list<list<str>>) packed_dstdirs:
+		    Destination directories absolute paths per process.
+        
+		(function) func:
+		    Treatment that will be applied on each source file.
+        
+		(function) splitter:
+		    Function splitting a source file into tasks, for example 
+                "video.split_frames_into_ranges".
+
+        **kwargs:
+            Arguments to pass to the "func" function.
+
+        RETURNS
+        -------        
+		(list<list<str>>) packed_srcs:
+		    Source files absolute paths or range tasks per process.
+        
+		(list<list<str>>) packed_dstdirs:
+		    Destination directories absolute paths per process.
+        
+		(function) func:
+		    Wrapped treatment.
+        '''
+        srcs, dstdirs, costs, ranges = multiprocess.split_into_range_tasks(
+                                            np.concatenate(packed_srcs), 
+                                            np.concatenate(packed_dstdirs), 
+                                            splitter, **kwargs)
+        if not ranges:
+            return packed_srcs, packed_dstdirs, func
+
+        packed_srcs, packed_dstdirs = multiprocess.distribute_by_cost(srcs, 
+                                        dstdirs, costs, self.allowed_cpus)
+        return packed_srcs, packed_dstdirs, functools.partial(
+                    multiprocess._process_range_task, func=func, ranges=ranges)
+
+
+    def _run_processes(self, packed_srcs, packed_dstdirs, func, 
+                       stage_hooks=None, splitter=None, **kwargs):
         '''
         Run processes on the maximum amount of allowed CPUs to apply "func" 
         function to each source file.
@@ -688,15 +1428,66 @@ class DataHandler:
                 path to destination files directory "dstdir". In acutils, 
                 any function prefixed with "tmnt" is usable.
 
+		(list of hooks) stage_hooks=None:
+		    Hooks observing the stages of "func", see "profiling" module.
+
+		(function) splitter=None:
+		    If defined, splits source files into range tasks, see 
+                "_split_processes".
+
         **kwargs:
             Arguments to pass to the "func" function.
     
         RETURNS
         -------
 		None
+        
+        RAISES
+        ------
+        (RuntimeError) err: 
+            if tasks failed in a task queue (other modes raise the error of 
+            the worker).
         '''
-        multiprocess.run_processes_on_multiple_files(packed_srcs, 
-                  packed_dstdirs, func, self.allowed_cpus, **kwargs)
+        if self.duplicates:
+            packed_srcs, packed_dstdirs, func = self._deduplicate_processes(
+                                            packed_srcs, packed_dstdirs, func)
+        if splitter is not None:
+            packed_srcs, packed_dstdirs, func = self._split_processes(
+                          packed_srcs, packed_dstdirs, func, splitter, **kwargs)
+
+        if self.queuedir is not None:
+            if stage_hooks:
+                print('|WRN| stage hooks ignored with a task queue.')
+            if self.prefetch > 0:
+                print('|WRN| prefetch ignored with a task queue.')
+            taskqueue.publish_tasks(self.queuedir, 
+                  np.concatenate(packed_srcs), np.concatenate(packed_dstdirs), 
+                  func, **kwargs)
+            taskqueue.run_queue_workers(self.queuedir, self.allowed_cpus, 
+                  threads_per_worker=self.threads_per_worker, 
+                  pin_cpus=self.pin_cpus)
+            status = taskqueue.wait_queue(self.queuedir)
+            if status['failed'] > 0: # as other modes raise worker errors
+                faileddir = os.path.join(self.queuedir, 'failed')
+                first = os.path.join(faileddir, sorted(os.listdir(faileddir))[0])
+                raise RuntimeError(f"{status['failed']} tasks failed, see the "
+                                   f"first traceback in {first}")
+        elif self.straggler_factor is not None:
+            if self.pin_cpus:
+                print('|WRN| CPU pinning ignored with speculative execution.')
+            multiprocess.run_speculative_processes_on_multiple_files(
+                  np.concatenate(packed_srcs), np.concatenate(packed_dstdirs), 
+                  func, self.allowed_cpus, 
+                  straggler_factor=self.straggler_factor, 
+                  stage_hooks=stage_hooks, 
+                  threads_per_worker=self.threads_per_worker, 
+                  prefetch=self.prefetch, **kwargs)
+        else:
+            multiprocess.run_processes_on_multiple_files(packed_srcs, 
+                  packed_dstdirs, func, self.allowed_cpus, 
+                  stage_hooks=stage_hooks, 
+                  threads_per_worker=self.threads_per_worker, 
+                  pin_cpus=self.pin_cpus, prefetch=self.prefetch, **kwargs)
 
 
     def _reset_directory(self, dirpath):
@@ -713,13 +1504,17 @@ class DataHandler:
         -------
 		None
         '''
-        file.reset_directory(dirpath, subs=self.unique_labels)
+        file.reset_directory(dirpath, subs=(self.unique_labels 
+                            if self.unique_labels is not None else []), 
+                            background=self.background_reset)
 
 
-    def process(self, dirpath, func=None, empty_dir=True, **kwargs):
+    def process(self, dirpath, func=None, empty_dir=True, stage_hooks=None,
+                splitter=None, **kwargs):
         '''
         Run processes on the maximum amount of allowed CPUs to apply "func" 
-        function to each source file. If "func" is None, just copy the file.
+        function to each source file. If "func" is None, just copy the file 
+        (pass "copy_mode" to link or clone files instead, see "file.copyfile").
         "func" needs "src" and "dstdir" params (in acutils, those are 
         prefixed with "tmnt").
         **kwargs should be addionnal arguments to pass to the "func" function.
@@ -739,6 +1534,19 @@ class DataHandler:
 		    If True, reset destination directory and fill it with unique labels
                 as subdirectories if defined
 
+		(list of hooks) stage_hooks=None:
+		    Hooks observing the stages of "func" over the whole run, see 
+                "profiling" module (for example "profiling.StageTimer()").
+
+		(function) splitter=None:
+		    If defined, function splitting each source file into range 
+                tasks shared between processes, so long files don't keep a 
+                single process busy (for example 
+                "video.split_frames_into_ranges" with 
+                "video.tmnt_extract_frames_for_binary_classification"). It 
+                receives "src" and kwargs, see 
+                "multiprocess.split_into_range_tasks".
+
         **kwargs:
             Arguments to pass to the "func" function.
     
@@ -756,11 +1564,14 @@ class DataHandler:
 
         # Distribute files between CPUs and run processes
         packed_srcs, packed_dstdirs = self._distribute_data(dirpath)
-        self._run_processes(packed_srcs, packed_dstdirs, func, **kwargs)
+        self._run_processes(packed_srcs, packed_dstdirs, func, stage_hooks, 
+                            splitter, **kwargs)
+        self._save_shard_index(dirpath)
 
 
     def make_datasets(self, trainpath, valpath, tdata, vdata, func=None, 
-                      empty_dir=True, **kwargs):
+                      empty_dir=True, stage_hooks=None, splitter=None, 
+                      **kwargs):
         '''
         Run processes on the maximum amount of allowed CPUs to apply "func" 
         function to each source file.
@@ -785,12 +1596,22 @@ class DataHandler:
             Treatment that will be applied on each source file it needs an 
             absolute path to the source file "src" and absolute path to 
             destination files directory "dstdir". In acutils, any 
-            function prefixed with "tmnt" is usable.
+            function prefixed with "tmnt" is usable. If None, files are 
+            copied with "file.tmnt_copyfile_to_dir", so "copy_mode" can be 
+            passed (for example "hardlink" to avoid duplicating data).
         
 		(bool) empty_dir=True:
 		    If True, reset destination directories and fill it with unique labels 
             as subdirectories if defined.
 
+		(list of hooks) stage_hooks=None:
+		    Hooks observing the stages of "func" over the whole run, see 
+            "profiling" module (for example "profiling.StageTimer()").
+
+		(function) splitter=None:
+		    If defined, function splitting each source file into range tasks 
+            shared between processes, see "process".
+
         **kwargs: 
             Arguments to pass to the "func" function.
     
@@ -810,7 +1631,53 @@ class DataHandler:
         # Distribute files between CPUs and run processes
         packed_srcs, packed_dstdirs = self._distribute_datasets(trainpath, 
                                                     valpath, tdata, vdata)
-        self._run_processes(packed_srcs, packed_dstdirs, func, **kwargs)
+        self._run_processes(packed_srcs, packed_dstdirs, func, stage_hooks, 
+                            splitter, **kwargs)
+        self._save_shard_index(trainpath)
+        self._save_shard_index(valpath)
+
+
+    def map_reduce(self, func, reducer, finalizer=None, **kwargs):
+        '''
+        Run processes on the maximum amount of allowed CPUs to compute a 
+        result over every source file, such as dataset statistics. "func" 
+        returns a partial result per file and "reducer" merges them, inside 
+        each process then globally, without keeping per-file results.
+        "func" needs a "src" param (in acutils, those are prefixed with "map").
+        **kwargs should be addionnal arguments to pass to the "func" function.
+
+        PARAMETERS
+        ----------        
+		(function) func:
+            Function returning a partial result from an absolute path to a 
+            source file "src", for example "image.map_channel_stats" or 
+            "image.map_image_size".
+        
+		(function) reducer:
+            Function merging 2 partial results: reducer(acc, partial), for 
+            example "image.reduce_channel_stats" or 
+            "multiprocess.reduce_counts".
+        
+		(function) finalizer=None:
+            Function applied on the merged result before returning it, for 
+            example "image.finalize_channel_stats".
+
+        **kwargs: 
+            Arguments to pass to the "func" function.
+    
+        RETURNS
+        -------
+		(any) result:
+		    Merged (and finalized) result, None if there is no file.
+        '''
+        srcs = np.array(
+            [os.path.join(self.datapath, filename) for filename in self.files])
+        packed_srcs, _ = multiprocess.distribute(srcs, None, 
+                                                 self.allowed_cpus, self.seed)
+        return multiprocess.run_reduce_on_multiple_files(packed_srcs, func, 
+                  reducer, finalizer, self.allowed_cpus, 
+                  threads_per_worker=self.threads_per_worker, 
+                  pin_cpus=self.pin_cpus, **kwargs)
 
 
     def save_split(self, dst, data):
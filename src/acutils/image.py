@@ -2,15 +2,49 @@
 #  - src: absolute path to the file that will be processed (str)
 #  - dstdir: absolute path to the directory that should contain new files (str)
 # Also, nothing should be returned.
+# Functions prefixed with "map" return a partial result from "src", to be 
+# merged with "multiprocess.run_reduce_on_multiple_files".
 
+import numpy as np
 import os
 
+from . import archive
+
 try:
     import cv2
+except ImportError as err:
+    raise ImportError("You must install 'opencv-python' (cv2) to use image "
+                      "module.") from err
+
+try:
+    from PIL import Image
 except ImportError:
-    print("|WRN| You must install 'opencv-python' (cv2) to use image module. "
-          "Leaving.")
-    exit()
+    Image = None # then image sizes are read decoding images with cv2
+
+
+
+def _read_image(src, flags=cv2.IMREAD_COLOR):
+    '''
+    Load an image file with cv2, also from a member of an archive (decoded 
+    from memory, see "archive" module).
+    
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the image, or to a member inside an archive.
+    
+	(int) flags=cv2.IMREAD_COLOR:
+		cv2 reading flags.
+    
+    RETURNS
+    -------
+	(numpy.array or None) img:
+		The image, None if it can not be read.
+    '''
+    if archive.split_member_path(src)[0] is None:
+        return cv2.imread(src, flags)
+    with archive.open_source(src) as f:
+        return cv2.imdecode(np.frombuffer(f.read(), np.uint8), flags)
 
 
 
@@ -21,7 +55,8 @@ def tmnt_resize_file(src, dstdir, new_width=224, new_height=224):
     PARAMETERS
     ----------    
 	(str) src:
-		Absolute path to the file that will be processed.
+		Absolute path to the file that will be processed (or to a member 
+            inside an archive).
     
 	(str) dstdir:
 		Absolute path to the directory that should contain new files.
@@ -34,8 +69,328 @@ def tmnt_resize_file(src, dstdir, new_width=224, new_height=224):
     
     RETURNS
     -------
-	None    
+	None
+
+    RAISES
+    ------
+    (ValueError) err:
+        If the image can not be read.
     '''
-    img = cv2.imread(src)
+    img = _read_image(src)
+    if img is None:
+        raise ValueError(f"can not read {src}")
     cv2.imwrite(os.path.join(dstdir, os.path.basename(src)), 
-          cv2.resize(img, (new_height, new_width)))
\ No newline at end of file
+          cv2.resize(img, (new_height, new_width)))
+
+
+
+def map_channel_stats(src):
+    '''
+    Load image file from src and compute its per-channel statistics, to be 
+    merged with "reduce_channel_stats" then "finalize_channel_stats".
+    
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the image (or to a member inside an archive).
+    
+    RETURNS
+    -------
+	(tuple<int;numpy.array;numpy.array>) stats:
+		Amount of pixels, mean and sum of squared differences from the mean 
+            (per channel, in BGR order for color images).
+
+    RAISES
+    ------
+    (ValueError) err:
+        If the image can not be read.
+    '''
+    img = _read_image(src, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"can not read {src}")
+    pixels = img.reshape(-1, 1 if img.ndim == 2 else img.shape[2]
+                         ).astype(np.float64)
+    mean = pixels.mean(axis=0)
+    return pixels.shape[0], mean, ((pixels - mean)**2).sum(axis=0)
+
+
+
+def reduce_channel_stats(acc, partial):
+    '''
+    Merge 2 per-channel statistics from "map_channel_stats" (parallel 
+    algorithm of Chan et al., numerically stable).
+    
+    PARAMETERS
+    ----------    
+	(tuple<int;numpy.array;numpy.array>) acc:
+		Merged statistics.
+    
+	(tuple<int;numpy.array;numpy.array>) partial:
+		Statistics to merge.
+    
+    RETURNS
+    -------
+	(tuple<int;numpy.array;numpy.array>) acc:
+		Merged statistics.
+    '''
+    count_a, mean_a, m2_a = acc
+    count_b, mean_b, m2_b = partial
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    return (count, mean_a + delta*count_b/count, 
+            m2_a + m2_b + delta**2*count_a*count_b/count)
+
+
+
+def finalize_channel_stats(acc):
+    '''
+    Compute per-channel mean and standard deviation from merged statistics.
+    
+    PARAMETERS
+    ----------    
+	(tuple<int;numpy.array;numpy.array>) acc:
+		Merged statistics from "reduce_channel_stats".
+    
+    RETURNS
+    -------
+	(tuple<numpy.array;numpy.array>) mean_std:
+		Mean and standard deviation per channel.
+    '''
+    count, mean, m2 = acc
+    return mean, np.sqrt(m2/count)
+
+
+
+def map_image_size(src):
+    '''
+    Read the size of an image, to build a size histogram merging results 
+    with "multiprocess.reduce_counts". If Pillow is installed, only the 
+    header of the file is read.
+    
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the image (or to a member inside an archive).
+    
+    RETURNS
+    -------
+	(dict<tuple<int;int>;int>) counts:
+		Count of the image size (width, height), so {(width, height): 1}.
+
+    RAISES
+    ------
+    (ValueError) err:
+        If the image can not be read.
+    '''
+    if Image is not None:
+        with archive.open_source(src) as f, Image.open(f) as img:
+            return {img.size: 1}
+    img = _read_image(src, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"can not read {src}")
+    height, width = img.shape[:2]
+    return {(width, height): 1}
+
+
+
+def map_perceptual_hash(src, hash_size=8):
+    '''
+    Compute the difference hash (dHash) of an image: it is resized to 
+    (hash_size+1)x(hash_size) grayscale pixels, and each bit tells whether a 
+    pixel is brighter than its right neighbour. Near-identical images 
+    (re-scans, resized copies, consecutive frames) get hashes with a small 
+    Hamming distance.
+    
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the image (or to a member inside an archive).
+    
+	(int) hash_size=8:
+		Side of the hash, it has hash_size*hash_size bits.
+    
+    RETURNS
+    -------
+	(dict<str;int>) hashes:
+		Hash of the image, by src: {src: hash}. Empty if the image can not 
+            be read.
+    '''
+    img = _read_image(src, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        print(f"|WRN| can not read {src}, skipped.")
+        return {}
+    small = cv2.resize(img, (hash_size + 1, hash_size), 
+                       interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return {src: int(''.join('1' if bit else '0' for bit in bits), 2)}
+
+
+
+def hamming_distance(a, b):
+    '''
+    Count the different bits between 2 hashes.
+    
+    PARAMETERS
+    ----------    
+	(int) a:
+		First hash.
+    
+	(int) b:
+		Second hash.
+    
+    RETURNS
+    -------
+	(int) distance:
+		Amount of different bits.
+    '''
+    return bin(a ^ b).count('1')
+
+
+
+class BKTree:
+    '''
+    Burkhard-Keller tree indexing hashes with the Hamming distance, so 
+    searching hashes within a distance only browses a fraction of the tree 
+    (thanks to the triangle inequality) instead of every hash.
+
+    ATTRIBUTES
+    ----------
+    (list) root=None:
+        Root node as [hash, key, children], where children is a dictionary 
+            with the distance to the node as key and a child node as value.
+    
+    (int) size=0:
+        Amount of indexed hashes.
+    '''
+
+    def __init__(self):
+        '''
+        Initiate an empty BKTree.
+
+        PARAMETERS
+        ----------
+		None
+
+        RETURNS
+        -------
+		None
+        '''
+        self.root = None
+        self.size = 0
+
+
+    def add(self, value, key):
+        '''
+        Index a hash.
+
+        PARAMETERS
+        ----------
+		(int) value:
+		    Hash to index.
+        
+		(any) key:
+		    Key returned when the hash is found (a filename for example).
+
+        RETURNS
+        -------
+		None
+        '''
+        self.size += 1
+        if self.root is None:
+            self.root = [value, key, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, key, {}]
+                return
+            node = child
+
+
+    def search(self, value, threshold):
+        '''
+        Find indexed hashes within a Hamming distance of a hash.
+
+        PARAMETERS
+        ----------
+		(int) value:
+		    Searched hash.
+        
+		(int) threshold:
+		    Maximum Hamming distance (included).
+
+        RETURNS
+        -------
+		(list<tuple<any;int>>) found:
+		    Key and distance of each found hash.
+        '''
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= threshold:
+                found.append((node[1], distance))
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return found
+
+
+
+def _find_root(parents, key):
+    '''
+    Find the root of a key in a union-find forest (compressing the path).
+    
+    PARAMETERS
+    ----------    
+	(dict<any;any>) parents:
+		Parent of each key, roots are their own parent.
+    
+	(any) key:
+		Key to find the root of.
+    
+    RETURNS
+    -------
+	(any) root:
+		Root of the key.
+    '''
+    while parents[key] != key:
+        parents[key] = parents[parents[key]]
+        key = parents[key]
+    return key
+
+
+
+def cluster_near_duplicates(hashes, threshold=4):
+    '''
+    Cluster keys whose hashes are within a Hamming distance (transitively), 
+    each hash being searched into a BKTree of the previous ones.
+    
+    PARAMETERS
+    ----------    
+	(dict<any;int>) hashes:
+		Hash of each key (a filename for example).
+    
+	(int) threshold=4:
+		Maximum Hamming distance (included) between near-duplicates.
+    
+    RETURNS
+    -------
+	(list<list<any>>) clusters:
+		Clusters of near-duplicates (with at least 2 keys), in the order of 
+            "hashes" keys.
+    '''
+    parents = {key: key for key in hashes} # union-find
+    tree = BKTree()
+    for key, value in hashes.items():
+        for other, _ in tree.search(value, threshold):
+            parents[_find_root(parents, key)] = _find_root(parents, other)
+        tree.add(value, key)
+
+    clusters = {}
+    for key in hashes:
+        clusters.setdefault(_find_root(parents, key), []).append(key)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
\ No newline at end of file
@@ -1,9 +1,183 @@
+import copy
+import heapq
 import numpy as np
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from joblib import Parallel, delayed
+from joblib.externals.loky import ProcessPoolExecutor
 
+from . import file
+from . import profiling
 
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None # then only environment variables are used
 
-def _process_func_on_multiple_files(srcs, dstdirs, func, **kwargs):
+
+
+THREADS_ENV_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 
+                         'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 
+                         'NUMEXPR_NUM_THREADS']
+ATTEMPT_DIR_PREFIX = '.attempt_' # private directories of speculative attempts
+RANGE_TASK_INFIX = '#range_' # a range task of "src" is named "{src}#range_{i}"
+_WORKER_LIMITS = None # keeps worker limits alive, see "_limit_worker_threads"
+
+
+
+@contextmanager
+def limit_worker_resources(worker_index=0, threads_per_worker=None, 
+                           pin_cpus=False):
+    '''
+    Context limiting the threads spawned by the current process (OpenCV, 
+    BLAS and OpenMP, so numpy and skimage) and optionally pinning it to a 
+    CPU chosen from the worker index. Everything is restored when leaving.
+    Environment variables only affect libraries loaded after entering, 
+    "threadpoolctl" (if installed) is used for already loaded ones.
+
+    PARAMETERS
+    ----------    
+	(int) worker_index=0:
+		Index of the worker, used to choose its CPU when pinning.
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, if None nothing is limited.
+    
+	(bool) pin_cpus=False:
+		If True, pin the process to one CPU among the available ones (only 
+            on systems providing "os.sched_setaffinity", such as Linux).
+    
+    RETURNS
+    -------
+	None    
+    '''
+    old_env, old_cv2_threads, old_affinity, limiter = {}, None, None, None
+
+    if threads_per_worker is not None:
+        for variable in THREADS_ENV_VARIABLES:
+            old_env[variable] = os.environ.get(variable)
+            os.environ[variable] = str(threads_per_worker)
+        try:
+            import cv2
+            old_cv2_threads = cv2.getNumThreads()
+            cv2.setNumThreads(int(threads_per_worker))
+        except ImportError:
+            pass
+        if threadpool_limits is not None:
+            limiter = threadpool_limits(limits=int(threads_per_worker))
+
+    if pin_cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            old_affinity = os.sched_getaffinity(0)
+            cpus = sorted(old_affinity)
+            os.sched_setaffinity(0, {cpus[worker_index % len(cpus)]})
+        else:
+            print("|WRN| CPU pinning not available on this system, ignored.")
+
+    try:
+        yield
+    finally:
+        if old_affinity is not None:
+            os.sched_setaffinity(0, old_affinity)
+        if limiter is not None:
+            limiter.restore_original_limits()
+        if old_cv2_threads is not None:
+            import cv2
+            cv2.setNumThreads(old_cv2_threads)
+        for variable, value in old_env.items():
+            if value is None:
+                del os.environ[variable]
+            else:
+                os.environ[variable] = value
+
+
+
+def warm_file(src, read=False, max_bytes=None, chunk_size=1<<20):
+    '''
+    Load (the beginning of) a file into the page cache of the OS, so its 
+    next read is fast. Uses "posix_fadvise" when available, else (or if 
+    "read" is True) reads the file and discards data. Errors are ignored, 
+    warming is only a hint.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the file.
+    
+	(bool) read=False:
+		If True, really read data (more reliable on network storage, where 
+            "posix_fadvise" might do nothing).
+    
+	(int) max_bytes=None:
+		Amount of bytes to warm from the beginning, if None the full file.
+    
+	(int) chunk_size=1<<20:
+		Size of each read (bytes).
+    
+    RETURNS
+    -------
+	None    
+    '''
+    try:
+        fd = os.open(src, os.O_RDONLY)
+    except OSError:
+        return # directory or missing file, nothing to warm
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, max_bytes or 0, os.POSIX_FADV_WILLNEED)
+            if not read:
+                return
+        remaining = max_bytes if max_bytes is not None else float('inf')
+        while remaining > 0:
+            data = os.read(fd, int(min(chunk_size, remaining)))
+            if not data:
+                break
+            remaining -= len(data)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+
+def prefetch_files(srcs, depth=2, warm=warm_file):
+    '''
+    Yield each source file, while the next "depth" ones are warmed in a 
+    background thread (so reading latency overlaps with computation).
+
+    PARAMETERS
+    ----------    
+	(array/list like of str) srcs:
+		Source files absolute paths.
+    
+	(int) depth=2:
+		Amount of upcoming files being warmed.
+    
+	(function) warm=warm_file:
+		Function warming a file from its absolute path.
+    
+    RETURNS
+    -------
+	(generator of str) src:
+		Source files absolute paths, in the same order.
+    '''
+    srcs = list(srcs)
+    with ThreadPoolExecutor(max_workers=1) as warmer:
+        for src in srcs[:depth]:
+            warmer.submit(warm, src)
+        for i, src in enumerate(srcs):
+            if i + depth < len(srcs):
+                warmer.submit(warm, srcs[i + depth])
+            yield src
+
+
+
+def _process_func_on_multiple_files(srcs, dstdirs, func, stage_hooks=None, 
+                                    worker_index=0, threads_per_worker=None,
+                                    pin_cpus=False, prefetch=0, **kwargs):
     '''
     Call "func" function for each "src"/"dstdir" from "srcs"/"dstdirs".
     "func" needs "src" and "dstdir" params (in acutils, those are prefixed 
@@ -23,19 +197,58 @@ def _process_func_on_multiple_files(srcs, dstdirs, func, **kwargs):
     path to the source file "src" and absolute absolute path to destination files 
     directory "dstdir" in acutils, any function prefixed with "tmnt" is usable.
     
+	(list of hooks) stage_hooks=None:
+		Hooks installed (as fresh copies) while running "func", see 
+            "profiling.set_stage_hooks".
+    
+	(int) worker_index=0:
+		Index of the worker, see "limit_worker_resources".
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see "limit_worker_resources".
+    
+	(bool) pin_cpus=False:
+		Pin the worker to one CPU, see "limit_worker_resources".
+    
+	(int) prefetch=0:
+		Amount of upcoming source files warmed while processing the current 
+            one, see "prefetch_files".
+    
 	**kwargs: Arguments to pass to the "func" function.
     
     RETURNS
     -------
-	None    
+	(list of dict or None) reports:
+		Report of each stage hook, None if there is no hook.
     '''
-    for src, dstdir in zip(srcs, dstdirs):
-        func(src, dstdir, **kwargs)
+    if prefetch > 0:
+        srcs = prefetch_files(srcs, prefetch)
+
+    with limit_worker_resources(worker_index, threads_per_worker, pin_cpus):
+        if not stage_hooks:
+            for src, dstdir in zip(srcs, dstdirs):
+                func(src, dstdir, **kwargs)
+            return None
+
+        # Observe stages with fresh hooks, so reports only cover those files
+        hooks = [copy.deepcopy(hook) for hook in stage_hooks]
+        for hook in hooks:
+            hook.reset()
+        previous_hooks = profiling.get_stage_hooks()
+        profiling.set_stage_hooks(hooks)
+        try:
+            for src, dstdir in zip(srcs, dstdirs):
+                func(src, dstdir, **kwargs)
+        finally:
+            profiling.set_stage_hooks(previous_hooks)
+        return [hook.report() for hook in hooks]
 
 
 
 def run_processes_on_multiple_files(packed_srcs, packed_dstdirs, func, 
-                                    allowed_cpus=1, **kwargs):
+                                    allowed_cpus=1, stage_hooks=None, 
+                                    threads_per_worker=None, pin_cpus=False,
+                                    prefetch=0, **kwargs):
     '''
     Run processes on the maximum amount of allowed CPUs to apply "func" function 
     to each source file. 
@@ -60,18 +273,712 @@ def run_processes_on_multiple_files(packed_srcs, packed_dstdirs, func,
 	(int) allowed_cpus=1:
 		Maximum amount of CPUs used to compute.
     
+	(list of hooks) stage_hooks=None:
+		Hooks observing the stages of "func" (see "profiling" module), each 
+            process uses its own copies, then their reports are aggregated 
+            into those hooks calling their "update" method.
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads each worker lets OpenCV, BLAS and OpenMP 
+            spawn, if None libraries keep their defaults (1 avoids 
+            oversubscription when "allowed_cpus" is the amount of cores).
+    
+	(bool) pin_cpus=False:
+		If True, pin each worker to one CPU chosen from its index.
+    
+	(int) prefetch=0:
+		Amount of upcoming source files each worker warms (into the page 
+            cache) while processing the current one, useful on slow storage.
+    
 	**kwargs: Arguments to pass to the "func" function.
     
     RETURNS
     -------
 	None    
     '''
-    Parallel(n_jobs=allowed_cpus)(delayed(_process_func_on_multiple_files)(
+    reports = Parallel(n_jobs=allowed_cpus)(
+        delayed(_process_func_on_multiple_files)(
                 srcs = srcs,
                 dstdirs = dstdirs,
                 func = func,
+                stage_hooks = stage_hooks,
+                worker_index = i,
+                threads_per_worker = threads_per_worker,
+                pin_cpus = pin_cpus,
+                prefetch = prefetch,
+                **kwargs)
+    for i, (srcs, dstdirs) in enumerate(zip(packed_srcs, packed_dstdirs)))
+
+    # Aggregate stage reports of every process into given hooks
+    if stage_hooks:
+        for process_reports in reports:
+            for hook, report in zip(stage_hooks, process_reports):
+                hook.update(report)
+
+
+
+def _limit_worker_threads(threads_per_worker):
+    '''
+    Limit the threads of the current worker for its whole life, used as 
+    initializer of speculative workers.
+
+    PARAMETERS
+    ----------    
+	(int) threads_per_worker:
+		Maximum amount of threads per library, see "limit_worker_resources".
+    
+    RETURNS
+    -------
+	None    
+    '''
+    global _WORKER_LIMITS
+    _WORKER_LIMITS = limit_worker_resources(0, threads_per_worker)
+    _WORKER_LIMITS.__enter__()
+
+
+
+def _run_attempt(src, attemptdir, subdirs, func, stage_hooks=None, **kwargs):
+    '''
+    Apply "func" on "src", writing into a private attempt directory that 
+    mirrors the subdirectories of the real destination directory.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the source file.
+    
+	(str) attemptdir:
+		Absolute path to the private directory given as "dstdir" to "func".
+    
+	(list<str>) subdirs:
+		Relative paths of the subdirectories expected inside "dstdir".
+    
+	(function) func:
+		Treatment that will be applied on the source file.
+    
+	(list of hooks) stage_hooks=None:
+		Hooks observing the stages of "func", see "profiling" module.
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	(list of dict or None) reports:
+		Report of each stage hook, None if there is no hook.
+    '''
+    os.makedirs(attemptdir)
+    for subdir in subdirs:
+        os.makedirs(os.path.join(attemptdir, subdir), exist_ok=True)
+    return _process_func_on_multiple_files([src], [attemptdir], func, 
+                                           stage_hooks, **kwargs)
+
+
+
+def _commit_attempt(attemptdir, dstdir):
+    '''
+    Move every file written by an attempt into the destination directory, 
+    each move is atomic (same filesystem), then delete the attempt directory.
+
+    PARAMETERS
+    ----------    
+	(str) attemptdir:
+		Absolute path to the private directory of the attempt.
+    
+	(str) dstdir:
+		Absolute path to the destination directory.
+    
+    RETURNS
+    -------
+	None    
+    '''
+    for root, _, filenames in os.walk(attemptdir):
+        target = os.path.join(dstdir, os.path.relpath(root, attemptdir))
+        os.makedirs(target, exist_ok=True)
+        for filename in filenames:
+            os.replace(os.path.join(root, filename), 
+                       os.path.join(target, filename))
+    shutil.rmtree(attemptdir, ignore_errors=True)
+
+
+
+def _process_and_link_duplicates(src, dstdir, func, links, subdirs, 
+                                 **kwargs):
+    '''
+    Treatment wrapper processing a content once for all its duplicates. 
+    If "src" has duplicates, "func" writes into a private directory, then 
+    each file it wrote is hard linked (or copied if not possible) into the 
+    destination directory of each duplicate, replacing the name of "src" 
+    (without extension) with the name of the duplicate at the start of its 
+    filename. If some outputs do not start with the name of "src", their 
+    names can't be derived, so "func" is applied on each duplicate too.
+    Links of duplicates sharing the destination tree of "src" are made in 
+    the private directory, so they are committed into "dstdir" (itself an 
+    attempt directory in speculative and queue modes) with the outputs of 
+    "src". Others are staged in an attempt directory of their own 
+    destination directory, committed once every link is done.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the source file.
+    
+	(str) dstdir:
+		Absolute path to the destination directory.
+    
+	(function) func:
+		Treatment that will be applied on the source file.
+    
+	(dict<str;list<tuple<str;str>>>) links:
+		For each processed source file with duplicates, the source file and 
+            the destination directory of each duplicate.
+    
+	(dict<str;list<str>>) subdirs:
+		For each destination directory, relative paths of its subdirectories.
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	None    
+
+    RAISES
+    ------
+    (FileExistsError) err:
+        If outputs of duplicates would get the same path (for example 
+        duplicates with the same name in the same destination directory).
+    '''
+    if src not in links:
+        func(src, dstdir, **kwargs)
+        return
+
+    attemptdir = os.path.join(dstdir, f"{ATTEMPT_DIR_PREFIX}"
+                              f"{os.path.basename(src)}_{os.getpid()}")
+    _run_attempt(src, attemptdir, (subdirs[dstdir] if dstdir in subdirs 
+                                   else _list_subdirs(dstdir)), func, **kwargs)
+    realdir = (os.path.dirname(dstdir) if os.path.basename(dstdir).startswith(
+               ATTEMPT_DIR_PREFIX) else dstdir) # without an outer attempt
+    stem = os.path.splitext(os.path.basename(src))[0]
+    outputs = [os.path.relpath(os.path.join(root, name), attemptdir)
+               for root, _, filenames in os.walk(attemptdir) 
+               for name in filenames]
+    written = {os.path.join(attemptdir, output) for output in outputs}
+    linked = all(os.path.basename(output).startswith(stem) 
+                 for output in outputs)
+    if not linked:
+        print(f"|WRN| outputs of {src} are not named after it, its "
+              "duplicates are processed again.")
+    staged = {} # staging directory: destination directory of duplicates
+    try:
+        for dup_src, dup_dstdir in links[src]:
+            if not linked:
+                stagedir = os.path.join(dup_dstdir, f"{ATTEMPT_DIR_PREFIX}"
+                           f"{os.path.basename(dup_src)}_{os.getpid()}")
+                staged[stagedir] = dup_dstdir
+                _run_attempt(dup_src, stagedir, (subdirs[dup_dstdir] 
+                             if dup_dstdir in subdirs 
+                             else _list_subdirs(dup_dstdir)), func, **kwargs)
+                continue
+            relpath = os.path.relpath(dup_dstdir, realdir)
+            if relpath.split(os.sep)[0] != os.pardir: # committed with src
+                base = os.path.normpath(os.path.join(attemptdir, relpath))
+            else: # another destination tree
+                base = os.path.join(dup_dstdir, f"{ATTEMPT_DIR_PREFIX}"
+                                    f"{os.path.basename(src)}_{os.getpid()}")
+                staged[base] = dup_dstdir
+            dup_stem = os.path.splitext(os.path.basename(dup_src))[0]
+            for output in outputs:
+                dirname, filename = os.path.split(output)
+                dup_output = os.path.join(dirname, 
+                                          dup_stem + filename[len(stem):])
+                dst = os.path.join(base, dup_output)
+                if dst in written:
+                    raise FileExistsError(f"outputs of {src} and its "
+                          f"duplicate {dup_src} would both be {dup_output} "
+                          f"in {dup_dstdir}")
+                written.add(dst)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                file.copyfile(os.path.join(attemptdir, output), dst, 
+                              'hardlink')
+    except BaseException:
+        shutil.rmtree(attemptdir, ignore_errors=True)
+        for stagedir in staged:
+            shutil.rmtree(stagedir, ignore_errors=True)
+        raise
+    for stagedir, dup_dstdir in staged.items():
+        _commit_attempt(stagedir, dup_dstdir)
+    _commit_attempt(attemptdir, dstdir)
+
+
+
+def split_into_range_tasks(srcs, dstdirs, splitter, **kwargs):
+    '''
+    Split source files into tasks processing a part of them (for example
+    frame ranges of long videos, see "video.split_frames_into_ranges"), so
+    a single long file is shared between workers. Each range task is named
+    "{src}#range_{i}" and must be processed through "_process_range_task".
+    **kwargs should be the arguments to pass to the treatment, given to
+    "splitter" too.
+
+    PARAMETERS
+    ----------    
+	(array/list like of str) srcs:
+		Source files absolute paths.
+    
+	(array/list like of str) dstdirs:
+		Destination directories absolute paths.
+    
+	(function) splitter:
+		Function returning, from "src" and the treatment arguments, a list 
+            of (arguments overriding the treatment ones, cost) for each 
+            task, a file split into less than 2 tasks is processed as is.
+    
+	**kwargs: Arguments to pass to the treatment.
+    
+    RETURNS
+    -------
+	(numpy.array<str>) task_srcs:
+		Source files absolute paths, or range tasks names.
+    
+	(numpy.array<str>) task_dstdirs:
+		Destination directories absolute paths.
+    
+	(numpy.array<float>) costs:
+		Cost of each task, given by "splitter" (0 if unknown).
+    
+	(dict<str;tuple<str;dict>>) ranges:
+		For each range task, its source file and its overriding arguments.
+    '''
+    task_srcs, task_dstdirs, costs, ranges = [], [], [], {}
+    for src, dstdir in zip(srcs, dstdirs):
+        tasks = splitter(src, **kwargs)
+        if len(tasks) < 2:
+            task_srcs.append(src)
+            task_dstdirs.append(dstdir)
+            costs.append(tasks[0][1] if tasks else 0)
+            continue
+        for i, (overrides, cost) in enumerate(tasks):
+            task = f'{src}{RANGE_TASK_INFIX}{i}'
+            ranges[task] = (str(src), overrides)
+            task_srcs.append(task)
+            task_dstdirs.append(dstdir)
+            costs.append(cost)
+    return (np.array(task_srcs), np.array(task_dstdirs), 
+            np.array(costs, dtype=float), ranges)
+
+
+
+def _process_range_task(src, dstdir, func, ranges, **kwargs):
+    '''
+    Treatment wrapper processing range tasks (see "split_into_range_tasks"): 
+    "func" is called on the source file of the task, with its overriding 
+    arguments. Other source files are processed as is.
+
+    PARAMETERS
+    ----------    
+	(str) src:
+		Absolute path to the source file, or name of a range task.
+    
+	(str) dstdir:
+		Absolute path to the destination directory.
+    
+	(function) func:
+		Treatment that will be applied on the source file.
+    
+	(dict<str;tuple<str;dict>>) ranges:
+		For each range task, its source file and its overriding arguments.
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	None    
+    '''
+    if src not in ranges:
+        func(src, dstdir, **kwargs)
+        return
+    src, overrides = ranges[src]
+    func(src, dstdir, **dict(kwargs, **overrides))
+
+
+
+def distribute_by_cost(srcs, dstdirs, costs, allowed_cpus=1):
+    '''
+    Distribute files (or tasks) to process between allowed CPUs, balancing 
+    their total cost: the most costly ones are given first, each to the 
+    least loaded CPU. Each CPU then processes its most costly files first.
+
+    PARAMETERS
+    ----------    
+	(array/list like of str) srcs:
+		Source files (or tasks).
+    
+	(array/list like of str) dstdirs:
+		Destination directories.
+    
+	(array/list like of float) costs:
+		Estimated cost of each file (frames, bytes...).
+    
+	(int) allowed_cpus=1:
+		Maximum amount of CPUs used to compute.
+
+    RETURNS
+    -------    
+	(list<list<str>>) packed_srcs:
+		Source files absolute paths per process.
+    
+	(list<list<str>>) packed_dstdirs:
+		Destination directories absolute paths per process.
+    '''
+    srcs, dstdirs = np.array(srcs), np.array(dstdirs)
+    loads = [(0., i) for i in range(int(allowed_cpus))] # heap of (load, cpu)
+    packs = [[] for _ in loads]
+    for j in np.argsort(-np.asarray(costs, dtype=float), kind='stable'):
+        load, i = heapq.heappop(loads)
+        packs[i].append(j)
+        heapq.heappush(loads, (load + costs[j], i))
+
+    packs = [np.array(ids, dtype=int) for ids in packs if ids]
+    return [srcs[ids] for ids in packs], [dstdirs[ids] for ids in packs]
+
+
+
+def _list_subdirs(dirpath):
+    '''
+    List the subdirectories (recursively) of a directory, ignoring attempt
+    directories.
+
+    PARAMETERS
+    ----------    
+	(str) dirpath:
+		Absolute path to the directory.
+    
+    RETURNS
+    -------
+	(list<str>) subdirs:
+		Relative paths of the subdirectories.
+    '''
+    subdirs = []
+    dirpath = str(dirpath) # numpy strings would be walked as bytes
+    for root, dirnames, _ in os.walk(dirpath):
+        dirnames[:] = [name for name in dirnames 
+                       if not name.startswith(ATTEMPT_DIR_PREFIX)]
+        subdirs.extend(os.path.relpath(os.path.join(root, name), dirpath) 
+                       for name in dirnames)
+    return subdirs
+
+
+
+def run_speculative_processes_on_multiple_files(srcs, dstdirs, func, 
+        allowed_cpus=1, straggler_factor=4., min_completed=8, 
+        poll_interval=0.2, stage_hooks=None, threads_per_worker=None, 
+        prefetch=0, **kwargs):
+    '''
+    Run processes on the maximum amount of allowed CPUs to apply "func" 
+    function to each source file, scheduling files one by one. Once workers 
+    become idle (no more file waiting), any file running "straggler_factor" 
+    times longer than the median duration is launched again on an idle 
+    worker, and the first attempt to finish wins. Each attempt writes into 
+    its own hidden directory inside "dstdir", then the winner files are 
+    atomically moved into "dstdir", so duplicates can't corrupt results. 
+    Remaining attempts are killed at the end.
+    "func" needs "src" and "dstdir" params (in acutils, those are prefixed 
+    with "tmnt"), it must be picklable (not a lambda) and should only write 
+    inside "dstdir". 
+    **kwargs should be addionnal arguments to pass to the "func" function.
+
+    PARAMETERS
+    ----------    
+	(array/list like of str) srcs:
+		Source files absolute paths.
+    
+	(array/list like of str) dstdirs:
+		Destination directories absolute paths.
+    
+	(function) func:
+		Treatment that will be applied on each source file, see 
+            "run_processes_on_multiple_files".
+    
+	(int) allowed_cpus=1:
+		Maximum amount of CPUs used to compute.
+    
+	(float) straggler_factor=4.:
+		A file is a straggler if it runs longer than this factor times the 
+            median duration of completed files.
+    
+	(int) min_completed=8:
+		Amount of completed files required before detecting stragglers.
+    
+	(float) poll_interval=0.2:
+		Seconds between checks for stragglers.
+    
+	(list of hooks) stage_hooks=None:
+		Hooks observing the stages of "func" (see "profiling" module), the 
+            reports of every finished attempt are aggregated into them.
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see "limit_worker_resources".
+    
+	(int) prefetch=0:
+		Amount of upcoming source files warmed (into the page cache, shared 
+            by workers) from this process, see "warm_file".
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	None    
+    '''
+    srcs, dstdirs = list(srcs), list(dstdirs)
+    subdirs = {dstdir: _list_subdirs(dstdir) for dstdir in set(dstdirs)}
+    # A private executor, so joblib's shared one is left intact for later jobs
+    executor = ProcessPoolExecutor(max_workers=allowed_cpus, 
+                                   initializer=_limit_worker_threads, 
+                                   initargs=(threads_per_worker,))
+
+    pending = list(range(len(srcs)))[::-1] # popped from the end
+    running = {} # future: (file index, start time, attempt directory)
+    attempts = [0 for _ in srcs]
+    completed = set()
+    durations = []
+    warmer = ThreadPoolExecutor(max_workers=1) if prefetch > 0 else None
+    warmed = set()
+
+    try:
+        while len(completed) < len(srcs):
+            # Keep workers busy with waiting files, then with stragglers
+            selected = []
+            while len(running) + len(selected) < allowed_cpus and pending:
+                selected.append(pending.pop())
+            if (len(running) + len(selected) < allowed_cpus 
+                and len(durations) >= min_completed):
+                limit = straggler_factor * np.median(durations)
+                now = time.perf_counter()
+                for i, start, _ in sorted(running.values(), key=lambda x: x[1]):
+                    if len(running) + len(selected) >= allowed_cpus:
+                        break
+                    if attempts[i] == 1 and now - start > limit:
+                        selected.append(i)
+            for i in selected:
+                attempts[i] += 1
+                attemptdir = os.path.join(dstdirs[i], f"{ATTEMPT_DIR_PREFIX}"
+                                          f"{i}_{attempts[i]}_{os.getpid()}")
+                future = executor.submit(_run_attempt, srcs[i], attemptdir, 
+                            subdirs[dstdirs[i]], func, stage_hooks, **kwargs)
+                running[future] = (i, time.perf_counter(), attemptdir)
+            if warmer is not None:
+                for i in pending[::-1][:prefetch]:
+                    if i not in warmed:
+                        warmed.add(i)
+                        warmer.submit(warm_file, srcs[i])
+
+            # Commit the first finished attempt of each file
+            finished, _ = wait(list(running), timeout=poll_interval, 
+                               return_when=FIRST_COMPLETED)
+            for future in finished:
+                i, start, attemptdir = running.pop(future)
+                duplicated = any(j == i for j, _, _ in running.values())
+                if i in completed:
+                    shutil.rmtree(attemptdir, ignore_errors=True)
+                    continue
+                try:
+                    reports = future.result()
+                except Exception:
+                    shutil.rmtree(attemptdir, ignore_errors=True)
+                    if duplicated:
+                        continue # the other attempt might succeed
+                    raise
+                _commit_attempt(attemptdir, dstdirs[i])
+                completed.add(i)
+                durations.append(time.perf_counter() - start)
+                if stage_hooks:
+                    for hook, report in zip(stage_hooks, reports):
+                        hook.update(report)
+    finally:
+        # Kill losing attempts, then delete their directories
+        executor.shutdown(wait=True, kill_workers=bool(running))
+        for _, _, attemptdir in running.values():
+            shutil.rmtree(attemptdir, ignore_errors=True)
+        if warmer is not None:
+            warmer.shutdown(wait=False)
+
+
+
+def _reduce_func_on_multiple_files(srcs, func, reducer, worker_index=0, 
+                                   threads_per_worker=None, pin_cpus=False, 
+                                   **kwargs):
+    '''
+    Call "func" function for each "src" from "srcs" and merge its partial 
+    results, one after another, using "reducer".
+    **kwargs should be addionnal arguments to pass to the "func" function.
+
+    PARAMETERS
+    ----------    
+	(array/list like of str) srcs:
+		Source file of each process.
+    
+	(function) func:
+		Function returning a partial result from an absolute path to a 
+            source file "src".
+    
+	(function) reducer:
+		Function merging 2 partial results into one: reducer(acc, partial).
+    
+	(int) worker_index=0:
+		Index of the worker, see "limit_worker_resources".
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see "limit_worker_resources".
+    
+	(bool) pin_cpus=False:
+		Pin the worker to one CPU, see "limit_worker_resources".
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	(any) acc:
+		Merged partial results, None if "srcs" is empty.
+    '''
+    acc = None
+    with limit_worker_resources(worker_index, threads_per_worker, pin_cpus):
+        for src in srcs:
+            partial = func(src, **kwargs)
+            acc = partial if acc is None else reducer(acc, partial)
+    return acc
+
+
+
+def run_reduce_on_multiple_files(packed_srcs, func, reducer, finalizer=None,
+                                 allowed_cpus=1, threads_per_worker=None, 
+                                 pin_cpus=False, **kwargs):
+    '''
+    Run processes on the maximum amount of allowed CPUs to compute a result 
+    over every source file (map-reduce). "func" returns a partial result per 
+    file, each process merges its partial results as soon as they come using 
+    "reducer", then the results of the processes are merged the same way. 
+    Thus, no per-file result is held in memory.
+    "func" needs a "src" param (in acutils, those are prefixed with "map").
+    **kwargs should be addionnal arguments to pass to the "func" function.
+
+    PARAMETERS
+    ----------    
+	(list<list<str>>) packed_srcs:
+		Source files absolute paths per process.
+    
+	(function) func:
+		Function returning a partial result from an absolute path to a 
+            source file "src", for example "image.map_channel_stats".
+    
+	(function) reducer:
+		Function merging 2 partial results into one: reducer(acc, partial), 
+            for example "reduce_sum", "reduce_counts" or 
+            "image.reduce_channel_stats".
+    
+	(function) finalizer=None:
+		Function applied on the merged result before returning it, for 
+            example "image.finalize_channel_stats".
+    
+	(int) allowed_cpus=1:
+		Maximum amount of CPUs used to compute.
+    
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see "limit_worker_resources".
+    
+	(bool) pin_cpus=False:
+		If True, pin each worker to one CPU chosen from its index.
+    
+	**kwargs: Arguments to pass to the "func" function.
+    
+    RETURNS
+    -------
+	(any) result:
+		Merged (and finalized) result, None if there is no source file.
+    '''
+    partials = Parallel(n_jobs=allowed_cpus)(
+        delayed(_reduce_func_on_multiple_files)(
+                srcs = srcs,
+                func = func,
+                reducer = reducer,
+                worker_index = i,
+                threads_per_worker = threads_per_worker,
+                pin_cpus = pin_cpus,
                 **kwargs)
-    for srcs, dstdirs in zip(packed_srcs, packed_dstdirs))
+    for i, srcs in enumerate(packed_srcs))
+
+    acc = None
+    for partial in partials:
+        if partial is not None:
+            acc = partial if acc is None else reducer(acc, partial)
+    if finalizer is not None and acc is not None:
+        return finalizer(acc)
+    return acc
+
+
+
+def reduce_sum(acc, partial):
+    '''
+    Reducer adding partial results (numbers or numpy arrays).
+
+    PARAMETERS
+    ----------    
+	(number or numpy.array) acc:
+		Merged partial results.
+    
+	(number or numpy.array) partial:
+		Partial result to merge.
+
+    RETURNS
+    -------    
+	(number or numpy.array) acc:
+		Merged partial results.
+    '''
+    return acc + partial
+
+
+
+def reduce_update(acc, partial):
+    '''
+    Reducer merging dictionaries (values of partial win).
+
+    PARAMETERS
+    ----------    
+	(dict) acc:
+		Merged dictionaries, updated in place.
+    
+	(dict) partial:
+		Dictionary to merge.
+
+    RETURNS
+    -------    
+	(dict) acc:
+		Merged dictionaries.
+    '''
+    acc.update(partial)
+    return acc
+
+
+
+def reduce_counts(acc, partial):
+    '''
+    Reducer adding counts stored in dictionaries (a missing key counts 0), 
+    useful to build histograms (of labels, image sizes...).
+
+    PARAMETERS
+    ----------    
+	(dict<any;int>) acc:
+		Merged counts, updated in place.
+    
+	(dict<any;int>) partial:
+		Counts to merge.
+
+    RETURNS
+    -------    
+	(dict<any;int>) acc:
+		Merged counts.
+    '''
+    for key, count in partial.items():
+        acc[key] = acc.get(key, 0) + count
+    return acc
 
 
 
@@ -86,7 +993,7 @@ def distribute(srcs, dstdirs, allowed_cpus=1, seed=871):
 		Source files.
     
 	(array/list like of str) dstdirs:
-		Destination directories.
+		Destination directories, might be None if not needed.
     
 	(int) allowed_cpus=1:
 		Maximum amount of CPUs used to compute.
@@ -100,12 +1007,13 @@ def distribute(srcs, dstdirs, allowed_cpus=1, seed=871):
 		Source files absolute paths per process.
     
 	(list<list<str>>) packed_dstdirs:
-		Destination directories absolute paths per process.
+		Destination directories absolute paths per process (None if 
+            "dstdirs" is None).
     '''
     # Use numpy arrays to select with indices
     if type(srcs) is not np.array:
         srcs = np.array(srcs)
-    if type(dstdirs) is not np.array:
+    if dstdirs is not None and type(dstdirs) is not np.array:
         dstdirs = np.array(dstdirs)
 
     # Split srcs and dstdirs between allowed CPUs (to return this as lists)
@@ -116,6 +1024,7 @@ def distribute(srcs, dstdirs, allowed_cpus=1, seed=871):
         np.random.shuffle(ids)
         if ids.size > 0:
           packed_srcs.append(srcs[ids])
-          packed_dstdirs.append(dstdirs[ids])
+          if dstdirs is not None:
+              packed_dstdirs.append(dstdirs[ids])
       
-    return packed_srcs, packed_dstdirs
\ No newline at end of file
+    return packed_srcs, (packed_dstdirs if dstdirs is not None else None)
\ No newline at end of file
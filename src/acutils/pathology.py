@@ -9,63 +9,92 @@ import os
 
 try:
     import cv2
-except ImportError:
-    print("|WRN| You must install 'opencv-python' (cv2) to use pathology module. "
-          "Leaving.")
-    exit()
+except ImportError as err:
+    raise ImportError("You must install 'opencv-python' (cv2) to use "
+                      "pathology module.") from err
 
 try:
     from openslide import OpenSlide
-except ImportError:
-    print("|WRN| You must install 'openslide-python' to use pathology module. "
-          "Be careful, it also requires Openslide installation on your computer"
-          ", the 'openslide-python' Python library is just a mapping. Leaving.")
-    exit()
+except ImportError as err:
+    raise ImportError("You must install 'openslide-python' to use pathology "
+                      "module. Be careful, it also requires Openslide "
+                      "installation on your computer, the 'openslide-python' "
+                      "Python library is just a mapping.") from err
 
 try:
     from PIL import Image
-except ImportError:
-    print("|WRN| You must install 'Pillow' to use pathology module. "
-          "Leaving.")
-    exit()
+except ImportError as err:
+    raise ImportError("You must install 'Pillow' to use pathology module."
+                      ) from err
     
 try:
     from skimage.io import imread, imsave
     from skimage.data import skin as skimgskin
-except ImportError:
-    print("|WRN| You must install 'scikit-image' to use pathology module. "
-          "You might need a skimage optinal dependencie: 'pooch'. Leaving.")
-    exit()
+except ImportError as err:
+    raise ImportError("You must install 'scikit-image' to use pathology "
+                      "module. You might need a skimage optinal dependencie: "
+                      "'pooch'.") from err
 
+from . import archive
 from . import gpu
+from . import profiling
 
 Image.MAX_IMAGE_PIXELS = None
 import numpy as aunp
 import skimage as auski
-gpu.set_gpu_computation() # if True import cucim.skimage as auski and cupy as aunp
+
+# The reference image (and its stains) used by "harmonize" are computed on 
+# first use (see "_load_ref_image"), so importing this module stays fast.
+_REF_NAMES = ['IHC_REF_IMAGE', 'IHC_H_REF', 'IHC_E_REF', 'IHC_D_REF']
+_REF_IMAGE_PATH = None # None for skimage.data.skin()
 
 
 
 def update_ref_image(img_path=None):
     '''
     Change reference image using when calling harmonize function.
+    The reference is loaded (and its stains computed) on the next call of 
+    harmonize, once per process.
     If you called `gpu.set_gpu_computation(activate=True)`, calling will load
     the image on the GPU (using cupy instead of numpy).
     
     PARAMETERS
     ----------    
 	(str) img_path=None:
-		Absolute path to the image that will be the reference to harmonize.
+		Absolute path to the image that will be the reference to harmonize, 
+            if None the current one is kept (skimage.data.skin() by default).
+    
+    RETURNS
+    -------
+	None    
+    '''
+    global _REF_IMAGE_PATH
+    if img_path is not None:
+        _REF_IMAGE_PATH = img_path
+    for name in _REF_NAMES: # computed again on next use
+        globals().pop(name, None)
+
+
+
+def _load_ref_image():
+    '''
+    Load the reference image of harmonize function and compute its stains, 
+    stored as module attributes (IHC_REF_IMAGE, IHC_H_REF, IHC_E_REF and 
+    IHC_D_REF).
+    
+    PARAMETERS
+    ----------    
+	None
     
     RETURNS
     -------
 	None    
     '''
     global IHC_REF_IMAGE, IHC_H_REF, IHC_E_REF, IHC_D_REF
-    if img_path is None:
-        IHC_REF_IMAGE = aunp.array(IHC_REF_IMAGE) # for switching from CPU to GPU
+    if _REF_IMAGE_PATH is None:
+        IHC_REF_IMAGE = aunp.array(skimgskin()) # might need to download it
     else:
-        IHC_REF_IMAGE = aunp.array(imread(img_path))
+        IHC_REF_IMAGE = aunp.array(imread(_REF_IMAGE_PATH))
     
     ihc_hed = (auski.color.rgb2hed(IHC_REF_IMAGE))
     null = aunp.zeros_like(ihc_hed[:, :, 0])
@@ -78,8 +107,29 @@ def update_ref_image(img_path=None):
 
 
 
-IHC_REF_IMAGE = skimgskin()
-update_ref_image() # default ref image is skimage.data.skin()
+def __getattr__(name):
+    '''
+    Compute reference attributes (such as IHC_REF_IMAGE) on first access.
+    
+    PARAMETERS
+    ----------    
+	(str) name:
+		Name of the missing module attribute.
+    
+    RETURNS
+    -------
+	(any) value:
+		Value of the attribute.
+    
+    RAISES
+    ------
+    (AttributeError) err:
+        If the attribute does not exist.
+    '''
+    if name in _REF_NAMES:
+        _load_ref_image()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 
@@ -107,6 +157,8 @@ def harmonize(img):
             Academy of Cytology [and] American Society of Cytology, vol. 23, no. 4, 
             pp. 291-9, Aug. 2001.
     '''
+    if 'IHC_D_REF' not in globals(): # first call of this process
+        _load_ref_image()
     ihc_hed = (auski.color.rgb2hed(img))
     null = aunp.zeros_like(ihc_hed[:, :, 0])
 
@@ -146,7 +198,8 @@ def tmnt_harmonize(src, dstdir):
     -------
 	None    
     '''
-    img = harmonize(aunp.array(imread(src)))
+    with archive.source_path(src) as path: # extracted from an archive
+        img = harmonize(aunp.array(imread(path)))
     imsave(os.path.join(dstdir, os.path.basename(src)), 
             gpu.cupy_to_numpy(img), check_contrast=False)
 
@@ -280,7 +333,9 @@ def browse_segments(slide, bw, lvl=0, required_area=10000, do_harmonize=False):
     new_width, new_height = bw.shape[1], bw.shape[0] # for preview
     xresolution = width / new_width
     yresolution = height / new_height
-    for region in auski.measure.regionprops(auski.measure.label(bw)):
+    regions = profiling.run_stage('regionprops', auski.measure.regionprops, 
+                                  auski.measure.label(bw))
+    for region in regions:
         x, y = region.bbox[:2]
         w, h = region.bbox[2] - x, region.bbox[3] - y
         if w*h > required_area:
@@ -289,13 +344,13 @@ def browse_segments(slide, bw, lvl=0, required_area=10000, do_harmonize=False):
             w = int(w*xresolution)
             h = int(h*yresolution)
             segment_mask = auski.transform.resize(region.image, (w,h))
+            segment = aunp.array(np.array(profiling.run_stage('read_region', 
+                    slide.read_region, (y,x), 0, (h, w)), dtype=aunp.uint8
+                    )[:,:,:3])
             if do_harmonize:
-                segment = harmonize(aunp.array(np.array(slide.read_region(
-                    (y,x), 0, (h, w)), dtype=aunp.uint8)[:,:,:3]))
-            else:
-                segment = aunp.array(np.array(slide.read_region(
-                    (y,x), 0, (h, w)), dtype=aunp.uint8)[:,:,:3])
-            yield gpu.cupy_to_numpy(mask_rgb(rgb=segment, mask=segment_mask))
+                segment = profiling.run_stage('harmonize', harmonize, segment)
+            yield gpu.cupy_to_numpy(profiling.run_stage('mask_rgb', mask_rgb, 
+                                            rgb=segment, mask=segment_mask))
 
 
 
@@ -330,7 +385,8 @@ def load_slice_preview_and_ext(src, lvl, divider=None, device=None):
     '''
     gpu.select_device(device)
     slide = OpenSlide(src)
-    preview = get_preview(slide, lvl, divider)
+    preview = profiling.run_stage('get_preview', get_preview, slide, lvl, 
+                                  divider)
     _, slide_ext = os.path.splitext(src)
     return slide, preview, slide_ext
 
@@ -364,7 +420,9 @@ def tmnt_save_preview_from_slide(src, dstdir, lvl, divider=None, ext="png", devi
     -------
 	None    
     '''
-    _, preview, slide_ext = load_slice_preview_and_ext(src, lvl, divider, device)
+    with archive.source_path(src) as path: # extracted from an archive
+        _, preview, slide_ext = load_slice_preview_and_ext(path, lvl, divider, 
+                                                           device)
     imsave(os.path.join(dstdir, f"{os.path.basename(src)[:-len(slide_ext)]}.{ext}"), 
                     gpu.cupy_to_numpy(preview), check_contrast=False)
 
@@ -374,6 +432,8 @@ def tmnt_save_segments_from_slide(src, dstdir, lvlpreview, lvlsegment, fpval, si
                                   do_harmonize=False, divider=None, ext="png", device=None):
     '''
     Find slices inside the slide and save them.
+    Its stages (get_preview, get_cleaned_binary, regionprops, read_region, 
+    harmonize, mask_rgb and imsave) can be observed with "profiling" hooks.
     
     PARAMETERS
     ----------    
@@ -411,12 +471,16 @@ def tmnt_save_segments_from_slide(src, dstdir, lvlpreview, lvlsegment, fpval, si
     -------
 	None    
     '''
-    slide, preview, slide_ext = load_slice_preview_and_ext(src, lvlpreview, divider, device)
-    bw = get_cleaned_binary(preview, fpval, sigma)
-    for i, segment in enumerate(browse_segments(slide, bw, lvlsegment, do_harmonize=do_harmonize)):
-        imsave(os.path.join(dstdir, 
-                f"{os.path.basename(src)[:-len(slide_ext)]}_{i}.{ext}"), segment,
-                check_contrast=False)
+    with archive.source_path(src) as path: # extracted from an archive
+        slide, preview, slide_ext = load_slice_preview_and_ext(path, 
+                                        lvlpreview, divider, device)
+        bw = profiling.run_stage('get_cleaned_binary', get_cleaned_binary, 
+                                 preview, fpval, sigma)
+        for i, segment in enumerate(browse_segments(slide, bw, lvlsegment, 
+                                                    do_harmonize=do_harmonize)):
+            profiling.run_stage('imsave', imsave, os.path.join(dstdir, 
+                    f"{os.path.basename(src)[:-len(slide_ext)]}_{i}.{ext}"), 
+                    segment, check_contrast=False)
 
 
 
@@ -483,7 +547,8 @@ def tmnt_save_tiles_from_segment(src, dstdir, size=512, blank_tol=0.35, ext="png
     -------
 	None    
     '''
-    segment = np.array(imread(src))
+    with archive.source_path(src) as path: # extracted from an archive
+        segment = np.array(imread(path))
     _, segment_ext = os.path.splitext(src)
     for i, (coords,tile) in enumerate(
       browse_tiles(segment, size=size, blank_tol=blank_tol)):
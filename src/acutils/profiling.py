@@ -0,0 +1,305 @@
+import copy
+import time
+import tracemalloc
+
+
+
+_STAGE_HOOKS = [] # installed hooks, when empty stages are called directly
+
+
+
+class StageTimer:
+    '''
+    Stage hook measuring the time spent inside each stage.
+
+    ATTRIBUTES
+    ----------
+    (dict<str;dict<str;float>>) stats:
+        For each stage, its "count", "total" and "max" durations (seconds).
+    '''
+
+    def __init__(self):
+        '''
+        Initiate StageTimer instance with empty statistics.
+
+        PARAMETERS
+        ----------
+		None
+
+        RETURNS
+        -------
+		None
+        '''
+        self.stats = {}
+        self._starts = []
+
+
+    def start(self, stage):
+        '''
+        Called by "run_stage" right before the stage is computed.
+
+        PARAMETERS
+        ----------
+		(str) stage:
+		    Name of the stage.
+
+        RETURNS
+        -------
+		None
+        '''
+        self._starts.append(time.perf_counter())
+
+
+    def end(self, stage):
+        '''
+        Called by "run_stage" right after the stage is computed.
+
+        PARAMETERS
+        ----------
+		(str) stage:
+		    Name of the stage.
+
+        RETURNS
+        -------
+		None
+        '''
+        duration = time.perf_counter() - self._starts.pop()
+        stats = self.stats.setdefault(stage, {'count': 0, 'total': 0.,
+                                              'max': 0.})
+        stats['count'] += 1
+        stats['total'] += duration
+        stats['max'] = max(stats['max'], duration)
+
+
+    def report(self):
+        '''
+        Return a copy of the statistics of each stage.
+
+        PARAMETERS
+        ----------
+		None
+
+        RETURNS
+        -------
+		(dict<str;dict<str;float>>) report:
+		    For each stage, its "count", "total" and "max" durations (seconds).
+        '''
+        return copy.deepcopy(self.stats)
+
+
+    def update(self, report):
+        '''
+        Aggregate a report (from another process for example) into statistics.
+
+        PARAMETERS
+        ----------
+		(dict<str;dict<str;float>>) report:
+		    Report returned by the "report" method of another StageTimer.
+
+        RETURNS
+        -------
+		None
+        '''
+        for stage, other in report.items():
+            stats = self.stats.setdefault(stage, {'count': 0, 'total': 0.,
+                                                  'max': 0.})
+            stats['count'] += other['count']
+            stats['total'] += other['total']
+            stats['max'] = max(stats['max'], other['max'])
+
+
+    def reset(self):
+        '''
+        Forget every recorded statistic.
+
+        PARAMETERS
+        ----------
+		None
+
+        RETURNS
+        -------
+		None
+        '''
+        self.stats = {}
+        self._starts = []
+
+
+
+class StageMemory(StageTimer):
+    '''
+    Stage hook measuring the peak of memory allocated inside each stage.
+    It relies on "tracemalloc", so only Python and numpy allocations are
+    traced (not the ones made by C libraries such as Openslide, nor the GPU).
+    If the hook starts tracing, it stops it when the outermost stage ends, so
+    nothing is traced outside stages.
+    If stages are nested, the peak of the outer stage might be underestimated.
+
+    ATTRIBUTES
+    ----------
+    (dict<str;dict<str;float>>) stats:
+        For each stage, its "count", "total" and "max" peaks (bytes).
+    '''
+
+    def __init__(self):
+        '''
+        Initiate StageMemory instance with empty statistics.
+
+        PARAMETERS
+        ----------
+		None
+
+        RETURNS
+        -------
+		None
+        '''
+        super().__init__()
+        self._tracing = False # True if tracing was started by this hook
+
+
+    def start(self, stage):
+        '''
+        Called by "run_stage" right before the stage is computed, starts
+        tracing memory allocations if not already done.
+
+        PARAMETERS
+        ----------
+		(str) stage:
+		    Name of the stage.
+
+        RETURNS
+        -------
+		None
+        '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if hasattr(tracemalloc, 'reset_peak'): # python >= 3.9
+            tracemalloc.reset_peak()
+        self._starts.append(tracemalloc.get_traced_memory()[0])
+
+
+    def end(self, stage):
+        '''
+        Called by "run_stage" right after the stage is computed.
+
+        PARAMETERS
+        ----------
+		(str) stage:
+		    Name of the stage.
+
+        RETURNS
+        -------
+		None
+        '''
+        peak = max(0, tracemalloc.get_traced_memory()[1] - self._starts.pop())
+        stats = self.stats.setdefault(stage, {'count': 0, 'total': 0.,
+                                              'max': 0.})
+        stats['count'] += 1
+        stats['total'] += peak
+        stats['max'] = max(stats['max'], peak)
+        if not self._starts and self._tracing:
+            tracemalloc.stop() # outermost stage ended
+            self._tracing = False
+
+
+
+def set_stage_hooks(hooks=None):
+    '''
+    Install hooks called around each stage computed through "run_stage".
+    A hook is any object with "start(stage)" and "end(stage)" methods,
+    "report()", "update(report)" and "reset()" are also required to use it
+    with "multiprocess.run_processes_on_multiple_files".
+
+    PARAMETERS
+    ----------
+	(list of hooks) hooks=None:
+		Hooks to install, if None or empty, stages are no longer observed.
+
+    RETURNS
+    -------
+	None
+    '''
+    global _STAGE_HOOKS
+    _STAGE_HOOKS = [] if hooks is None else list(hooks)
+
+
+
+def get_stage_hooks():
+    '''
+    Return the hooks currently installed.
+
+    PARAMETERS
+    ----------
+	None
+
+    RETURNS
+    -------
+	(list of hooks) hooks:
+		Installed hooks.
+    '''
+    return list(_STAGE_HOOKS)
+
+
+
+def run_stage(stage, func, *args, **kwargs):
+    '''
+    Call "func" with given arguments, surrounded by installed hooks.
+    If no hook is installed, "func" is directly called.
+
+    PARAMETERS
+    ----------
+	(str) stage:
+		Name of the stage.
+
+	(function) func:
+		Function computing the stage.
+
+	*args, **kwargs: Arguments to pass to the "func" function.
+
+    RETURNS
+    -------
+	(any) result:
+		What "func" returns.
+    '''
+    if not _STAGE_HOOKS:
+        return func(*args, **kwargs)
+
+    hooks = _STAGE_HOOKS
+    for hook in hooks:
+        hook.start(stage)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        for hook in reversed(hooks):
+            hook.end(stage)
+
+
+
+def format_stage_report(report, unit="s"):
+    '''
+    Format a report (from a hook "report" method) as a table, ordered by
+    descending total.
+
+    PARAMETERS
+    ----------
+	(dict<str;dict<str;float>>) report:
+		For each stage, its "count", "total" and "max" values.
+
+	(str) unit="s":
+		Unit of the values, only used for display.
+
+    RETURNS
+    -------
+	(str) table:
+		Formatted report.
+    '''
+    lines = [f"{'stage':<20}{'count':>10}{'total':>14}{'mean':>14}"
+             f"{'max':>14}{'share':>8}"]
+    overall = sum(stats['total'] for stats in report.values()) or 1
+    for stage, stats in sorted(report.items(), key=lambda x: -x[1]['total']):
+        mean = stats['total'] / max(stats['count'], 1)
+        lines.append(f"{stage:<20}{stats['count']:>10}"
+                     f"{stats['total']:>12.3f}{unit:>2}{mean:>12.3f}{unit:>2}"
+                     f"{stats['max']:>12.3f}{unit:>2}"
+                     f"{100*stats['total']/overall:>7.1f}%")
+    return '\n'.join(lines)
@@ -3,17 +3,32 @@
 #  - dstdir: absolute path to the directory that should contain new files (str)
 # Also, nothing should be returned.
 
+import hashlib
+import numpy as np
+import os
 import pandas as pd
+import uuid
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None # parquet files are not streamed
+
+
+
+# Parsed sheets are cached there, keyed by path, size and modification time
+SHEET_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'acutils', 
+                               'sheets')
+CACHED_EXTENSIONS = ['csv', 'txt', 'xls', 'xlsx', 'sas7bdat', 'stata']
 
 
 
-# @TODO Maybe update functions using df.isin() for masks.
 def delete_clueless_rows(df, clueless_words=None, columns=None, inplace=False):
     '''
     Delete rows of a Pandas DataFrame based on the values in clueless_words.
-    Delete each row that have any empty cell or any cell that contain a 
-    clueless_word. If columns argument is specified, only those columns 
-    will be concerned.
+    Delete each row that have any empty cell (None or NaN) or any cell that 
+    contain a clueless_word. If columns argument is specified, only those 
+    columns will be concerned. Computed column by column (vectorized).
     
     PARAMETERS
     ----------    
@@ -41,29 +56,226 @@ def delete_clueless_rows(df, clueless_words=None, columns=None, inplace=False):
         columns = df.columns
 
     # Create a mask that is True for rows that should be retained
-    mask = df[columns].map(
-        lambda x: x not in clueless_words and x is not None)
+    clueless_words = list(set(clueless_words))
+    mask = np.ones(len(df), dtype=bool)
+    for col in columns:
+        values = df[col]
+        mask &= ~(values.isna() | values.isin(clueless_words)).to_numpy()
 
     # If inplace is True, update the DataFrame in place
     if inplace:
-        df.drop(df[~mask].index, inplace=True)
+        df.drop(df.index[~mask], inplace=True)
     else:  # Otherwise, return a filtered copy of the DataFrame
         return df[mask]
 
 
 
+def _get_cache_paths(sheetpath, cache_dir, dtype=None, columns=None):
+    '''
+    Get the cache files paths of a sheet, from its path, its fingerprint 
+    (size and modification time), the data types it was parsed with (types 
+    change the parsed values, like leading zeros of str ids) and its parsed 
+    columns.
+
+    PARAMETERS
+    ----------    
+	(str) sheetpath:
+		Absolute path of the sheet.
+    
+	(str) cache_dir:
+		Absolute path to the cache directory.
+    
+	(dict<str;type>) dtype=None:
+		Data type of some columns given to the parser.
+    
+	(list<str>) columns=None:
+		Parsed columns (whatever their order), if None all of them.
+
+    RETURNS
+    -------    
+	(str) prefix:
+		Prefix of every cache file of this sheet (whatever its fingerprint).
+    
+	(str) version:
+		Prefix of the cache files of the current fingerprint (whatever 
+            their data types and columns).
+    
+	(list<str>) paths:
+		Cache files paths of the current fingerprint, data types and 
+            columns, by format preference.
+    '''
+    stat = os.stat(sheetpath)
+    prefix = hashlib.blake2b(os.path.abspath(sheetpath).encode(), 
+                             digest_size=8).hexdigest()
+    fingerprint = hashlib.blake2b(f'{stat.st_size}_{stat.st_mtime_ns}'.encode(), 
+                                  digest_size=8).hexdigest()
+    if isinstance(dtype, dict):
+        types = sorted((str(col), getattr(t, '__name__', str(t))) 
+                       for col, t in dtype.items())
+    else:
+        types = getattr(dtype, '__name__', str(dtype))
+    selection = None if columns is None else sorted(map(str, columns))
+    variant = hashlib.blake2b(repr((types, selection)).encode(), 
+                              digest_size=8).hexdigest()
+    version = f'{prefix}_{fingerprint}_'
+    base = os.path.join(cache_dir, f'{version}{variant}')
+    return prefix, version, [f'{base}.parquet', f'{base}.pickle']
+
+
+
+def _save_cached_df(df, sheetpath, cache_dir, dtype=None, columns=None):
+    '''
+    Save a parsed sheet into the cache, as parquet (columnar, fast) or as 
+    pickle if pyarrow is missing or if the DataFrame is not supported by 
+    parquet (for example mixed types in a column). Cache files of previous 
+    versions of the sheet are deleted.
+
+    PARAMETERS
+    ----------    
+	(pandas.DataFrame) df:
+		The DataFrame loaded from the sheet.
+    
+	(str) sheetpath:
+		Absolute path of the sheet.
+    
+	(str) cache_dir:
+		Absolute path to the cache directory.
+    
+	(dict<str;type>) dtype=None:
+		Data type of some columns given to the parser.
+    
+	(list<str>) columns=None:
+		Parsed columns, if None all of them.
+
+    RETURNS
+    -------    
+	None
+    '''
+    prefix, version, paths = _get_cache_paths(sheetpath, cache_dir, dtype, 
+                                              columns)
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in os.listdir(cache_dir): # outdated versions
+        if name.startswith(f'{prefix}_') and not name.startswith(version):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass
+    tmp = os.path.join(cache_dir, f'.{uuid.uuid4().hex}')
+    try:
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, paths[0])
+        except Exception: # no pyarrow or unsupported types
+            df.to_pickle(tmp, compression=None)
+            os.replace(tmp, paths[1])
+    except OSError as err:
+        print(f'|WRN| sheet not cached: {err}')
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+
+def _load_cached_df(sheetpath, cache_dir, columns=None, dtype=None):
+    '''
+    Load a parsed sheet from the cache, if its current version is cached 
+    with those columns, or with all of them.
+
+    PARAMETERS
+    ----------    
+	(str) sheetpath:
+		Absolute path of the sheet.
+    
+	(str) cache_dir:
+		Absolute path to the cache directory.
+    
+	(list<str>) columns=None:
+		Columns to load, if None all of them.
+    
+	(dict<str;type>) dtype=None:
+		Data type of some columns given to the parser.
+
+    RETURNS
+    -------    
+	(pandas.DataFrame or None) df:
+		The cached DataFrame, None if not cached.
+    '''
+    for selection in ([None] if columns is None else [columns, None]):
+        parquetpath, picklepath = _get_cache_paths(sheetpath, cache_dir, 
+                                                   dtype, selection)[2]
+        try:
+            if os.path.isfile(parquetpath):
+                return pd.read_parquet(parquetpath, columns=columns)
+            if os.path.isfile(picklepath):
+                df = pd.read_pickle(picklepath, compression=None)
+                return df if columns is None else df[columns]
+        except Exception as err: # corrupted or written by another version
+            print(f'|WRN| cached sheet ignored: {err}')
+    return None
+
+
+
+def clear_sheet_cache(cache_dir=SHEET_CACHE_DIR):
+    '''
+    Delete every cached sheet.
+
+    PARAMETERS
+    ----------    
+	(str) cache_dir=SHEET_CACHE_DIR:
+		Absolute path to the cache directory.
+
+    RETURNS
+    -------    
+	None
+    '''
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, name))
+
+
+
 # @TODO pd.read_table might be the same function (but better).
 # https://pandas.pydata.org/docs/reference/api/pandas.read_table.html
-def read_df_from_any_avalaible_extensions(sheetpath):
+def read_df_from_any_avalaible_extensions(sheetpath, columns=None, dtype=None,
+                                          filter_col=None, filter_values=None,
+                                          cache=True, 
+                                          cache_dir=SHEET_CACHE_DIR):
     '''
     Load a Pandas DataFrame from a file.
     Avalaible extensions: csv, txt, xls, xlsx, feather, parquet, 
-    hdf5, sas7bdat, stata, pickle.
+    hdf5 (or h5), sas7bdat, stata, pickle.
+    Columns selection is given to each reader when it supports it, so only 
+    those columns are parsed (or read for columnar formats).
+    Slow to parse formats (see CACHED_EXTENSIONS) are cached once parsed, 
+    so loading again an unchanged file (same path, size and modification 
+    time) is fast. Only the selected columns are parsed and cached (the 
+    full sheet serves any selection once cached), with dtype (cached 
+    separately for each columns and dtype).
 
     PARAMETERS
     ----------    
 	(str) sheetpath:
 		Absolute path of the file to load.
+    
+	(list<str>) columns=None:
+		Columns to load, if None all of them.
+    
+	(dict<str;type>) dtype=None:
+		Data type of some columns, which avoids inferring them (for example 
+            {"id": str}).
+    
+	(str) filter_col=None:
+		If defined with filter_values, only rows with a value of this column 
+            inside filter_values are kept (compared as strings).
+    
+	(array/list like of str) filter_values=None:
+		Values of filter_col to keep.
+    
+	(bool) cache=True:
+		If True, use and fill the cache of parsed sheets.
+    
+	(str) cache_dir=SHEET_CACHE_DIR:
+		Absolute path to the cache directory.
 
     RETURNS
     -------    
@@ -77,28 +289,178 @@ def read_df_from_any_avalaible_extensions(sheetpath):
     '''
     # Determine the file extension
     _, file_extension = sheetpath.rsplit('.', 1)
+    if columns is not None:
+        columns = list(dict.fromkeys(columns)) # unique, ordered
+    filtering = filter_col is not None and filter_values is not None
+    cache = cache and file_extension in CACHED_EXTENSIONS
+    df = None
+    if cache:
+        df = _load_cached_df(sheetpath, cache_dir, columns, dtype)
 
     # Load the DataFrame using the appropriate reader based on the file extension
-    if file_extension in ['csv', 'txt']:
-        return pd.read_csv(sheetpath)
+    typed = cache # if dtype was given to the reader (cached sheets too)
+    if df is not None:
+        pass
+    elif cache: # parse the selection once, then load it from the cache
+        df = read_df_from_any_avalaible_extensions(sheetpath, columns, dtype, 
+                                                   cache=False)
+        _save_cached_df(df, sheetpath, cache_dir, dtype, columns)
+    elif file_extension in ['csv', 'txt']:
+        df = pd.read_csv(sheetpath, usecols=columns, dtype=dtype)
+        typed = True
     elif file_extension in ['xls', 'xlsx']:
-        return pd.read_excel(sheetpath, engine='openpyxl')
-    elif file_extension in ['feather', 'parquet', 'hdf5']:
-        return pd.read_feather(sheetpath)
+        df = pd.read_excel(sheetpath, engine='openpyxl', usecols=columns, 
+                           dtype=dtype)
+        typed = True
+    elif file_extension == 'feather':
+        df = pd.read_feather(sheetpath, columns=columns)
+    elif file_extension == 'parquet':
+        df = pd.read_parquet(sheetpath, columns=columns)
+    elif file_extension in ['hdf5', 'h5']:
+        df = pd.read_hdf(sheetpath)
     elif file_extension == 'sas7bdat':
-        return pd.read_sas(sheetpath)
+        df = pd.read_sas(sheetpath)
     elif file_extension == 'stata':
-        return pd.read_stata(sheetpath)
+        df = pd.read_stata(sheetpath, columns=columns)
     elif file_extension == 'pickle':
-        return pd.read_pickle(sheetpath)
+        df = pd.read_pickle(sheetpath)
     else:
         raise ValueError(f'Unsupported file extension: {file_extension}')
 
+    # Readers without selection, or types to cast
+    if columns is not None and list(df.columns) != columns:
+        df = df[columns]
+    if dtype is not None and not typed:
+        df = df.astype(dtype)
+    if filtering:
+        df = df[df[filter_col].astype(str).isin(set(map(str, filter_values)))]
+    return df
+
+
+
+def iter_df_chunks(sheetpath, chunksize=100000, columns=None, dtype=None, 
+                   filter_col=None, filter_values=None):
+    '''
+    Load a Pandas DataFrame from a file chunk by chunk, so the memory used 
+    is bounded whatever the size of the file. Csv/txt files are streamed 
+    (and parquet files too, if pyarrow is installed), other formats are 
+    loaded at once as a single chunk (see 
+    "read_df_from_any_avalaible_extensions").
+
+    PARAMETERS
+    ----------    
+	(str) sheetpath:
+		Absolute path of the file to load.
+    
+	(int) chunksize=100000:
+		Maximum amount of rows per chunk.
+    
+	(list<str>) columns=None:
+		Columns to load, if None all of them.
+    
+	(dict<str;type>) dtype=None:
+		Data type of some columns, which avoids inferring them.
+    
+	(str) filter_col=None:
+		If defined with filter_values, only rows with a value of this column 
+            inside filter_values are kept (compared as strings).
+    
+	(array/list like of str) filter_values=None:
+		Values of filter_col to keep.
+
+    RETURNS
+    -------    
+	(generator of pandas.DataFrame) chunks:
+		The successive chunks of the file.
+    
+    RAISES
+    ------
+    (ValueError) err: 
+        If the file extension is not supported.
+    '''
+    _, file_extension = sheetpath.rsplit('.', 1)
+    if columns is not None:
+        columns = list(dict.fromkeys(columns)) # unique, ordered
+    if filter_col is not None and filter_values is not None:
+        filter_values = set(map(str, filter_values))
+
+    if file_extension in ['csv', 'txt']:
+        chunks = pd.read_csv(sheetpath, usecols=columns, dtype=dtype, 
+                             chunksize=chunksize)
+    elif file_extension == 'parquet' and pq is not None:
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(sheetpath
+                  ).iter_batches(batch_size=chunksize, columns=columns))
+    else:
+        yield read_df_from_any_avalaible_extensions(sheetpath, columns, dtype, 
+                                                    filter_col, filter_values)
+        return
+
+    for df in chunks:
+        if columns is not None and list(df.columns) != columns:
+            df = df[columns]
+        if dtype is not None and file_extension == 'parquet':
+            df = df.astype(dtype)
+        if filter_col is not None and filter_values is not None:
+            df = df[df[filter_col].astype(str).isin(filter_values)]
+        yield df
+
+
+
+def _as_str_series(values):
+    '''
+    Convert values into strings, missing values become "nan".
+
+    PARAMETERS
+    ----------    
+	(pandas.Series) values:
+		Values to convert.
+
+    RETURNS
+    -------    
+	(pandas.Series) strings:
+		Values as strings.
+    '''
+    return values.astype(str).fillna('nan')
+
+
+
+def _transform_columns(df, columns, transform, inplace=False):
+    '''
+    Replace columns by a transformation of their values (as strings). When 
+    not inplace, only transformed columns are new, others are shared with 
+    df (shallow copy), so the full DataFrame is not copied.
+
+    PARAMETERS
+    ----------    
+	(pandas.DataFrame) df:
+		The DataFrame to modify.
+    
+	(list) columns:
+		A list of column names to transform.
+    
+	(function) transform:
+		Vectorized transformation of a pandas Series of strings.
+    
+	(bool) inplace=False:
+		If True, the DataFrame will be modified in place, else it is returned.
+    
+    RETURNS
+    -------    
+	(pandas.DataFrame) df=None:
+		Modified copy of passed df, if inplace==True returns None.    
+    '''
+    df_modified = df if inplace else df.copy(deep=False)
+    for col in columns:
+        df_modified[col] = transform(_as_str_series(df_modified[col]))
+    if not inplace:
+        return df_modified
+
 
 
 def add_suffix_to_cells_from_a_column(df, suffix, columns, inplace=False):
     '''
     Concatenate a string with the values in certain columns of a Pandas DataFrame.
+    Vectorized, and the full DataFrame is not copied when not in place.
     
     PARAMETERS
     ----------    
@@ -119,11 +481,141 @@ def add_suffix_to_cells_from_a_column(df, suffix, columns, inplace=False):
 	(pandas.DataFrame) df=None:
 		Modified copy of passed df, if inplace==True returns None.    
     '''
-    if inplace:
-        for col in columns:
-            df[col] = df[col].apply(lambda x: f'{x}{suffix}')
-    else:
-        df_modified = df.copy()
-        for col in columns:
-            df_modified[col] = df_modified[col].apply(lambda x: f'{x}{suffix}')
-        return df_modified
\ No newline at end of file
+    return _transform_columns(df, columns, 
+                              lambda values: values + suffix, 
+                              inplace)
+
+
+
+def add_prefix_to_cells_from_a_column(df, prefix, columns, inplace=False):
+    '''
+    Concatenate a string before the values in certain columns of a Pandas 
+    DataFrame (vectorized).
+    
+    PARAMETERS
+    ----------    
+	(pandas.DataFrame) df:
+		The DataFrame to modify.
+    
+	(str) prefix:
+		The string to put before the values in the specified columns.
+    
+	(list) columns:
+		A list of column names to modify.
+    
+	(bool) inplace=False:
+		If True, the DataFrame will be modified in place, else it is returned.
+    
+    RETURNS
+    -------    
+	(pandas.DataFrame) df=None:
+		Modified copy of passed df, if inplace==True returns None.    
+    '''
+    return _transform_columns(df, columns, 
+                              lambda values: prefix + values, 
+                              inplace)
+
+
+
+def format_cells_from_a_column(df, template, columns, inplace=False):
+    '''
+    Format the values in certain columns of a Pandas DataFrame with a 
+    template containing one "{}" placeholder, for example "slide_{}.svs" 
+    turns "12" into "slide_12.svs" (vectorized).
+    
+    PARAMETERS
+    ----------    
+	(pandas.DataFrame) df:
+		The DataFrame to modify.
+    
+	(str) template:
+		The template, "{}" is replaced by each value.
+    
+	(list) columns:
+		A list of column names to modify.
+    
+	(bool) inplace=False:
+		If True, the DataFrame will be modified in place, else it is returned.
+    
+    RETURNS
+    -------    
+	(pandas.DataFrame) df=None:
+		Modified copy of passed df, if inplace==True returns None.    
+    
+    RAISES
+    ------
+    (ValueError) err: 
+        If the template does not contain exactly one "{}" placeholder.
+    '''
+    if template.count('{}') != 1:
+        raise ValueError('template must contain exactly one "{}" placeholder')
+    prefix, _, suffix = template.partition('{}')
+    return _transform_columns(df, columns, 
+            lambda values: prefix + values + suffix, 
+            inplace)
+
+
+
+def map_extensions_of_cells_from_a_column(df, extensions, columns, 
+                                          inplace=False):
+    '''
+    Replace the extension of the values in certain columns of a Pandas 
+    DataFrame, for example {"tif": "png"} turns "a.tif" into "a.png". Values 
+    with another extension (or without) are kept as is (vectorized).
+    
+    PARAMETERS
+    ----------    
+	(pandas.DataFrame) df:
+		The DataFrame to modify.
+    
+	(dict<str;str>) extensions:
+		The new extension of each extension (with or without dot).
+    
+	(list) columns:
+		A list of column names to modify.
+    
+	(bool) inplace=False:
+		If True, the DataFrame will be modified in place, else it is returned.
+    
+    RETURNS
+    -------    
+	(pandas.DataFrame) df=None:
+		Modified copy of passed df, if inplace==True returns None.    
+    '''
+    return _transform_columns(df, columns, 
+            lambda values: _map_extensions(values, extensions), inplace)
+
+
+
+def _map_extensions(values, extensions):
+    '''
+    Replace the extension of strings, see 
+    "map_extensions_of_cells_from_a_column".
+
+    PARAMETERS
+    ----------    
+	(pandas.Series) values:
+		Strings to modify.
+    
+	(dict<str;str>) extensions:
+		The new extension of each extension (with or without dot).
+
+    RETURNS
+    -------    
+	(pandas.Series) values:
+		Modified strings.
+    '''
+    if not extensions:
+        return values
+    mapping = {old.lstrip('.'): new.lstrip('.') 
+               for old, new in extensions.items()}
+    # Masks are computed on original values, so mappings do not chain 
+    # ({"tif": "png", "png": "jpg"}), and longer extensions come first 
+    # ("tar.gz" before "gz")
+    mapped = values.copy()
+    done = pd.Series(False, index=values.index)
+    for old in sorted(mapping, key=len, reverse=True):
+        mask = values.str.endswith(f'.{old}') & ~done
+        mapped[mask] = values[mask].str[:-len(old)] + mapping[old]
+        done |= mask
+    return mapped
\ No newline at end of file
@@ -0,0 +1,394 @@
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from joblib import Parallel, delayed
+
+try:
+    import cloudpickle
+except ImportError: # older joblib versions vendor it
+    from joblib.externals import cloudpickle
+
+from . import file
+from . import multiprocess
+
+
+
+# A queue is a directory on storage shared by every host, each task is a json
+# file moved (atomically) from a state subdirectory to another:
+#  - tasks: waiting tasks, claimed by renaming them into "leases"
+#  - leases: running tasks, named after their worker ("{task}.{worker}.json"),
+#    a worker touches its lease while processing, if a lease is not touched
+#    for "lease_timeout" seconds, the task is requeued
+#  - done: completed tasks
+#  - failed: tasks that raised an error (with the traceback)
+# The treatment and its arguments are stored once in "job.pkl".
+# Start workers on any host with:
+#   python -c "import acutils; acutils.taskqueue.run_queue_workers('/queue', 8)"
+QUEUE_SUBDIRS = ['tasks', 'leases', 'done', 'failed']
+
+
+
+def publish_tasks(queuedir, srcs, dstdirs, func, **kwargs):
+    '''
+    Reset the queue directory, then publish a task for each "src"/"dstdir"
+    from "srcs"/"dstdirs". "func" and kwargs are pickled (with cloudpickle),
+    so workers must run the same Python environment.
+    "func" needs "src" and "dstdir" params (in acutils, those are prefixed
+    with "tmnt").
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory (on shared storage).
+
+	(array/list like of str) srcs:
+		Source files absolute paths (reachable from every host).
+
+	(array/list like of str) dstdirs:
+		Destination directories absolute paths (reachable from every host).
+
+	(function) func:
+		Treatment that will be applied on each source file.
+
+	**kwargs: Arguments to pass to the "func" function.
+
+    RETURNS
+    -------
+	(str) job:
+		Identifier of the published job.
+    '''
+    if not os.path.isdir(os.path.dirname(os.path.abspath(queuedir))):
+        raise NotADirectoryError("the parent of queuedir must exist")
+    file.reset_directory(queuedir, subs=QUEUE_SUBDIRS)
+
+    job = uuid.uuid4().hex
+    with open(os.path.join(queuedir, 'job.pkl'), 'wb') as f:
+        cloudpickle.dump({'job': job, 'func': func, 'kwargs': kwargs}, f)
+
+    subdirs = {}
+    for i, (src, dstdir) in enumerate(zip(srcs, dstdirs)):
+        dstdir = str(dstdir)
+        if dstdir not in subdirs:
+            subdirs[dstdir] = multiprocess._list_subdirs(dstdir)
+        tmp = os.path.join(queuedir, f'.{i:09d}.json')
+        file.save_dict_as_json(tmp, {'job': job, 'src': str(src),
+                                     'dstdir': dstdir,
+                                     'subdirs': subdirs[dstdir]})
+        os.replace(tmp, os.path.join(queuedir, 'tasks', f'{i:09d}.json'))
+    return job
+
+
+
+def requeue_expired_leases(queuedir, lease_timeout=60.):
+    '''
+    Move back to waiting tasks every leased task not touched for
+    "lease_timeout" seconds (its worker probably crashed). Hosts clocks
+    should be synchronized (NTP).
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory.
+
+	(float) lease_timeout=60.:
+		Seconds without renewal before a lease expires.
+
+    RETURNS
+    -------
+	(int) count:
+		Amount of requeued tasks.
+    '''
+    count = 0
+    leasedir = os.path.join(queuedir, 'leases')
+    now = time.time()
+    for entry in os.scandir(leasedir):
+        try:
+            if now - entry.stat().st_mtime > lease_timeout:
+                name = f"{entry.name.split('.', 1)[0]}.json" # without worker
+                os.rename(entry.path, os.path.join(queuedir, 'tasks', name))
+                count += 1
+        except FileNotFoundError:
+            pass # completed or requeued meanwhile
+    return count
+
+
+
+def get_queue_status(queuedir):
+    '''
+    Count the tasks of each state.
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory.
+
+    RETURNS
+    -------
+	(dict<str;int>) status:
+		Amount of tasks for each state ("tasks", "leases", "done", "failed").
+    '''
+    return {state: len(os.listdir(os.path.join(queuedir, state)))
+            for state in QUEUE_SUBDIRS}
+
+
+
+def _renew_lease(leasepath, interval, stop):
+    '''
+    Touch a lease every "interval" seconds until "stop" is set or the lease
+    is lost.
+
+    PARAMETERS
+    ----------
+	(str) leasepath:
+		Absolute path to the lease file.
+
+	(float) interval:
+		Seconds between renewals.
+
+	(threading.Event) stop:
+		Event set when the task is finished.
+
+    RETURNS
+    -------
+	None
+    '''
+    while not stop.wait(interval):
+        try:
+            os.utime(leasepath)
+        except FileNotFoundError:
+            return # lease expired and requeued, the other attempt may win
+
+
+
+def _claim_task(queuedir, worker):
+    '''
+    Claim a waiting task, by renaming it into leases under a name of the 
+    worker (only one worker can succeed). A lease that still has this name 
+    is owned by the worker, even if the task was requeued and claimed again 
+    by another one meanwhile. Tasks are browsed in random order to limit 
+    contention.
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory.
+
+	(str) worker:
+		Identifier of the worker, unique among every host.
+
+    RETURNS
+    -------
+	(str or None) name:
+		Filename of the claimed task, None if no task is waiting.
+    '''
+    names = os.listdir(os.path.join(queuedir, 'tasks'))
+    random.shuffle(names)
+    for name in names:
+        try:
+            leasepath = os.path.join(queuedir, 'leases', 
+                                     f'{name[:-5]}.{worker}.json')
+            os.rename(os.path.join(queuedir, 'tasks', name), leasepath)
+            os.utime(leasepath) # the lease starts now
+            return name
+        except FileNotFoundError:
+            continue # claimed by another worker
+    return None
+
+
+
+def run_queue_worker(queuedir, lease_timeout=60., poll_interval=1.,
+                     idle_timeout=0., worker_index=0, threads_per_worker=None,
+                     pin_cpus=False):
+    '''
+    Claim, process and complete tasks from a queue until nothing is waiting
+    or running anymore. Any amount of workers can run it, on any host that
+    can reach the queue directory, source files and destination directories.
+    Outputs of a task are written into a private directory, then atomically
+    moved into "dstdir", so a task processed twice (expired lease) can't
+    corrupt results. Only the worker still holding the lease of a task 
+    reports it as done or failed.
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory (on shared storage).
+
+	(float) lease_timeout=60.:
+		Seconds without renewal before a lease expires, leases are renewed
+            every third of it.
+
+	(float) poll_interval=1.:
+		Seconds to wait when there is no task to claim.
+
+	(float) idle_timeout=0.:
+		Seconds to keep waiting for tasks once the queue is empty (useful
+            to start workers before publishing).
+
+	(int) worker_index=0:
+		Index of the worker, see "multiprocess.limit_worker_resources".
+
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see
+            "multiprocess.limit_worker_resources".
+
+	(bool) pin_cpus=False:
+		Pin the worker to one CPU, see "multiprocess.limit_worker_resources".
+
+    RETURNS
+    -------
+	(int) count:
+		Amount of tasks processed by this worker.
+    '''
+    worker = f'{socket.gethostname()}_{os.getpid()}'
+    job = None
+    count = 0
+    idle_since = time.time()
+
+    with multiprocess.limit_worker_resources(worker_index, threads_per_worker,
+                                             pin_cpus):
+        while True:
+            name = None
+            if os.path.isfile(os.path.join(queuedir, 'job.pkl')):
+                requeue_expired_leases(queuedir, lease_timeout)
+                name = _claim_task(queuedir, worker)
+
+            if name is None:
+                status = (get_queue_status(queuedir)
+                          if os.path.isfile(os.path.join(queuedir, 'job.pkl'))
+                          else {'leases': 0})
+                if (status['leases'] == 0
+                    and time.time() - idle_since >= idle_timeout):
+                    return count
+                time.sleep(poll_interval)
+                continue
+
+            # Process the claimed task while renewing its lease
+            leasepath = os.path.join(queuedir, 'leases', 
+                                     f'{name[:-5]}.{worker}.json')
+            try:
+                with open(leasepath, 'r') as f:
+                    task = json.load(f)
+            except FileNotFoundError:
+                continue # expired already
+            if job is None or job['job'] != task['job']:
+                with open(os.path.join(queuedir, 'job.pkl'), 'rb') as f:
+                    job = cloudpickle.load(f)
+
+            stop = threading.Event()
+            renewer = threading.Thread(target=_renew_lease, daemon=True,
+                                       args=(leasepath, lease_timeout/3, stop))
+            renewer.start()
+            attemptdir = os.path.join(task['dstdir'],
+                f"{multiprocess.ATTEMPT_DIR_PREFIX}{name[:-5]}_{worker}")
+            error = None
+            try:
+                multiprocess._run_attempt(task['src'], attemptdir,
+                        task['subdirs'], job['func'], **job['kwargs'])
+                multiprocess._commit_attempt(attemptdir, task['dstdir'])
+            except Exception:
+                shutil.rmtree(attemptdir, ignore_errors=True)
+                error = traceback.format_exc()
+            finally:
+                stop.set()
+                renewer.join()
+            state = 'done' if error is None else 'failed'
+            statepath = os.path.join(queuedir, state, name)
+            if error is not None: # written aside, the lease may be lost
+                task['error'] = error
+                task['worker'] = worker
+                errorpath = os.path.join(queuedir, 
+                                         f'.{name[:-5]}.{worker}.json')
+                file.save_dict_as_json(errorpath, task)
+            try:
+                os.rename(leasepath, statepath) # only if still ours
+                owned = True
+            except FileNotFoundError:
+                owned = False # expired meanwhile, the requeued task reports
+            if error is not None and owned:
+                os.replace(errorpath, statepath)
+            elif error is not None:
+                os.remove(errorpath)
+            count += 1
+            idle_since = time.time()
+
+
+
+def run_queue_workers(queuedir, allowed_cpus=1, lease_timeout=60.,
+                      poll_interval=1., idle_timeout=0.,
+                      threads_per_worker=None, pin_cpus=False):
+    '''
+    Run "allowed_cpus" local workers on a queue, see "run_queue_worker".
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory (on shared storage).
+
+	(int) allowed_cpus=1:
+		Amount of local workers.
+
+	(float) lease_timeout=60.:
+		Seconds without renewal before a lease expires.
+
+	(float) poll_interval=1.:
+		Seconds to wait when there is no task to claim.
+
+	(float) idle_timeout=0.:
+		Seconds to keep waiting for tasks once the queue is empty.
+
+	(int) threads_per_worker=None:
+		Maximum amount of threads per library, see
+            "multiprocess.limit_worker_resources".
+
+	(bool) pin_cpus=False:
+		If True, pin each worker to one CPU chosen from its index.
+
+    RETURNS
+    -------
+	(int) count:
+		Amount of tasks processed by those workers.
+    '''
+    return sum(Parallel(n_jobs=allowed_cpus)(delayed(run_queue_worker)(
+                queuedir, lease_timeout, poll_interval, idle_timeout, i,
+                threads_per_worker, pin_cpus)
+    for i in range(allowed_cpus)))
+
+
+
+def wait_queue(queuedir, poll_interval=1., lease_timeout=60.):
+    '''
+    Wait until no task is waiting or running anymore (requeuing expired
+    leases meanwhile), then print a warning if some tasks failed.
+
+    PARAMETERS
+    ----------
+	(str) queuedir:
+		Absolute path to the queue directory.
+
+	(float) poll_interval=1.:
+		Seconds between checks.
+
+	(float) lease_timeout=60.:
+		Seconds without renewal before a lease expires.
+
+    RETURNS
+    -------
+	(dict<str;int>) status:
+		Amount of tasks for each state.
+    '''
+    while True:
+        requeue_expired_leases(queuedir, lease_timeout)
+        status = get_queue_status(queuedir)
+        if status['tasks'] == 0 and status['leases'] == 0:
+            break
+        time.sleep(poll_interval)
+    if status['failed'] > 0:
+        print(f"|WRN| {status['failed']} tasks failed, see "
+              f"{os.path.join(queuedir, 'failed')}")
+    return status
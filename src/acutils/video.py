@@ -3,22 +3,419 @@
 #  - dstdir: absolute path to the directory that should contain new files (str)
 # Also, nothing should be returned.
 
+import math
 import os
 
+from . import archive
+
 try:
     import cv2
-except ImportError:
-    print("|WRN| You must install 'opencv-python' (cv2) to use video module. "
-          "Leaving.")
-    exit()
+except ImportError as err:
+    raise ImportError("You must install 'opencv-python' (cv2) to use video "
+                      "module.") from err
+
+
+
+SEEK_THRESHOLD = 250 # skip more frames with a seek, less with "grab" calls
+RANGE_FRAMES = 5000 # kept frames per task when splitting videos into ranges
+
+
+
+def _move_to_frame(cap, src, count, target, seek_threshold=SEEK_THRESHOLD):
+    '''
+    Move a capture from frame "count" (next frame to read) to frame "target",
+    without retrieving skipped frames. Short gaps are crossed with "grab"
+    calls, longer ones with a seek, then with "grab" calls if the backend
+    landed on a previous keyframe. If the seek fails or goes too far, the
+    video is reopened and browsed with "grab" calls from the start.
+
+    PARAMETERS
+    ----------
+	(cv2.VideoCapture) cap:
+		opened capture of the video
+
+	(str) src:
+		absolute path to the video
+
+	(int) count:
+		frame number of the next frame to read
+
+	(int) target:
+		frame number to reach
+
+	(int) seek_threshold=SEEK_THRESHOLD:
+		minimum amount of frames to skip to seek instead of grabbing them
+
+    RETURNS
+    -------
+	(cv2.VideoCapture) cap:
+		capture of the video (reopened if the seek failed)
+
+	(int) count:
+		frame number of the next frame to read, lower than "target" only if
+            the video ended before
+    '''
+    if target - count > seek_threshold:
+        success = cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if success and 0 <= pos <= target:
+            count = pos
+        else: # unreliable position, start again from the first frame
+            cap.release()
+            cap = cv2.VideoCapture(src)
+            count = 0
+
+    while count < target and cap.grab(): # decode without retrieving
+        count += 1
+    return cap, count
+
+
+
+def load_frames_fromsheet(sheetpath, videocol, framecol):
+    '''
+    Load frame numbers (or timestamps) to extract from a sheet, grouped by
+    video. The result can be given as "frames" (or "timestamps") to video
+    treatments, each video only keeping its own ones.
+
+    PARAMETERS
+    ----------
+	(str) sheetpath:
+		absolute path to the sheet (extension is optional, see
+            "sheet.read_df_from_any_avalaible_extensions")
+
+	(str) videocol:
+		column of video names (with or without directory and extension)
+
+	(str) framecol:
+		column of frame numbers (or timestamps in seconds)
+
+    RETURNS
+    -------
+	(dict<str;list<int or float>>) frames:
+		frame numbers (or timestamps) for each video name (without extension)
+    '''
+    from . import sheet # pandas is only required here
+
+    df = sheet.read_df_from_any_avalaible_extensions(
+                                        sheetpath, columns=[videocol, framecol])
+    df = df.dropna(subset=[videocol, framecol])
+    frames = {}
+    for video, frame in zip(df[videocol].astype(str), df[framecol].tolist()):
+        vname = os.path.splitext(os.path.basename(video))[0]
+        frames.setdefault(vname, []).append(frame)
+    return frames
+
+
+
+def load_intervals_fromsheet(sheetpath, videocol, startcol, endcol, 
+                             labelcol):
+    '''
+    Load labelled intervals (annotated phases for example) from a sheet, 
+    grouped by video. The result can be given as "intervals" to 
+    "tmnt_extract_frames_from_intervals", each video only using its own ones.
+
+    PARAMETERS
+    ----------
+	(str) sheetpath:
+		absolute path to the sheet (extension is optional, see
+            "sheet.read_df_from_any_avalaible_extensions")
+
+	(str) videocol:
+		column of video names (with or without directory and extension)
+
+	(str) startcol:
+		column of first frame numbers (or timestamps in seconds) of intervals
+
+	(str) endcol:
+		column of last frame numbers (or timestamps in seconds) of intervals,
+            excluded
+
+	(str) labelcol:
+		column of interval labels
+
+    RETURNS
+    -------
+	(dict<str;list<tuple<float;float;str>>>) intervals:
+		first, last and label of each interval for each video name (without
+            extension)
+    '''
+    from . import sheet # pandas is only required here
+
+    columns = [videocol, startcol, endcol, labelcol]
+    df = sheet.read_df_from_any_avalaible_extensions(sheetpath, 
+                                                     columns=columns)
+    df = df.dropna(subset=columns)
+    intervals = {}
+    for video, first, last, label in zip(df[videocol].astype(str), 
+                                         df[startcol].tolist(), 
+                                         df[endcol].tolist(), 
+                                         df[labelcol].astype(str)):
+        vname = os.path.splitext(os.path.basename(video))[0]
+        intervals.setdefault(vname, []).append((first, last, label))
+    return intervals
+
+
+
+def _get_sampling(src, cap, stride=1, target_fps=None, frames=None,
+                  timestamps=None):
+    '''
+    Check sampling parameters of a video and convert them into a frame
+    stride, a float step between frames, or a sorted list of frame numbers.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(cv2.VideoCapture) cap:
+		opened capture of the video
+
+	(int) stride=1:
+		keep one frame every "stride" frames
+
+	(float) target_fps=None:
+		amount of frames to keep per second of video
+
+	(list<int> or dict<str;list<int>>) frames=None:
+		frame numbers to keep, or frame numbers for each video name
+
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		timestamps to keep (seconds), or timestamps for each video name
+
+    RETURNS
+    -------
+	(int) stride:
+		keep one frame every "stride" frames
+
+	(float or None) step:
+		frames between two kept frames if "target_fps" is used
+
+	(list<int> or None) frames:
+		sorted frame numbers to keep if "frames" or "timestamps" are used
+
+    RAISES
+    ------
+    (ValueError) err:
+        If several samplings are asked, or if the video frame rate is needed
+        but unknown.
+    '''
+    if sum([stride != 1, target_fps is not None, frames is not None,
+            timestamps is not None]) > 1:
+        raise ValueError('only one of stride, target_fps, frames and '
+                         'timestamps can be used')
+    if stride < 1:
+        raise ValueError('stride must be a positive integer')
+
+    vname = os.path.splitext(os.path.basename(src))[0]
+    if isinstance(frames, dict):
+        frames = frames.get(vname, [])
+    if isinstance(timestamps, dict):
+        timestamps = timestamps.get(vname, [])
+    if target_fps is None and timestamps is None:
+        return int(stride), None, (None if frames is None else
+                                   sorted(set(int(f) for f in frames)))
+
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    if not video_fps > 0:
+        raise ValueError(f'unknown frame rate of {src}')
+    if timestamps is not None:
+        return 1, None, sorted(set(round(t*video_fps) for t in timestamps))
+    return 1, max(1., video_fps/target_fps), None
+
+
+
+def _sample_frames(first, last, stride=1, step=None, frames=None):
+    '''
+    Generate the frame numbers kept by a sampling, from "first" (included) to
+    "last" (excluded). Kept frames do not depend on "first", so any range of
+    a video keeps the same frames than a full browse.
+
+    PARAMETERS
+    ----------
+	(int) first:
+		first frame number of the range
+
+	(int or float) last:
+		frame number ending the range (excluded, may be infinite)
+
+	(int) stride=1:
+		keep frame numbers that are multiples of "stride"
+
+	(float) step=None:
+		if defined, keep frame numbers rounded from multiples of "step"
+
+	(list<int>) frames=None:
+		if defined, keep those sorted frame numbers
+
+    RETURNS
+    -------
+	(generator of int) count:
+		kept frame numbers
+    '''
+    if frames is not None:
+        for count in frames:
+            if count >= last:
+                return
+            if count >= first:
+                yield count
+
+    elif step is not None:
+        k = max(0, math.floor(first/step) - 1)
+        while True:
+            count = round(k*step)
+            if count >= last:
+                return
+            if count >= first:
+                yield count
+            k += 1
+
+    else:
+        count = first + (-first) % stride
+        while count < last:
+            yield count
+            count += stride
+
+
+
+def _get_browsed_ranges(cap, bound, extra_down, extra_up, start=0, end=None):
+    '''
+    Get the ranges of frames browsed before and after the skipped range, see
+    "browse_frames_for_binary_classification".
+
+    PARAMETERS
+    ----------
+	(cv2.VideoCapture) cap:
+		opened capture of the video
+
+	(int) bound:
+		frame number that switch the status from "before" to "after"
+
+	(int) extra_down:
+		how many frames to skip before the bound
+
+	(int) extra_up:
+		how many frames to skip after the bound
+
+	(int) start=0:
+		frame number to start browsing frames (excluded)
+
+	(int) end=None:
+		frame number to end browsing frames (excluded, if None, go for the
+            full duration)
+
+    RETURNS
+    -------
+	(list<tuple<bool;int;int or float>>) ranges:
+		"passed" status, first frame number (included) and last frame
+            number (excluded, infinite if the duration is unknown) of each
+            range
+    '''
+    srst = int(bound-extra_down) # skipped range start time
+    srse = int(bound+extra_up) # skipped range end time
+
+    duration = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) # as frame amount
+    if duration <= 0: # unknown by the container, read until the last frame
+        duration = float('inf')
+    duration = min(duration, end) if end is not None else duration
+
+    ranges = [(False, start+1, min(srst+1, duration))]
+    if srse < duration:
+        ranges.append((True, max(srse, srst+1, start+1), duration))
+    return ranges
+
+
+
+def _transform_frame(frame, crop=None, new_width=None, new_height=None):
+    '''
+    Crop then resize a decoded frame, before it is written, so extracted 
+    frames don't need another pass (see "image.tmnt_resize_file").
+
+    PARAMETERS
+    ----------
+	(numpy.array of uint8) frame:
+		BGR frame of the video
+
+	(tuple<int;int;int;int>) crop=None:
+		if defined, x, y, width and height of the kept area
+
+	(int) new_width=None:
+		if defined, width of the resized frame (if "new_height" is None, 
+            the aspect ratio is kept)
+
+	(int) new_height=None:
+		if defined, height of the resized frame (if "new_width" is None, 
+            the aspect ratio is kept)
+
+    RETURNS
+    -------
+	(numpy.array of uint8) frame:
+		transformed BGR frame
+    '''
+    if crop is not None:
+        x, y, width, height = crop
+        frame = frame[y:y+height, x:x+width]
+    if new_width is None and new_height is None:
+        return frame
+
+    height, width = frame.shape[:2]
+    if new_width is None:
+        new_width = max(1, round(width * new_height / height))
+    elif new_height is None:
+        new_height = max(1, round(height * new_width / width))
+    shrink = new_width * new_height < width * height
+    return cv2.resize(frame, (int(new_width), int(new_height)), 
+                      interpolation=cv2.INTER_AREA if shrink 
+                                    else cv2.INTER_LINEAR)
+
+
+
+def _get_write_params(fext, quality=None, png_compression=None):
+    '''
+    Get the encoder parameters of "cv2.imwrite" for a frame extension.
+
+    PARAMETERS
+    ----------
+	(str) fext:
+		frame extension ("png", "jpg", "jpeg" or "webp", others get no 
+            parameter)
+
+	(int) quality=None:
+		if defined, JPEG (0 to 100) or WebP (1 to 100) quality
+
+	(int) png_compression=None:
+		if defined, PNG compression level (0 to 9, higher is smaller but 
+            slower)
+
+    RETURNS
+    -------
+	(list<int>) params:
+		parameters to give to "cv2.imwrite"
+    '''
+    fext = fext.lower().lstrip('.')
+    if fext == 'png' and png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if fext in ('jpg', 'jpeg') and quality is not None:
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if fext == 'webp' and quality is not None:
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    return []
 
 
 
 def browse_frames_for_binary_classification(src, bound, extra_down, extra_up, 
-                                            start=0, end=None):
+                                            start=0, end=None, stride=1,
+                                            target_fps=None, frames=None,
+                                            timestamps=None,
+                                            seek_threshold=SEEK_THRESHOLD):
     '''
     Browse each frame of a video, from "start" to "end".
     Skip from bound-extra_down to bound+extra_up.
+    Skipped frames are never retrieved: they are grabbed or jumped over with
+    a seek (see "seek_threshold"), and nothing is decoded after "end".
+    Frames can be sampled (only one sampling at once): every "stride"
+    frames, at "target_fps", or from given "frames"/"timestamps" (see
+    "load_frames_fromsheet"). Unsampled frames are skipped the same way, so
+    the browsing time depends on kept frames rather than on the duration.
 
     PARAMETERS
     ------    
@@ -40,6 +437,23 @@ def browse_frames_for_binary_classification(src, bound, extra_down, extra_up,
 	(int) end=None:
 		frame number to end browsing frames (if None, go for the full duration)
     
+	(int) stride=1:
+		keep one frame every "stride" frames (frame numbers multiple of it)
+    
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+    
+	(list<int> or dict<str;list<int>>) frames=None:
+		if defined, frame numbers to keep, or frame numbers for each video
+            name (without extension)
+    
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		if defined, timestamps to keep (seconds), or timestamps for each
+            video name (without extension)
+    
+	(int) seek_threshold=SEEK_THRESHOLD:
+		minimum amount of frames to skip to seek instead of grabbing them
+    
     RETURNS
     ------    
 	(generator of bool) passed:
@@ -50,46 +464,53 @@ def browse_frames_for_binary_classification(src, bound, extra_down, extra_up,
     
 	(generator of numpy.array of uint8) frame:
 		BGR frames of the video    
-    '''
-    srst = int(bound-extra_down) # skipped range start time
-    srse = int(bound+extra_up) # skipped range end time
 
-    cap = cv2.VideoCapture(src)
-    duration = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) # as frame amount
-    duration = end if end is not None and duration < end else duration
-
-    count = 0 # use it to name frames
-    success, frame = cap.read() # load first frame
-
-    while success: # read it frame per frame
-        passed = count > srst # True if not before the skipped range
+    RAISES
+    ------
+    (ValueError) err:
+        If several samplings are asked, or if the video frame rate is needed
+        but unknown.
+    '''
+    with archive.source_path(src) as path: # extracted from an archive
+        cap = cv2.VideoCapture(path)
+        try:
+            stride, step, frames = _get_sampling(src, cap, stride, target_fps,
+                                                 frames, timestamps)
+            ranges = _get_browsed_ranges(cap, bound, extra_down, extra_up, 
+                                         start, end)
+        except Exception:
+            cap.release()
+            raise
 
-        if passed: # skip frames between srst and srse
-            if srse >= duration: break # exit now if no more data
-            if count < srse: # go to the end of the skipped range
-                count += 1
-                success, frame = cap.read() # load next frame
-                continue
-
-        elif count <= start: # save nothing before start
-            count += 1
-            success, frame = cap.read() # load next frame
-            continue
-
-        yield passed, count, frame
-        
-        count += 1
-        success, frame = cap.read()
+        count = 0 # next frame to read, use it to name frames
+        try:
+            for passed, first, last in ranges:
+                for target in _sample_frames(first, last, stride, step, 
+                                             frames):
+                    cap, count = _move_to_frame(cap, path, count, target,
+                                                seek_threshold)
+                    success, frame = cap.read()
+                    if not success or count < target:
+                        return # no more data
+                    yield passed, count, frame
+                    count += 1
+        finally:
+            cap.release()
 
 
 
 def tmnt_extract_frames_for_binary_classification(src, dstdir, bound, 
         extra_down, extra_up, start=0, end=None, fext="png", before_name="before", 
-        after_name="after"):
+        after_name="after", stride=1, target_fps=None, frames=None,
+        timestamps=None, crop=None, new_width=None, new_height=None,
+        quality=None, png_compression=None):
     '''
     Extract frames of a video, from "start" to "end".
     Skip from bound-extra_down to bound+extra_up.
     Split them into 2 states "before" or "after" the skipped range.
+    Frames can be sampled, see "browse_frames_for_binary_classification".
+    Frames can be cropped, resized and encoded as needed before being 
+    written, so no other pass is needed over them.
 
     PARAMETERS
     ------    
@@ -123,27 +544,63 @@ def tmnt_extract_frames_for_binary_classification(src, dstdir, bound,
 	(str) after_name="after":
 		name of the subdir inside dstdir to save frames after skip
     
+	(int) stride=1:
+		keep one frame every "stride" frames
+    
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+    
+	(list<int> or dict<str;list<int>>) frames=None:
+		if defined, frame numbers to keep (for each video name)
+    
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		if defined, timestamps to keep in seconds (for each video name)
+    
+	(tuple<int;int;int;int>) crop=None:
+		if defined, x, y, width and height of the area kept from each frame
+    
+	(int) new_width=None:
+		if defined, width of saved frames (aspect ratio kept if 
+            "new_height" is None)
+    
+	(int) new_height=None:
+		if defined, height of saved frames (aspect ratio kept if 
+            "new_width" is None)
+    
+	(int) quality=None:
+		if defined, JPEG or WebP quality of saved frames
+    
+	(int) png_compression=None:
+		if defined, PNG compression level of saved frames (0 to 9)
+    
     RETURNS
     -------
     None
     '''
     _, vext = os.path.splitext(src)
     vname = os.path.basename(src)[:-len(vext)]
+    params = _get_write_params(fext, quality, png_compression)
 
     for passed, count, frame in browse_frames_for_binary_classification(
-                              src, bound, extra_down, extra_up, start, end):
+                              src, bound, extra_down, extra_up, start, end,
+                              stride, target_fps, frames, timestamps):
         cv2.imwrite(os.path.join(dstdir, after_name if passed else before_name,
-             f"{vname}_{count}.{fext}"), frame)
+             f"{vname}_{count}.{fext}"), 
+             _transform_frame(frame, crop, new_width, new_height), params)
 
 
 
 def tmnt_extract_sequences_for_binary_classification(src, dstdir, bound, 
         extra_down, extra_up, seqlen=6, start=0, end=None, sext='mp4', 
-        codec='mp4v', fps=12, before_name="before", after_name="after"):
+        codec='mp4v', fps=12, before_name="before", after_name="after",
+        stride=1, target_fps=None, frames=None, timestamps=None,
+        first_sequence=0, crop=None, new_width=None, new_height=None):
     '''
     Extract sequences of a video, from "start" to "end".
     Skip from bound-extra_down to bound+extra_up.
     Split them into 2 states "before" or "after" the skipped range.
+    Frames can be sampled, see "browse_frames_for_binary_classification", 
+    and cropped or resized before being written.
 
     PARAMETERS
     ----------    
@@ -185,6 +642,33 @@ def tmnt_extract_sequences_for_binary_classification(src, dstdir, bound,
     
 	(str) after_name="after":
 		Name of the subdir inside dstdir to save frames after skip.    
+    
+	(int) stride=1:
+		Keep one frame every "stride" frames.
+    
+	(float) target_fps=None:
+		If defined, amount of frames to keep per second of video.
+    
+	(list<int> or dict<str;list<int>>) frames=None:
+		If defined, frame numbers to keep (for each video name).
+    
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		If defined, timestamps to keep in seconds (for each video name).
+    
+	(int) first_sequence=0:
+		Number of the first saved sequence (given to range tasks, see 
+            "split_sequences_into_ranges").
+    
+	(tuple<int;int;int;int>) crop=None:
+		If defined, x, y, width and height of the area kept from each frame.
+    
+	(int) new_width=None:
+		If defined, width of sequences (aspect ratio kept if "new_height" 
+            is None).
+    
+	(int) new_height=None:
+		If defined, height of sequences (aspect ratio kept if "new_width" 
+            is None).
     '''
 
     _, vext = os.path.splitext(src)
@@ -193,15 +677,16 @@ def tmnt_extract_sequences_for_binary_classification(src, dstdir, bound,
     fourcc = cv2.VideoWriter_fourcc(*codec)
     out = None # for VideoWriter
     seq = []
-    scount = 0 # sequence counter
+    scount = first_sequence # sequence counter
     old_passed = False
 
     for passed, _, frame in browse_frames_for_binary_classification(src, bound, 
-      extra_down, extra_up, start, end):
+      extra_down, extra_up, start, end, stride, target_fps, frames, timestamps):
         if old_passed != passed:
             seq = [] # a sequence should be entirely before or after the skip
         
-        seq.append(frame) # add the frame to the sequence
+        # add the frame to the sequence
+        seq.append(_transform_frame(frame, crop, new_width, new_height))
 
         if len(seq) == seqlen: # write a sequence file if enough frames
             out = cv2.VideoWriter(
@@ -209,7 +694,7 @@ def tmnt_extract_sequences_for_binary_classification(src, dstdir, bound,
                                                   f'{vname}_{scount}.{sext}'), 
                 fourcc, 
                 fps, 
-                frame.shape[:2][::-1]
+                seq[0].shape[:2][::-1]
             )
             for img in seq: 
                 out.write(img)
@@ -217,4 +702,411 @@ def tmnt_extract_sequences_for_binary_classification(src, dstdir, bound,
             seq = []
             scount += 1
         
-        old_passed = passed
\ No newline at end of file
+        old_passed = passed
+
+
+
+def _merge_intervals(intervals):
+    '''
+    Merge labelled intervals (possibly overlapping) into sorted disjoint 
+    segments, each one with the labels of every interval covering it.
+
+    PARAMETERS
+    ----------
+	(list<tuple<int;int;str>>) intervals:
+		first frame number (included), last frame number (excluded) and
+            label of each interval
+
+    RETURNS
+    -------
+	(list<tuple<int;int;tuple<str>>>) segments:
+		first frame number (included), last frame number (excluded) and
+            labels (in the order of intervals) of each segment
+    '''
+    bounds = sorted({bound for first, last, _ in intervals if first < last
+                     for bound in (first, last)})
+    segments = []
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        labels = tuple(dict.fromkeys(label for ifirst, ilast, label 
+                                     in intervals 
+                                     if ifirst <= first and last <= ilast))
+        if not labels:
+            continue
+        if segments and segments[-1][1] == first and segments[-1][2] == labels:
+            segments[-1] = (segments[-1][0], last, labels)
+        else:
+            segments.append((first, last, labels))
+    return segments
+
+
+
+def browse_frames_from_intervals(src, intervals, seconds=False, stride=1,
+                                 target_fps=None, 
+                                 seek_threshold=SEEK_THRESHOLD):
+    '''
+    Browse the frames of a video inside labelled intervals (annotated phases 
+    for example), in a single decoding pass whatever the amount of 
+    intervals. Frames between intervals are never retrieved (see 
+    "browse_frames_for_binary_classification"), and a frame inside 
+    overlapping intervals gets each of their labels.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(list<tuple> or dict<str;list<tuple>>) intervals:
+		first (included), last (excluded) and label of each interval, or 
+            intervals for each video name (without extension, see 
+            "load_intervals_fromsheet")
+
+	(bool) seconds=False:
+		if True, intervals bounds are timestamps in seconds, else frame 
+            numbers
+
+	(int) stride=1:
+		keep one frame every "stride" frames (frame numbers multiple of it)
+
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+
+	(int) seek_threshold=SEEK_THRESHOLD:
+		minimum amount of frames to skip to seek instead of grabbing them
+
+    RETURNS
+    -------
+	(generator of tuple<str>) labels:
+		labels of the intervals containing the frame
+
+	(generator of int) count:
+		frame numbers
+
+	(generator of numpy.array of uint8) frame:
+		BGR frames of the video
+
+    RAISES
+    ------
+    (ValueError) err:
+        If both samplings are asked, or if the video frame rate is needed
+        but unknown.
+    '''
+    if isinstance(intervals, dict):
+        intervals = intervals.get(os.path.splitext(os.path.basename(src))[0],
+                                  [])
+
+    with archive.source_path(src) as path: # extracted from an archive
+        cap = cv2.VideoCapture(path)
+        try:
+            stride, step, _ = _get_sampling(src, cap, stride, target_fps)
+            if seconds:
+                video_fps = cap.get(cv2.CAP_PROP_FPS)
+                if not video_fps > 0:
+                    raise ValueError(f'unknown frame rate of {src}')
+                intervals = [(round(first*video_fps), round(last*video_fps), 
+                              label) for first, last, label in intervals]
+            segments = _merge_intervals([(max(0, int(first)), int(last), 
+                                          str(label)) 
+                                         for first, last, label in intervals])
+        except Exception:
+            cap.release()
+            raise
+
+        count = 0 # next frame to read, use it to name frames
+        try:
+            for first, last, labels in segments:
+                for target in _sample_frames(first, last, stride, step):
+                    cap, count = _move_to_frame(cap, path, count, target,
+                                                seek_threshold)
+                    success, frame = cap.read()
+                    if not success or count < target:
+                        return # no more data
+                    yield labels, count, frame
+                    count += 1
+        finally:
+            cap.release()
+
+
+
+def tmnt_extract_frames_from_intervals(src, dstdir, intervals, fext="png",
+                                       seconds=False, stride=1, 
+                                       target_fps=None, crop=None, 
+                                       new_width=None, new_height=None, 
+                                       quality=None, png_compression=None):
+    '''
+    Extract frames of a video inside labelled intervals, into a 
+    subdirectory of "dstdir" named from the label of each interval (created 
+    if needed), in a single decoding pass. Frames can be cropped, resized 
+    and encoded as needed before being written.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(str) dstdir:
+		absolute path to the directory that should contain the frames
+
+	(list<tuple> or dict<str;list<tuple>>) intervals:
+		first (included), last (excluded) and label of each interval, or 
+            intervals for each video name (without extension, see 
+            "load_intervals_fromsheet")
+
+	(str) fext="png":
+		frame extension
+
+	(bool) seconds=False:
+		if True, intervals bounds are timestamps in seconds, else frame 
+            numbers
+
+	(int) stride=1:
+		keep one frame every "stride" frames
+
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+
+	(tuple<int;int;int;int>) crop=None:
+		if defined, x, y, width and height of the area kept from each frame
+
+	(int) new_width=None:
+		if defined, width of saved frames (aspect ratio kept if 
+            "new_height" is None)
+
+	(int) new_height=None:
+		if defined, height of saved frames (aspect ratio kept if 
+            "new_width" is None)
+
+	(int) quality=None:
+		if defined, JPEG or WebP quality of saved frames
+
+	(int) png_compression=None:
+		if defined, PNG compression level of saved frames (0 to 9)
+
+    RETURNS
+    -------
+    None
+    '''
+    _, vext = os.path.splitext(src)
+    vname = os.path.basename(src)[:-len(vext)]
+    params = _get_write_params(fext, quality, png_compression)
+
+    created = set()
+    for labels, count, frame in browse_frames_from_intervals(src, intervals, 
+                                            seconds, stride, target_fps):
+        frame = _transform_frame(frame, crop, new_width, new_height)
+        for label in labels:
+            if label not in created:
+                os.makedirs(os.path.join(dstdir, label), exist_ok=True)
+                created.add(label)
+            cv2.imwrite(os.path.join(dstdir, label, f"{vname}_{count}.{fext}"),
+                        frame, params)
+
+
+
+def _split_into_ranges(src, bound, extra_down, extra_up, start=0, end=None,
+                       seqlen=None, stride=1, target_fps=None, frames=None,
+                       timestamps=None, range_frames=RANGE_FRAMES):
+    '''
+    Split the browsing of a video into ranges of about "range_frames" kept
+    frames, without decoding anything. Each range is given as "start" and
+    "end" arguments, so treatments browsing a range keep the same frames
+    with the same status than a full browse. If "seqlen" is defined, ranges
+    are only cut between sequences, and each range also gets the number of
+    its first sequence.
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(int) bound:
+		frame number that switch the status from "before" to "after"
+
+	(int) extra_down:
+		how many frames to skip before the bound
+
+	(int) extra_up:
+		how many frames to skip after the bound
+
+	(int) start=0:
+		frame number to start browsing frames
+
+	(int) end=None:
+		frame number to end browsing frames (if None, go for the full duration)
+
+	(int) seqlen=None:
+		if defined, amount of frames per sequence
+
+	(int) stride=1:
+		keep one frame every "stride" frames
+
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+
+	(list<int> or dict<str;list<int>>) frames=None:
+		if defined, frame numbers to keep (for each video name)
+
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		if defined, timestamps to keep in seconds (for each video name)
+
+	(int) range_frames=RANGE_FRAMES:
+		minimum amount of kept frames per range (except the last one)
+
+    RETURNS
+    -------
+	(list<tuple<dict;int>>) tasks:
+		arguments overriding the treatment ones, and amount of kept frames
+            (the cost), for each range
+    '''
+    with archive.source_path(src) as path: # extracted from an archive
+        cap = cv2.VideoCapture(path)
+        try:
+            stride, step, frames = _get_sampling(src, cap, stride, target_fps,
+                                                 frames, timestamps)
+            ranges = _get_browsed_ranges(cap, bound, extra_down, extra_up, 
+                                         start, end)
+        finally:
+            cap.release()
+    if ranges[-1][2] == float('inf'): # unknown duration, browse it at once
+        return [({'start': start, 'end': end}, 0)]
+
+    tasks = []
+    cut, kept, sequences, first_sequence = start, 0, 0, 0
+    for _, first, last in ranges:
+        for i, count in enumerate(_sample_frames(first, last, stride, step,
+                                                 frames)):
+            if kept >= range_frames and (seqlen is None or i % seqlen == 0):
+                tasks.append(({'start': cut, 'end': count}, kept))
+                if seqlen is not None:
+                    tasks[-1][0]['first_sequence'] = first_sequence
+                cut, kept, first_sequence = count-1, 0, sequences
+            kept += 1
+            if seqlen is not None and i % seqlen == seqlen-1:
+                sequences += 1 # a sequence is complete
+
+    if kept == 0 and tasks: # nothing left, the previous range goes to the end
+        tasks[-1][0]['end'] = end
+    else:
+        tasks.append(({'start': cut, 'end': end}, kept))
+        if seqlen is not None:
+            tasks[-1][0]['first_sequence'] = first_sequence
+    return tasks
+
+
+
+def split_frames_into_ranges(src, bound, extra_down, extra_up, start=0,
+                             end=None, stride=1, target_fps=None, frames=None,
+                             timestamps=None, range_frames=RANGE_FRAMES,
+                             **kwargs):
+    '''
+    Splitter of "tmnt_extract_frames_for_binary_classification", so a long
+    video is processed by several workers, each one seeking to its own range
+    (see "DataHandler.process" and "multiprocess.split_into_range_tasks").
+    Use "functools.partial" to change "range_frames".
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(int) bound:
+		frame number that switch the status from "before" to "after"
+
+	(int) extra_down:
+		how many frames to skip before the bound
+
+	(int) extra_up:
+		how many frames to skip after the bound
+
+	(int) start=0:
+		frame number to start browsing frames
+
+	(int) end=None:
+		frame number to end browsing frames (if None, go for the full duration)
+
+	(int) stride=1:
+		keep one frame every "stride" frames
+
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+
+	(list<int> or dict<str;list<int>>) frames=None:
+		if defined, frame numbers to keep (for each video name)
+
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		if defined, timestamps to keep in seconds (for each video name)
+
+	(int) range_frames=RANGE_FRAMES:
+		minimum amount of kept frames per range (except the last one)
+
+	**kwargs: Other arguments of the treatment (ignored).
+
+    RETURNS
+    -------
+	(list<tuple<dict;int>>) tasks:
+		"start" and "end" arguments, and amount of kept frames (the cost),
+            for each range
+    '''
+    return _split_into_ranges(src, bound, extra_down, extra_up, start, end,
+                              None, stride, target_fps, frames, timestamps,
+                              range_frames)
+
+
+
+def split_sequences_into_ranges(src, bound, extra_down, extra_up, seqlen=6,
+                                start=0, end=None, stride=1, target_fps=None,
+                                frames=None, timestamps=None,
+                                range_frames=RANGE_FRAMES, **kwargs):
+    '''
+    Splitter of "tmnt_extract_sequences_for_binary_classification", ranges
+    are only cut between sequences and numbered so saved sequences are the
+    same than with a single worker (see "split_frames_into_ranges").
+
+    PARAMETERS
+    ----------
+	(str) src:
+		absolute path to the video
+
+	(int) bound:
+		frame number that switch the status from "before" to "after"
+
+	(int) extra_down:
+		how many frames to skip before the bound
+
+	(int) extra_up:
+		how many frames to skip after the bound
+
+	(int) seqlen=6:
+		amount of frames per sequence
+
+	(int) start=0:
+		frame number to start browsing frames
+
+	(int) end=None:
+		frame number to end browsing frames (if None, go for the full duration)
+
+	(int) stride=1:
+		keep one frame every "stride" frames
+
+	(float) target_fps=None:
+		if defined, amount of frames to keep per second of video
+
+	(list<int> or dict<str;list<int>>) frames=None:
+		if defined, frame numbers to keep (for each video name)
+
+	(list<float> or dict<str;list<float>>) timestamps=None:
+		if defined, timestamps to keep in seconds (for each video name)
+
+	(int) range_frames=RANGE_FRAMES:
+		minimum amount of kept frames per range (except the last one)
+
+	**kwargs: Other arguments of the treatment (ignored).
+
+    RETURNS
+    -------
+	(list<tuple<dict;int>>) tasks:
+		"start", "end" and "first_sequence" arguments, and amount of kept
+            frames (the cost), for each range
+    '''
+    return _split_into_ranges(src, bound, extra_down, extra_up, start, end,
+                              seqlen, stride, target_fps, frames, timestamps,
+                              range_frames)
\ No newline at end of file
@@ -0,0 +1,20 @@
+import os
+
+import numpy as np
+
+from acutils.handler import DataHandler
+
+
+
+def test_subsample_fraction_keeps_each_stratum(tmp_path):
+    for label, n in [('big', 100), ('small', 3)]:
+        os.mkdir(os.path.join(tmp_path, label))
+        for i in range(n):
+            open(os.path.join(tmp_path, label, f'{i}.txt'), 'w').close()
+    handler = DataHandler(str(tmp_path))
+    handler.load_labeled_data_fromdatapath()
+
+    assert handler.subsample(fraction=0.1) == 11
+    labels, counts = np.unique(handler.labels, return_counts=True)
+    assert list(labels) == ['big', 'small']
+    assert list(counts) == [10, 1]
@@ -0,0 +1,65 @@
+import os
+
+from acutils import file
+from acutils import multiprocess
+
+
+
+def make_files(dirpath, n=4):
+    srcdir = os.path.join(dirpath, 'src')
+    os.mkdir(srcdir)
+    srcs = []
+    for i in range(n):
+        srcs.append(os.path.join(srcdir, f'{i}.txt'))
+        with open(srcs[-1], 'w') as f:
+            f.write(str(i))
+    return srcs
+
+
+
+def tmnt_write_frame(src, dstdir, prefixed=False):
+    stem = os.path.splitext(os.path.basename(src))[0]
+    name = f'frame_{stem}.txt' if prefixed else f'{stem}_frame.txt'
+    with open(os.path.join(dstdir, name), 'w') as f:
+        f.write(stem)
+
+
+
+def test_parallel_jobs_run_after_a_speculative_one(tmp_path):
+    srcs = make_files(str(tmp_path))
+    spec_dstdir = os.path.join(str(tmp_path), 'speculative')
+    static_dstdir = os.path.join(str(tmp_path), 'static')
+    os.mkdir(spec_dstdir)
+    os.mkdir(static_dstdir)
+
+    multiprocess.run_speculative_processes_on_multiple_files(srcs, 
+        [spec_dstdir] * len(srcs), file.tmnt_copyfile_to_dir, allowed_cpus=2)
+    packed_srcs, packed_dstdirs = multiprocess.distribute(srcs, 
+                            [static_dstdir] * len(srcs), allowed_cpus=2)
+    multiprocess.run_processes_on_multiple_files(packed_srcs, packed_dstdirs, 
+                            file.tmnt_copyfile_to_dir, allowed_cpus=2)
+
+    expected = sorted(os.path.basename(src) for src in srcs)
+    assert sorted(os.listdir(spec_dstdir)) == expected
+    assert sorted(os.listdir(static_dstdir)) == expected
+
+
+
+def test_duplicates_outputs_are_named_after_the_duplicate(tmp_path):
+    srcs = make_files(str(tmp_path), n=2)
+    dstdir = os.path.join(str(tmp_path), 'dst')
+    os.mkdir(dstdir)
+
+    links = {srcs[0]: [(srcs[1], dstdir)]}
+    multiprocess._process_and_link_duplicates(srcs[0], dstdir, 
+        tmnt_write_frame, links, {})
+    assert sorted(os.listdir(dstdir)) == ['0_frame.txt', '1_frame.txt']
+    assert os.path.samefile(os.path.join(dstdir, '0_frame.txt'), 
+                            os.path.join(dstdir, '1_frame.txt'))
+
+    # Names not starting with the source name can't be derived
+    multiprocess._process_and_link_duplicates(srcs[0], dstdir, 
+        tmnt_write_frame, links, {}, prefixed=True)
+    assert sorted(os.listdir(dstdir))[2:] == ['frame_0.txt', 'frame_1.txt']
+    with open(os.path.join(dstdir, 'frame_1.txt')) as f:
+        assert f.read() == '1'
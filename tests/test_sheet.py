@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from acutils import sheet
+
+
+
+def test_cached_sheet_keeps_leading_zeros_of_str_ids(tmp_path):
+    sheetpath = os.path.join(tmp_path, 'ids.csv')
+    with open(sheetpath, 'w') as f:
+        f.write('id,label\n007,a\n042,b\n')
+    cache_dir = os.path.join(tmp_path, 'cache')
+    for _ in range(2): # parsed then cached, then loaded from the cache
+        df = sheet.read_df_from_any_avalaible_extensions(
+            sheetpath, columns=['id'], dtype={'id': str}, cache_dir=cache_dir)
+        assert list(df['id']) == ['007', '042']
+    df = sheet.read_df_from_any_avalaible_extensions(sheetpath, 
+                                                     cache_dir=cache_dir)
+    assert list(df['id']) == [7, 42]
+
+
+
+def test_extensions_are_mapped_in_a_single_pass():
+    df = pd.DataFrame({'file': ['a.tif', 'b.png', 'c.jpg', 'd', 'e.tar.gz', 
+                                'f.gz']})
+    df = sheet.map_extensions_of_cells_from_a_column(
+        df, {'tif': 'png', '.png': 'jpg', 'gz': 'zst', 'tar.gz': 'tgz'}, 
+        ['file'])
+    assert list(df['file']) == ['a.png', 'b.jpg', 'c.jpg', 'd', 'e.tgz', 
+                                'f.zst']
+
+
+
+def test_cache_only_parses_the_selected_columns(tmp_path):
+    sheetpath = os.path.join(tmp_path, 'wide.csv')
+    pd.DataFrame({f'col{i}': range(3) for i in range(10)}).to_csv(
+        sheetpath, index=False)
+    cache_dir = os.path.join(tmp_path, 'cache')
+    df = sheet.read_df_from_any_avalaible_extensions(
+        sheetpath, columns=['col3', 'col1'], cache_dir=cache_dir)
+    assert list(df.columns) == ['col3', 'col1']
+
+    (name,) = os.listdir(cache_dir)
+    path = os.path.join(cache_dir, name)
+    cached = (pd.read_parquet(path) if name.endswith('.parquet') 
+              else pd.read_pickle(path))
+    assert sorted(cached.columns) == ['col1', 'col3']
+
+    # Another selection is parsed again, the full sheet serves any selection
+    df = sheet.read_df_from_any_avalaible_extensions(sheetpath, 
+                                                     cache_dir=cache_dir)
+    assert df.shape == (3, 10)
+    assert len(os.listdir(cache_dir)) == 2
+    df = sheet.read_df_from_any_avalaible_extensions(
+        sheetpath, columns=['col7'], cache_dir=cache_dir)
+    assert list(df['col7']) == [0, 1, 2]
+    assert len(os.listdir(cache_dir)) == 2
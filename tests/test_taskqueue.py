@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import time
+
+from acutils import taskqueue
+
+
+
+def tmnt_fail_first_attempt(src, dstdir):
+    marker = os.path.join(os.path.dirname(src), 'attempted')
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        time.sleep(1.5) # the lease expires meanwhile
+        raise ValueError('first attempt')
+    with open(os.path.join(dstdir, os.path.basename(src)), 'w') as f:
+        f.write('done')
+
+
+
+def tmnt_fail(src, dstdir):
+    raise ValueError(src)
+
+
+
+def make_queue(dirpath, func, n=1):
+    srcs, dstdir = [], os.path.join(dirpath, 'dst')
+    os.mkdir(dstdir)
+    for i in range(n):
+        srcs.append(os.path.join(dirpath, f'{i}.txt'))
+        open(srcs[-1], 'w').close()
+    queuedir = os.path.join(dirpath, 'queue')
+    taskqueue.publish_tasks(queuedir, srcs, [dstdir]*n, func)
+    return queuedir, dstdir
+
+
+
+def test_failed_tasks_keep_their_traceback(tmp_path):
+    queuedir, _ = make_queue(str(tmp_path), tmnt_fail, n=2)
+    assert taskqueue.run_queue_worker(queuedir, poll_interval=0.05) == 2
+    status = taskqueue.get_queue_status(queuedir)
+    assert status == {'tasks': 0, 'leases': 0, 'done': 0, 'failed': 2}
+    failed = os.path.join(queuedir, 'failed')
+    for name in os.listdir(failed):
+        with open(os.path.join(failed, name)) as f:
+            assert 'ValueError' in f.read()
+
+
+
+def test_expired_attempt_does_not_report_its_failure(tmp_path):
+    queuedir, dstdir = make_queue(str(tmp_path), tmnt_fail_first_attempt)
+    context = multiprocessing.get_context('fork')
+    # The first worker renews its lease too rarely, the second one requeues 
+    # it, then processes the task again while the first attempt fails
+    first = context.Process(target=taskqueue.run_queue_worker, 
+                            args=(queuedir, 60., 0.05))
+    first.start()
+    while not os.path.exists(os.path.join(str(tmp_path), 'attempted')):
+        time.sleep(0.05)
+    second = context.Process(target=taskqueue.run_queue_worker, 
+                             args=(queuedir, 0.3, 0.05))
+    second.start()
+    first.join()
+    second.join()
+
+    status = taskqueue.wait_queue(queuedir, poll_interval=0.05, 
+                                  lease_timeout=0.3)
+    assert status == {'tasks': 0, 'leases': 0, 'done': 1, 'failed': 0}
+    assert os.listdir(dstdir) == ['0.txt']
+    assert not [name for name in os.listdir(queuedir) if name.startswith('.')]